@@ -0,0 +1,119 @@
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Tuple
+
+from backend.models.cache import stable_hash
+from backend.repo_cache import DATA_DIR, repo_key
+
+PITCHES_DIR = DATA_DIR / "pitches"
+# Set to 0 to always run every stage
+PITCH_CHECKPOINTS = os.getenv("PITCH_CHECKPOINTS", "1").lower() in ("1", "true", "yes")
+
+# One lock per document path, shared by every pipeline writing to it
+_locks: dict[Path, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def code_fingerprint(*functions: Callable) -> str:
+    """Hash of the source of `functions`, so editing a prompt invalidates its checkpoints."""
+    sources = []
+    for function in functions:
+        try:
+            sources.append(inspect.getsource(function))
+        except (OSError, TypeError):
+            sources.append(getattr(function, "__qualname__", repr(function)))
+    return stable_hash(sources)
+
+
+def _lookup(document: dict[str, Any], path: Tuple[str, ...]) -> Any | None:
+    value: Any = document
+    for part in path:
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _assign(document: dict[str, Any], path: Tuple[str, ...], value: Any) -> None:
+    section = document
+    for part in path[:-1]:
+        section = section.setdefault(part, {})
+    section[path[-1]] = value
+
+
+class PitchDocument:
+    """The pitch of one repository at one commit, stored as JSON.
+
+    Stage results live in the `schema.json` layout (`github_repo`,
+    `orchestrator_plan`, `technical_brief`, `market_research`). The
+    `checkpoints` section records which key produced each stage's result, so
+    a result is only reused for the same inputs and stage config. Also
+    usable as a `Pipeline` checkpoint store.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with _locks_guard:
+            self._lock = _locks.setdefault(path, threading.Lock())
+
+    @classmethod
+    def for_commit(cls, repo_url: str, commit: str, directory: Path = PITCHES_DIR) -> "PitchDocument":
+        """The document of `repo_url` at `commit`; earlier commits are its siblings."""
+        return cls(directory / repo_key(repo_url) / f"{commit}.json")
+
+    def read(self) -> dict[str, Any]:
+        """The whole document; empty if it does not exist or cannot be parsed."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                document = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable pitch document {self.path}: {str(e)}")
+            return {}
+        return document if isinstance(document, dict) else {}
+
+    def _write(self, document: dict[str, Any]) -> None:
+        os.makedirs(self.path.parent, exist_ok=True)
+        # Write next to the target and rename, so readers never see half a file
+        tmp_path = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(document, f, indent=2, default=str)
+            os.replace(tmp_path, self.path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def get(self, path: Tuple[str, ...]) -> Any | None:
+        return _lookup(self.read(), path)
+
+    def set(self, path: Tuple[str, ...], value: Any) -> None:
+        with self._lock:
+            document = self.read()
+            _assign(document, path, value)
+            self._write(document)
+
+    def load(self, stage: str, key: str) -> Any | None:
+        """The saved result of `stage` if it was produced under `key`."""
+        document = self.read()
+        checkpoint = document.get("checkpoints", {}).get(stage)
+        if not checkpoint or checkpoint.get("key") != key:
+            return None
+        return _lookup(document, tuple(checkpoint["path"]))
+
+    def save(self, stage: str, key: str, path: Tuple[str, ...], value: Any) -> None:
+        with self._lock:
+            document = self.read()
+            _assign(document, path, value)
+            document.setdefault("checkpoints", {})[stage] = {
+                "key": key,
+                "path": list(path),
+                "saved_at": time.time(),
+            }
+            self._write(document)
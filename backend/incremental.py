@@ -0,0 +1,132 @@
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple
+
+from backend.checkpoints import PitchDocument
+from backend.repo_index import RepoIndex
+
+# Set to 0 to always pitch from scratch
+INCREMENTAL_REPITCH = os.getenv("INCREMENTAL_REPITCH", "1").lower() in ("1", "true", "yes")
+# Above this share of changed files the layout may have moved enough that the
+# orchestrator should plan the branches again
+INCREMENTAL_MAX_CHANGED_FRACTION = float(os.getenv("INCREMENTAL_MAX_CHANGED_FRACTION", "0.3"))
+
+
+class PreviousPitch(NamedTuple):
+    commit: str
+    # Sub-agent reports of the previous pitch: its branches and their findings
+    sub_agents: List[Dict[str, Any]]
+    # Files added, removed or modified since, sorted
+    changed: List[str]
+    # Every file of either commit, sorted
+    known: List[str]
+    # Files added or modified since that none of its branches covers, sorted
+    uncovered: List[str]
+
+
+def file_manifest(index: RepoIndex) -> Dict[str, str]:
+    """`{path: content hash}` for every file of a checkout."""
+    return dict(zip(index.paths, index.hashes))
+
+
+def changed_paths(old: Dict[str, str], new: Dict[str, str]) -> set[str]:
+    """Paths added, removed or modified between two manifests."""
+    return {path for path in old.keys() | new.keys() if old.get(path) != new.get(path)}
+
+
+def _directories(paths: Iterable[str]) -> set[str]:
+    """Every directory containing one of `paths`, the root ("") included."""
+    directories = {""}
+    for path in paths:
+        parts = path.split("/")[:-1]
+        for i in range(1, len(parts) + 1):
+            directories.add("/".join(parts[:i]))
+    return directories
+
+
+def resolve_branch_path(file: str, known: set[str], directories: set[str]) -> str | None:
+    """The repo-relative file or directory an orchestrator path refers to.
+
+    Tolerates the leading slash and the repo-name prefix the orchestrator
+    copies from the tree, like the agents' reads do. None if it is neither
+    a known file nor a directory of one.
+    """
+    path = RepoIndex.normalize(file)
+    candidates = [path]
+    if "/" in path:
+        candidates.append(path.split("/", 1)[1])
+    for candidate in candidates:
+        if candidate in known or candidate in directories:
+            return candidate
+    return None
+
+
+def branch_touched(files: List[str], changed: set[str], known: set[str]) -> bool:
+    """Whether any change is one of `files`, or inside one of them if it is a directory.
+
+    A path that does not resolve to a file or directory of `known` counts as
+    touched, since there is no telling what it stood for.
+    """
+    directories = _directories(known)
+    for file in files:
+        path = resolve_branch_path(file, known, directories)
+        if path is None:
+            return True
+        if not path:
+            return bool(changed)
+        if path in changed or any(changed_path.startswith(path + "/") for changed_path in changed):
+            return True
+    return False
+
+
+def uncovered_changes(
+    sub_agents: List[Dict[str, Any]], changed: Iterable[str], manifest: Dict[str, str], known: set[str]
+) -> List[str]:
+    """Files of `changed` still in `manifest` (added or modified) that no branch covers."""
+    directories = _directories(known)
+    covered = {
+        resolve_branch_path(file, known, directories)
+        for agent in sub_agents
+        for file in agent.get("files", [])
+    } - {None}
+    if "" in covered:
+        return []
+    return [
+        path
+        for path in sorted(changed)
+        if path in manifest
+        and path not in covered
+        and not any(path.startswith(directory + "/") for directory in covered)
+    ]
+
+
+def find_previous_pitch(document: PitchDocument, manifest: Dict[str, str]) -> PreviousPitch | None:
+    """The most recent finished pitch of the same repository at another commit.
+
+    Returns None when there is none, or when too much changed since for its
+    branches to be worth reusing.
+    """
+    if not INCREMENTAL_REPITCH:
+        return None
+    candidates = [
+        path for path in document.path.parent.glob("*.json") if path != document.path
+    ]
+    for path in sorted(candidates, key=lambda path: path.stat().st_mtime, reverse=True):
+        previous = PitchDocument(path).read()
+        old_manifest = previous.get("github_repo", {}).get("files")
+        sub_agents = previous.get("orchestrator_plan", {}).get("sub_agents")
+        if not old_manifest or not sub_agents or not all("trace" in agent for agent in sub_agents):
+            continue
+
+        changed = changed_paths(old_manifest, manifest)
+        if len(changed) > INCREMENTAL_MAX_CHANGED_FRACTION * max(len(manifest), 1):
+            print(f"{len(changed)} files changed since {path.stem[:7]}, pitching from scratch")
+            return None
+        known = old_manifest.keys() | manifest.keys()
+        return PreviousPitch(
+            path.stem,
+            sub_agents,
+            sorted(changed),
+            sorted(known),
+            uncovered_changes(sub_agents, changed, manifest, known),
+        )
+    return None
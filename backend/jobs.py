@@ -0,0 +1,222 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+from backend.models.scheduler import NORMAL
+
+# Pitches run at the same time across all sessions; the rest wait in the queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Finished jobs are kept this long so a reconnecting user can still see the result
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "1800"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+@dataclass
+class JobEvent:
+    type: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+
+class Job:
+    """One pitch, shared by every session that asked for it.
+
+    Progress is published as `JobEvent`s. `events()` replays what already
+    happened and then follows the job live, so a session can subscribe (or
+    resubscribe after reconnecting) at any point.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        title: str,
+        runner: Callable[["Job"], Awaitable[Any]],
+        priority: int = NORMAL,
+        owner: str | None = None,
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.title = title
+        self.runner = runner
+        self.priority = priority
+        self.owner = owner
+        # The job runs in the submitter's context (its Chainlit session, its LLM priority)
+        self.context = contextvars.copy_context()
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.history: List[JobEvent] = []
+        self._subscribers: set[asyncio.Queue] = set()
+        self._finished = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def publish(self, type: str, **data: Any) -> None:
+        """Record an event and pass it to the subscribers. Call from the job's loop."""
+        event = JobEvent(type, data)
+        self.history.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def _finish(self, status: str, result: Any = None, error: BaseException | None = None) -> None:
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        if error is not None:
+            self.publish(FAILED, error=str(error))
+        else:
+            self.publish(SUCCEEDED)
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+        self._subscribers.clear()
+        self._finished.set()
+
+    async def events(self) -> AsyncIterator[JobEvent]:
+        """Every event of the job, past and future, until it finishes."""
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.history:
+            queue.put_nowait(event)
+        if self.done:
+            queue.put_nowait(None)
+        else:
+            self._subscribers.add(queue)
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            self._subscribers.discard(queue)
+
+    async def wait(self) -> Any:
+        """Wait for the job and return its result, raising its error if it failed."""
+        await self._finished.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def __str__(self) -> str:
+        return f"Job {self.id} ({self.title}, {self.status})"
+
+
+class JobManager:
+    """A bounded pool of workers running jobs from a priority queue.
+
+    Jobs with the same key that are queued or running are coalesced: a
+    second request for the same repository and commit subscribes to the
+    existing job instead of starting another one. Equal priorities run in
+    submission order.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, retention: float = JOB_RETENTION_SECONDS):
+        self.workers = max(1, workers)
+        self.retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, Job] = {}
+        self._sequence = itertools.count()
+        self._queue: asyncio.PriorityQueue | None = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _start(self) -> asyncio.PriorityQueue:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            # Workers start from an empty context; each job brings its own
+            self._tasks = [
+                asyncio.create_task(self._worker(), context=contextvars.Context())
+                for _ in range(self.workers)
+            ]
+        return self._queue
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.publish(RUNNING)
+        try:
+            result = await asyncio.create_task(job.runner(job), context=job.context)
+        except Exception as e:
+            print(f"{job} failed: {str(e)}")
+            job._finish(FAILED, error=e)
+        else:
+            job._finish(SUCCEEDED, result=result)
+        finally:
+            self._active.pop(job.key, None)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+    def submit(
+        self,
+        key: str,
+        title: str,
+        runner: Callable[[Job], Awaitable[Any]],
+        priority: int = NORMAL,
+        owner: str | None = None,
+    ) -> tuple[Job, bool]:
+        """Queue a job, or join the queued or running job with the same key.
+
+        Must be called from the event loop the workers should run on.
+
+        Returns:
+            tuple[Job, bool]: The job, and whether it was newly created
+        """
+        queue = self._start()
+        self._prune()
+
+        existing = self._active.get(key)
+        if existing is not None:
+            return existing, False
+
+        job = Job(key, title, runner, priority, owner)
+        self._jobs[job.id] = job
+        self._active[key] = job
+        queue.put_nowait((priority, next(self._sequence), job))
+        job.publish(QUEUED, ahead=len(self._active) - 1)
+        return job, True
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def jobs_for(self, owner: str) -> List[Job]:
+        """The owner's jobs that are still running or finished recently, newest first."""
+        self._prune()
+        jobs = [job for job in self._jobs.values() if job.owner == owner]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def queued_count(self) -> int:
+        return sum(1 for job in self._active.values() if job.status == QUEUED)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queued": self.queued_count(),
+            "running": sum(1 for job in self._active.values() if job.status == RUNNING),
+            "retained": len(self._jobs),
+        }
+
+
+pitch_jobs = JobManager()
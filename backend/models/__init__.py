@@ -3,9 +3,12 @@ from backend.models.llms import (
     llm_call_messages,
     llm_call_messages_async,
     llm_call_with_tools,
+    llm_call_with_tools_async,
     text_model,
     num_tokens_from_messages,
 )
+from backend.models.usage import usage_tracker
+from backend.models.scheduler import BACKGROUND, INTERACTIVE, NORMAL, llm_scheduler, priority
 from backend.models.agents import Agent, AgentConfig
 from backend.models.tools import Tool, tool_registry
 
@@ -14,8 +17,15 @@ __all__ = [
     "llm_call_messages",
     "llm_call_messages_async",
     "llm_call_with_tools",
+    "llm_call_with_tools_async",
     "text_model",
     "num_tokens_from_messages",
+    "usage_tracker",
+    "llm_scheduler",
+    "priority",
+    "INTERACTIVE",
+    "NORMAL",
+    "BACKGROUND",
     "Agent",
     "AgentConfig",
     "Tool",
@@ -4,7 +4,10 @@ from backend.models.llms import (
     llm_call_messages_async,
     text_model,
     llm_call_with_tools,
+    llm_call_with_tools_async,
+    TokenCallback,
 )
+from backend.models.context import TokenCounter, compact_messages
 from backend.models.tools import Tool, tool_registry
 import asyncio
 from pydantic import BaseModel
@@ -36,6 +39,7 @@ class Agent:
         self.tools: list[Tool] = tools
         self.data: list[str] = []
         self.description: str = description
+        self.token_counter = TokenCounter(model)
 
     @staticmethod
     def from_config(config: AgentConfig, model: str = text_model) -> "Agent":
@@ -77,32 +81,51 @@ class Agent:
         with open(file_name, "w") as f:
             f.write(config.model_dump_json(indent=2))
 
+    def add_user_message(self, prompt: str) -> None:
+        """Append a user turn, compacting old turns if the history is over budget."""
+        self.messages.append({"role": "user", "content": prompt})
+        compact_messages(self.messages, self.token_counter)
+
     def pass_context(self, context: str, role: str = "user") -> None:
         self.messages.append({"role": role, "content": context})
 
-    def call(self, prompt: str) -> str:
-        self.messages.append({"role": "user", "content": prompt})
-        response = llm_call_messages(self.messages, model=self.model)
+    def call(self, prompt: str, on_token: TokenCallback | None = None) -> str:
+        self.add_user_message(prompt)
+        response = llm_call_messages(self.messages, model=self.model, on_token=on_token)
         self.messages.append({"role": "assistant", "content": response})
         return str(response)
 
     def call_structured_output(self, prompt: str, schema: BaseModel) -> BaseModel:
-        self.messages.append({"role": "user", "content": prompt})
+        self.add_user_message(prompt)
         response = llm_call_messages(
             self.messages, response_format=schema, model=self.model
         )
         self.messages.append({"role": "assistant", "content": str(response)})
         return schema.model_validate(response)
 
-    def call_with_tools(self, prompt: str) -> str:
-        self.messages.append({"role": "user", "content": prompt})
-        response = llm_call_with_tools(self.messages, self.tools, model=self.model)
+    def call_with_tools(self, prompt: str, on_token: TokenCallback | None = None) -> str:
+        self.add_user_message(prompt)
+        response = llm_call_with_tools(
+            self.messages, self.tools, model=self.model, on_token=on_token
+        )
         self.messages.append({"role": "assistant", "content": response})
         return str(response)
 
-    async def call_async(self, prompt: str) -> str:
-        self.messages.append({"role": "user", "content": prompt})
-        response = await llm_call_messages_async(self.messages, model=self.model)
+    async def call_async(self, prompt: str, on_token: TokenCallback | None = None) -> str:
+        self.add_user_message(prompt)
+        response = await llm_call_messages_async(
+            self.messages, model=self.model, on_token=on_token
+        )
+        self.messages.append({"role": "assistant", "content": response})
+        return str(response)
+
+    async def call_with_tools_async(
+        self, prompt: str, on_token: TokenCallback | None = None
+    ) -> str:
+        self.add_user_message(prompt)
+        response = await llm_call_with_tools_async(
+            self.messages, self.tools, model=self.model, on_token=on_token
+        )
         self.messages.append({"role": "assistant", "content": response})
         return str(response)
 
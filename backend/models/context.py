@@ -0,0 +1,116 @@
+import functools
+import json
+import os
+from typing import Any
+import tiktoken
+
+# Prompt size (in tokens) above which old messages are compacted before a request
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "100000"))
+# The most recent messages are always sent verbatim
+CONTEXT_KEEP_RECENT_MESSAGES = int(os.getenv("CONTEXT_KEEP_RECENT_MESSAGES", "6"))
+# How much of an elided message is kept as a preview
+ELIDED_PREVIEW_CHARS = 300
+
+
+@functools.cache
+def get_encoding(model: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_message_tokens(message: dict[str, Any], encoding: tiktoken.Encoding) -> int:
+    """Tokens used by one message, including non-string fields such as `tool_calls`."""
+    num_tokens = 4
+    for key, value in message.items():
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = json.dumps(value, separators=(",", ":"), default=str)
+        num_tokens += len(encoding.encode(value, disallowed_special=()))
+        if key == "name":
+            num_tokens -= 1
+    return num_tokens
+
+
+class TokenCounter:
+    """Token counts per message, each computed once.
+
+    Messages are tracked by identity, so a message must be replaced (not
+    edited in place) for its count to change, which is what `compact_messages`
+    does.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.encoding = get_encoding(model)
+        self._counts: dict[int, tuple[dict[str, Any], int]] = {}
+
+    def count(self, message: dict[str, Any]) -> int:
+        entry = self._counts.get(id(message))
+        if entry is not None and entry[0] is message:
+            return entry[1]
+        tokens = count_message_tokens(message, self.encoding)
+        # Keeping a reference stops the id from being reused by another message
+        self._counts[id(message)] = (message, tokens)
+        return tokens
+
+    def total(self, messages: list[dict[str, Any]]) -> int:
+        return sum(self.count(message) for message in messages) + 2
+
+
+def _tool_names(messages: list[dict[str, Any]]) -> dict[str, str]:
+    names = {}
+    for message in messages:
+        for tool_call in message.get("tool_calls") or []:
+            names[tool_call.get("id")] = (tool_call.get("function") or {}).get("name", "tool")
+    return names
+
+
+def _elide(message: dict[str, Any], tool_name: str | None, tokens: int) -> dict[str, Any]:
+    content = message.get("content") or ""
+    preview = content[:ELIDED_PREVIEW_CHARS].rstrip()
+    label = f"{tool_name} output" if tool_name else "message"
+    return {
+        **message,
+        "content": f"[Earlier {label} elided to save context ({tokens} tokens). It began:]\n{preview}",
+    }
+
+
+def compact_messages(
+    messages: list[dict[str, Any]],
+    counter: TokenCounter,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    keep_recent: int = CONTEXT_KEEP_RECENT_MESSAGES,
+) -> int:
+    """Shrink `messages` in place until it fits in `budget` tokens.
+
+    Old tool outputs are elided first (oldest first), then other old
+    messages. The system prompt and the last `keep_recent` messages are never
+    touched, and tool calls keep their ids, so the history stays valid.
+
+    Returns:
+        int: The token count after compaction
+    """
+    total = counter.total(messages)
+    if total <= budget:
+        return total
+
+    first = 1 if messages and messages[0].get("role") == "system" else 0
+    last = max(first, len(messages) - keep_recent)
+    tool_names = _tool_names(messages)
+
+    for roles in (("tool",), ("user", "assistant")):
+        for i in range(first, last):
+            if total <= budget:
+                return total
+            message = messages[i]
+            content = message.get("content")
+            if message.get("role") not in roles or not isinstance(content, str):
+                continue
+            if len(content) <= ELIDED_PREVIEW_CHARS * 2:
+                continue
+            before = counter.count(message)
+            messages[i] = _elide(message, tool_names.get(message.get("tool_call_id")), before)
+            total += counter.count(messages[i]) - before
+    return total
@@ -1,25 +1,223 @@
+import asyncio
 import json
-from openai import OpenAI, AsyncOpenAI, ChatCompletion
+from openai import ChatCompletion
 from pydantic import BaseModel
-import tiktoken
-from typing import Any, List
-import os
+from typing import Any, Callable, List
 import dotenv
 from backend.models.tools import Tool
+from backend.models.cache import completion_cache, stable_hash
+from backend.models.context import TokenCounter, compact_messages, count_message_tokens, get_encoding
+from backend.models.scheduler import llm_scheduler
+from backend.models.streaming import CompletionAssembler
+from backend.models.structured import STRUCTURED_REPAIR_ATTEMPTS, StructuredCodec, get_codec
+from backend.models.transport import (
+    ProviderError,
+    client,
+    get_async_client,
+    with_retries,
+    with_retries_async,
+)
+from backend.models.usage import usage_tracker
 
 dotenv.load_dotenv()
 
 text_model = "anthropic/claude-3.7-sonnet"
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+# Request fields that identify a completion for caching purposes
+_CACHE_KEY_FIELDS = ("model", "messages", "tools", "response_format", "temperature")
 
-async_client = AsyncOpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+
+def _completion_cache_key(kwargs: dict[str, Any]) -> str:
+    return stable_hash({field: kwargs.get(field) for field in _CACHE_KEY_FIELDS})
+
+
+def _cacheable(response: ChatCompletion) -> bool:
+    return bool(response.choices) and getattr(response, "error", None) is None
+
+
+# Called with each text delta of a streamed completion
+TokenCallback = Callable[[str], None]
+
+_STREAM_KWARGS = {"stream": True, "stream_options": {"include_usage": True}}
+
+# Completion tokens assumed when a request sets no `max_tokens`
+_EXPECTED_COMPLETION_TOKENS = 1024
+
+
+def _estimate_tokens(kwargs: dict[str, Any]) -> int:
+    """A cheap (~4 characters per token) estimate of a request's total tokens,
+    used to reserve tokens-per-minute budget before the real usage is known."""
+    prompt = len(json.dumps(kwargs.get("messages"), default=str)) // 4
+    if kwargs.get("tools"):
+        prompt += len(json.dumps(kwargs["tools"], default=str)) // 4
+    return prompt + (kwargs.get("max_tokens") or _EXPECTED_COMPLETION_TOKENS)
+
+
+def _check_response(response: ChatCompletion) -> ChatCompletion:
+    error = getattr(response, "error", None)
+    if error is not None:
+        raise ProviderError(error)
+    return response
+
+
+def _request_completion(on_token: TokenCallback | None = None, **kwargs: Any) -> ChatCompletion:
+    """`client.chat.completions.create` with retries, streamed to `on_token` when given.
+
+    Each attempt waits for a slot from `llm_scheduler`. A stream is only
+    retried if it failed before producing any text, so tokens are never
+    shown twice.
+    """
+    streamed = False
+    tokens = _estimate_tokens(kwargs)
+
+    def request() -> ChatCompletion:
+        nonlocal streamed
+        if on_token is None:
+            return _check_response(client.chat.completions.create(**kwargs))
+        assembler = CompletionAssembler(kwargs["model"])
+        for chunk in client.chat.completions.create(**kwargs, **_STREAM_KWARGS):
+            _check_response(chunk)
+            token = assembler.add(chunk)
+            if token:
+                streamed = True
+                on_token(token)
+        return assembler.completion()
+
+    response = with_retries(
+        lambda: llm_scheduler.run(request, tokens), can_retry=lambda: not streamed
+    )
+    usage_tracker.record(kwargs["model"], response.usage)
+    return response
+
+
+async def _request_completion_async(
+    on_token: TokenCallback | None = None, **kwargs: Any
+) -> ChatCompletion:
+    """Async counterpart of `_request_completion`, using the loop's pooled client."""
+    streamed = False
+    tokens = _estimate_tokens(kwargs)
+    async_client = get_async_client()
+
+    async def request() -> ChatCompletion:
+        nonlocal streamed
+        if on_token is None:
+            return _check_response(await async_client.chat.completions.create(**kwargs))
+        assembler = CompletionAssembler(kwargs["model"])
+        async for chunk in await async_client.chat.completions.create(**kwargs, **_STREAM_KWARGS):
+            _check_response(chunk)
+            token = assembler.add(chunk)
+            if token:
+                streamed = True
+                on_token(token)
+        return assembler.completion()
+
+    response = await with_retries_async(
+        lambda: llm_scheduler.run_async(request, tokens), can_retry=lambda: not streamed
+    )
+    usage_tracker.record(kwargs["model"], response.usage)
+    return response
+
+
+def _from_cache(cached: str, model: str, on_token: TokenCallback | None) -> ChatCompletion:
+    response = ChatCompletion.model_validate_json(cached)
+    usage_tracker.record_cache_hit(model)
+    if on_token is not None and response.choices and response.choices[0].message.content:
+        on_token(response.choices[0].message.content)
+    return response
+
+
+def _create_completion(
+    use_cache: bool = True, on_token: TokenCallback | None = None, **kwargs: Any
+) -> ChatCompletion:
+    """`client.chat.completions.create`, served from `completion_cache` when possible."""
+    if completion_cache is None or not use_cache:
+        return _request_completion(on_token, **kwargs)
+
+    key = _completion_cache_key(kwargs)
+    cached = completion_cache.get(key)
+    if cached is not None:
+        return _from_cache(cached, kwargs["model"], on_token)
+
+    response = _request_completion(on_token, **kwargs)
+    if _cacheable(response):
+        completion_cache.set(key, response.model_dump_json())
+    return response
+
+
+async def _create_completion_async(
+    use_cache: bool = True, on_token: TokenCallback | None = None, **kwargs: Any
+) -> ChatCompletion:
+    """Async counterpart of `_create_completion`."""
+    if completion_cache is None or not use_cache:
+        return await _request_completion_async(on_token, **kwargs)
+
+    key = _completion_cache_key(kwargs)
+    cached = await asyncio.to_thread(completion_cache.get, key)
+    if cached is not None:
+        return _from_cache(cached, kwargs["model"], on_token)
+
+    response = await _request_completion_async(on_token, **kwargs)
+    if _cacheable(response):
+        await asyncio.to_thread(completion_cache.set, key, response.model_dump_json())
+    return response
+
+
+def _response_content(response: ChatCompletion) -> str:
+    if not response.choices or not response.choices[0].message.content:
+        raise ValueError(
+            "No valid response content received from the API", response
+        )
+    return response.choices[0].message.content
+
+
+def _structured_failure(codec: StructuredCodec, content: str, error: Exception) -> ValueError:
+    print("Failed to parse response:", codec.schema_json, content)
+    return ValueError(f"Failed to parse response: {error}")
+
+
+def _call_structured(
+    codec: StructuredCodec,
+    kwargs: dict[str, Any],
+    use_cache: bool = True,
+    on_token: TokenCallback | None = None,
+) -> BaseModel:
+    """Make a structured call, sending repair requests with the validation
+    errors (instead of rerunning the whole prompt) while the response is invalid."""
+    content = _response_content(_create_completion(use_cache, on_token, **kwargs))
+    for attempt in range(STRUCTURED_REPAIR_ATTEMPTS + 1):
+        try:
+            return codec.parse(content)
+        except ValueError as e:
+            if attempt == STRUCTURED_REPAIR_ATTEMPTS:
+                raise _structured_failure(codec, content, e)
+            print(
+                f"Invalid {codec.model.__name__} response, requesting a repair "
+                f"({attempt + 1}/{STRUCTURED_REPAIR_ATTEMPTS})"
+            )
+            repair = codec.repair_request(kwargs["model"], content, e)
+            content = _response_content(_create_completion(use_cache, **repair))
+
+
+async def _call_structured_async(
+    codec: StructuredCodec,
+    kwargs: dict[str, Any],
+    use_cache: bool = True,
+    on_token: TokenCallback | None = None,
+) -> BaseModel:
+    """Async version of `_call_structured`."""
+    content = _response_content(await _create_completion_async(use_cache, on_token, **kwargs))
+    for attempt in range(STRUCTURED_REPAIR_ATTEMPTS + 1):
+        try:
+            return codec.parse(content)
+        except ValueError as e:
+            if attempt == STRUCTURED_REPAIR_ATTEMPTS:
+                raise _structured_failure(codec, content, e)
+            print(
+                f"Invalid {codec.model.__name__} response, requesting a repair "
+                f"({attempt + 1}/{STRUCTURED_REPAIR_ATTEMPTS})"
+            )
+            repair = codec.repair_request(kwargs["model"], content, e)
+            content = _response_content(await _create_completion_async(use_cache, **repair))
 
 
 def llm_call(
@@ -27,6 +225,8 @@ def llm_call(
     system_prompt: str | None = None,
     response_format: BaseModel | None = None,
     model: str = text_model,
+    use_cache: bool = True,
+    on_token: TokenCallback | None = None,
 ) -> str | BaseModel:
     """
     Make a LLM call
@@ -36,6 +236,8 @@ def llm_call(
         `system_prompt` (`str`, optional): System-level instructions for the LLM. Defaults to None.
         `response_format` (`BaseModel`, optional): Pydantic model for structured responses. Defaults to None.
         `model` (`str`, optional): Model identifier to use. Defaults to "gpt-4o-mini".
+        `use_cache` (`bool`, optional): Set to False to bypass the completion cache. Defaults to True.
+        `on_token` (`Callable[[str], None]`, optional): Stream the response, calling this with each text delta (the raw JSON for structured responses, see `PartialStream`). Defaults to None.
 
     ### Returns:
         The LLM's response, either as raw text or as a parsed object according to `response_format`.
@@ -43,96 +245,9 @@ def llm_call(
     
 
     if response_format is not None:
-        schema = response_format.model_json_schema()
-        
-        # print("schema", schema)
-        def process_schema(schema_dict: dict[str, Any]) -> dict[str, Any]:
-            defs = schema.pop('$defs', {}) or schema.pop('definitions', {})
-            
-            def replace_refs(obj):
-                if isinstance(obj, dict):
-                    if 'title' in obj:
-                        del obj['title']
-                    if '$ref' in obj:
-                        ref_name = obj['$ref'].split('/')[-1]
-                        definition = defs.get(ref_name)
-                        if not definition:
-                            raise ValueError(f"Definition {ref_name} not found in $defs.")
-                        return replace_refs(definition)
-                    return {k: replace_refs(v) for k, v in obj.items()}
-                elif isinstance(obj, list):
-                    return [replace_refs(item) for item in obj]
-                else:
-                    return obj
-
-            expanded = replace_refs(schema)
-            return expanded
-
-        processed_schema = process_schema(schema)
-        if system_prompt is None:
-            system_prompt = (
-                "\n\n IMPORTANT: YOU MUST RETURN VALID JSON IN THE SPECIFIED FORMAT. Adhere exactly to the schema property names. Do not include any other text or formatting. Always make sure the names match the schema exactly."
-                + json.dumps(processed_schema)
-            )
-        else:
-            system_prompt += (
-                "\n\n IMPORTANT: YOU MUST RETURN VALID JSON IN THE SPECIFIED FORMAT. Adhere exactly to the schema property names. Do not include any other text or formatting. Always make sure the names match the schema exactly."
-                + json.dumps(processed_schema)
-            )
-
-        messages = [
-            {"role": "system", "content": system_prompt} if system_prompt else None,
-            {"role": "user", "content": prompt},
-        ]
-        messages = [msg for msg in messages if msg is not None]
-
-        kwargs: dict[str, Any] = {"model": model, "messages": messages}
-
-        response = client.chat.completions.create(**kwargs)
-
-        if not response.choices or not response.choices[0].message.content:
-            raise ValueError(
-                "No valid response content received from the API", response
-            )
-        try:
-            # First try direct parsing
-            return response_format.model_validate_json(
-                response.choices[0].message.content
-            )
-        except Exception as e:
-            # If direct parsing fails, try to extract JSON from the response
-            content = response.choices[0].message.content
-            try:
-                # Find the first { or [ character
-                json_start = content.find('{')
-                if json_start == -1:
-                    json_start = content.find('[')
-                if json_start == -1:
-                    raise ValueError("No JSON object or array found in response")
-                
-                # Find the matching closing bracket
-                json_str = content[json_start:]
-                bracket_count = 0
-                json_end = -1
-                
-                for i, char in enumerate(json_str):
-                    if char in '{[':
-                        bracket_count += 1
-                    elif char in '}]':
-                        bracket_count -= 1
-                        if bracket_count == 0:
-                            json_end = i + 1
-                            break
-                
-                if json_end == -1:
-                    raise ValueError("Invalid JSON structure")
-                
-                # Extract and parse the JSON
-                json_content = json_str[:json_end]
-                return response_format.model_validate_json(json_content)
-            except Exception as inner_e:
-                print("Failed to parse response:",processed_schema, content)
-                raise ValueError(f"Failed to parse response: {inner_e}")
+        codec = get_codec(response_format)
+        kwargs = codec.request(model, [{"role": "user", "content": prompt}], system_prompt)
+        return _call_structured(codec, kwargs, use_cache, on_token)
 
     messages = [
         {"role": "system", "content": system_prompt} if system_prompt else None,
@@ -142,13 +257,15 @@ def llm_call(
 
     kwargs: dict[str, Any] = {"model": model, "messages": messages}
 
-    return client.chat.completions.create(**kwargs).choices[0].message.content
+    return _create_completion(use_cache, on_token, **kwargs).choices[0].message.content
 
 
 def llm_call_messages(
     messages: list[dict[str, str]],
     response_format: BaseModel = None,
     model: str = text_model,
+    use_cache: bool = True,
+    on_token: TokenCallback | None = None,
 ) -> str | BaseModel:
     """
     Make a LLM call with a list of messages instead of a prompt + system prompt
@@ -157,130 +274,54 @@ def llm_call_messages(
         `messages` (`list[dict]`): The list of messages to send to the LLM.
         `response_format` (`BaseModel`, optional): Pydantic model for structured responses. Defaults to None.
         `model` (`str`, optional): Model identifier to use. Defaults to "quasar-alpha".
+        `use_cache` (`bool`, optional): Set to False to bypass the completion cache. Defaults to True.
+        `on_token` (`Callable[[str], None]`, optional): Stream the response, calling this with each text delta (the raw JSON for structured responses, see `PartialStream`). Defaults to None.
     """
     
 
     if response_format is not None:
-        schema = response_format.model_json_schema()
-        
-        # print("schema", schema)
-        def process_schema(schema_dict: dict[str, Any]) -> dict[str, Any]:
-            defs = schema.pop('$defs', {}) or schema.pop('definitions', {})
-            
-            def replace_refs(obj):
-                if isinstance(obj, dict):
-                    if 'title' in obj:
-                        del obj['title']
-                    if '$ref' in obj:
-                        ref_name = obj['$ref'].split('/')[-1]
-                        definition = defs.get(ref_name)
-                        if not definition:
-                            raise ValueError(f"Definition {ref_name} not found in $defs.")
-                        return replace_refs(definition)
-                    return {k: replace_refs(v) for k, v in obj.items()}
-                elif isinstance(obj, list):
-                    return [replace_refs(item) for item in obj]
-                else:
-                    return obj
-
-            expanded = replace_refs(schema)
-            return expanded
-
-        processed_schema = process_schema(schema)
-
-        messages[0]["content"] += (
-            "\n\n IMPORTANT: YOU MUST RETURN VALID JSON IN THE SPECIFIED FORMAT. Adhere exactly to the schema property names. Do not include any other text or formatting. Always make sure the names match the schema exactly."
-            + json.dumps(processed_schema)
-        )
-
-        kwargs: dict[str, Any] = {"model": model, "messages": messages}
-
-
-        response = client.chat.completions.create(**kwargs)
-
-        if not response.choices or not response.choices[0].message.content:
-            raise ValueError(
-                "No valid response content received from the API", response
-            )
-        try:
-            # First try direct parsing
-            return response_format.model_validate_json(
-                response.choices[0].message.content
-            )
-        except Exception as e:
-            # If direct parsing fails, try to extract JSON from the response
-            content = response.choices[0].message.content
-            try:
-                # Find the first { or [ character
-                json_start = content.find('{')
-                if json_start == -1:
-                    json_start = content.find('[')
-                if json_start == -1:
-                    raise ValueError("No JSON object or array found in response")
-                
-                # Find the matching closing bracket
-                json_str = content[json_start:]
-                bracket_count = 0
-                json_end = -1
-                
-                for i, char in enumerate(json_str):
-                    if char in '{[':
-                        bracket_count += 1
-                    elif char in '}]':
-                        bracket_count -= 1
-                        if bracket_count == 0:
-                            json_end = i + 1
-                            break
-                
-                if json_end == -1:
-                    raise ValueError("Invalid JSON structure")
-                
-                # Extract and parse the JSON
-                json_content = json_str[:json_end]
-                return response_format.model_validate_json(json_content)
-            except Exception as inner_e:
-                print("Failed to parse response:",processed_schema, content)
-                raise ValueError(f"Failed to parse response: {inner_e}")
-
+        codec = get_codec(response_format)
+        return _call_structured(codec, codec.request(model, messages), use_cache, on_token)
 
     kwargs: dict[str, Any] = {"model": model, "messages": messages}
 
-    return client.chat.completions.create(**kwargs).choices[0].message.content
+    return _create_completion(use_cache, on_token, **kwargs).choices[0].message.content
 
 
 def _llm_call_tools(
-    msgs: list[dict[str, str]], tools: list[Tool], model: str = text_model
+    msgs: list[dict[str, str]],
+    tools: list[Tool],
+    model: str = text_model,
+    use_cache: bool = True,
+    on_token: TokenCallback | None = None,
 ) -> Any:
     """
     Simple LLM call with tools. No structured response.
+
+    Transport errors are retried by `_create_completion` when they are
+    retryable and raised unchanged (e.g. `openai.RateLimitError`,
+    `ProviderError`) otherwise.
     """
-    try:
-        # Ensure we have at least one message
-        if not msgs:
-            raise ValueError("At least one message is required")
-            
-        resp = client.chat.completions.create(
-            model=model, tools=[tool.to_openai_tool() for tool in tools], messages=msgs
-        )
-        
-        # Check if the response contains an error
-        if hasattr(resp, 'error') and resp.error is not None:
-            raise ValueError(f"API returned an error: {resp.error}")
-            
-        # Check if choices exists and is not empty
-        if not resp.choices or len(resp.choices) == 0:
-            raise ValueError("API response contains no choices")
-            
-        # Add the response message to the messages list
-        msgs.append(resp.choices[0].message.model_dump())
-        
-        return resp
-    except Exception as e:
-        # Provide a more detailed error message
-        error_msg = f"Error in LLM call: {str(e)}"
-        if 'resp' in locals():
-            error_msg += f"\nResponse: {resp}"
-        raise ValueError(error_msg)
+    # Ensure we have at least one message
+    if not msgs:
+        raise ValueError("At least one message is required")
+
+    resp = _create_completion(
+        use_cache,
+        on_token,
+        model=model,
+        tools=[tool.to_openai_tool() for tool in tools],
+        messages=msgs,
+    )
+
+    # Check if choices exists and is not empty
+    if not resp.choices:
+        raise ValueError(f"API response contains no choices\nResponse: {resp}")
+
+    # Add the response message to the messages list
+    msgs.append(resp.choices[0].message.model_dump())
+
+    return resp
 
 
 def _get_tool_responses(resp, tools):
@@ -341,7 +382,11 @@ def _get_tool_responses(resp, tools):
 
 
 def llm_call_with_tools(
-    messages: list[dict[str, str]], tools: list[Tool], model: str = text_model
+    messages: list[dict[str, str]],
+    tools: list[Tool],
+    model: str = text_model,
+    use_cache: bool = True,
+    on_token: TokenCallback | None = None,
 ) -> str:
     """
     Make LLM calls with tools, handling tool responses until a final text response is received.
@@ -350,6 +395,8 @@ def llm_call_with_tools(
         messages: List of message dictionaries
         tools: List of Tool objects to make available to the LLM
         model: Model identifier to use
+        use_cache: Set to False to bypass the completion cache
+        on_token: Stream each turn's text to this callback as it is generated
         
     Returns:
         The final text response from the LLM
@@ -358,11 +405,14 @@ def llm_call_with_tools(
     if not messages:
         raise ValueError("Cannot make LLM call with empty messages list")
         
-    # Make a copy of messages to avoid modifying the original
-    messages_copy = messages.copy()
-    
+    # Work on a copy so the caller's list is not modified. Compaction replaces
+    # old messages in this copy, so each turn only counts the new ones.
+    messages_copy = list(messages)
+    counter = TokenCounter(model)
+
     while True:
-        resp = _llm_call_tools(messages_copy, tools, model)
+        compact_messages(messages_copy, counter)
+        resp = _llm_call_tools(messages_copy, tools, model, use_cache, on_token)
         
         # Check if the response has tool calls
         if resp.choices and resp.choices[0].message.tool_calls:
@@ -384,10 +434,135 @@ def llm_call_with_tools(
         raise ValueError("No response was generated from the LLM")
 
 
+async def _llm_call_tools_async(
+    msgs: list[dict[str, str]],
+    tools: list[Tool],
+    model: str = text_model,
+    use_cache: bool = True,
+    on_token: TokenCallback | None = None,
+) -> Any:
+    """
+    Async version of `_llm_call_tools`.
+    """
+    if not msgs:
+        raise ValueError("At least one message is required")
+
+    resp = await _create_completion_async(
+        use_cache,
+        on_token,
+        model=model,
+        tools=[tool.to_openai_tool() for tool in tools],
+        messages=msgs,
+    )
+
+    if not resp.choices:
+        raise ValueError(f"API response contains no choices\nResponse: {resp}")
+
+    msgs.append(resp.choices[0].message.model_dump())
+
+    return resp
+
+
+async def _get_tool_response_async(tool_call, tools: list[Tool]) -> dict[str, str]:
+    """Execute a single tool call and return its tool response message."""
+    try:
+        tool_args = json.loads(tool_call.function.arguments)
+        tool_name = tool_call.function.name
+
+        matching_tool = next((tool for tool in tools if tool.name == tool_name), None)
+        if matching_tool is None:
+            return {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": f"Error: Tool '{tool_name}' not found.",
+            }
+
+        tool_response = await matching_tool.acall(**tool_args)
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": str(tool_response),
+        }
+    except json.JSONDecodeError as e:
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": f"Error: Invalid JSON in tool arguments: {str(e)}. Raw arguments: {tool_call.function.arguments}",
+        }
+    except Exception as e:
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": f"Error executing tool: {str(e)}",
+        }
+
+
+async def _get_tool_responses_async(resp, tools: list[Tool]) -> list[dict[str, str]]:
+    """Run every tool call of one assistant turn concurrently, keeping call order."""
+    tool_calls = resp.choices[0].message.tool_calls
+
+    if not tool_calls:
+        return []
+
+    return list(
+        await asyncio.gather(
+            *[_get_tool_response_async(tool_call, tools) for tool_call in tool_calls]
+        )
+    )
+
+
+async def llm_call_with_tools_async(
+    messages: list[dict[str, str]],
+    tools: list[Tool],
+    model: str = text_model,
+    use_cache: bool = True,
+    on_token: TokenCallback | None = None,
+) -> str:
+    """
+    Async version of `llm_call_with_tools`. All tool calls requested in a single
+    response are executed concurrently.
+
+    Args:
+        messages: List of message dictionaries
+        tools: List of Tool objects to make available to the LLM
+        model: Model identifier to use
+        use_cache: Set to False to bypass the completion cache
+        on_token: Stream each turn's text to this callback as it is generated
+
+    Returns:
+        The final text response from the LLM
+    """
+    if not messages:
+        raise ValueError("Cannot make LLM call with empty messages list")
+
+    messages_copy = list(messages)
+    counter = TokenCounter(model)
+
+    while True:
+        compact_messages(messages_copy, counter)
+        resp = await _llm_call_tools_async(messages_copy, tools, model, use_cache, on_token)
+
+        if resp.choices and resp.choices[0].message.tool_calls:
+            tool_responses = await _get_tool_responses_async(resp, tools)
+            if tool_responses:
+                messages_copy.extend(tool_responses)
+            else:
+                break
+        else:
+            break
+
+    if messages_copy and len(messages_copy) > len(messages):
+        return messages_copy[-1]["content"]
+    else:
+        raise ValueError("No response was generated from the LLM")
+
+
 async def llm_call_messages_async(
     messages: list[dict[str, str]],
     response_format: BaseModel = None,
     model: str = text_model,
+    use_cache: bool = True,
+    on_token: TokenCallback | None = None,
 ) -> str | BaseModel:
     """
     Make a LLM call with a list of messages instead of a prompt + system prompt
@@ -396,33 +571,18 @@ async def llm_call_messages_async(
         `messages` (`list[dict]`): The list of messages to send to the LLM.
         `response_format` (`BaseModel`, optional): Pydantic model for structured responses. Defaults to None.
         `model` (`str`, optional): Model identifier to use. Defaults to "quasar-alpha".
+        `use_cache` (`bool`, optional): Set to False to bypass the completion cache. Defaults to True.
+        `on_token` (`Callable[[str], None]`, optional): Stream the response, calling this with each text delta (the raw JSON for structured responses, see `PartialStream`). Defaults to None.
     """
-    kwargs: dict[str, Any] = {"model": model, "messages": messages}
-
     if response_format is not None:
-        schema = response_format.schema()
-        kwargs["response_format"] = {
-            "type": "json_schema",
-            "json_schema": {
-                "name": response_format.__name__,
-                "strict": True,
-                "schema": {
-                    "type": "object",
-                    "properties": schema["properties"],
-                    "required": schema["required"],
-                    "additionalProperties": False,
-                },
-            },
-        }
+        codec = get_codec(response_format)
+        return await _call_structured_async(
+            codec, codec.request(model, messages), use_cache, on_token
+        )
 
-        response = await async_client.chat.completions.create(**kwargs)
-        try:
-            return response_format.parse_raw(response.choices[0].message.content)
-        except Exception as e:
-            print("Failed to parse response:", response)
-            raise ValueError(f"Failed to parse response: {e}")
+    kwargs: dict[str, Any] = {"model": model, "messages": messages}
 
-    response = await async_client.chat.completions.create(**kwargs)
+    response = await _create_completion_async(use_cache, on_token, **kwargs)
     try:
         return response.choices[0].message.content
     except Exception as e:
@@ -431,23 +591,11 @@ async def llm_call_messages_async(
 
 
 def num_tokens_from_messages(
-    messages: list[dict[str, str]], model: str = text_model
+    messages: list[dict[str, Any]], model: str = text_model
 ) -> int:
     """Returns the number of tokens used by a list of messages."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        encoding = tiktoken.get_encoding("o200k_base")
-
-    num_tokens = 0
-    for message in messages:
-        num_tokens += 4
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += -1
-    num_tokens += 2
-    return num_tokens
+    encoding = get_encoding(model)
+    return sum(count_message_tokens(message, encoding) for message in messages) + 2
 
 
 if __name__ == "__main__":
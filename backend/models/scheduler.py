@@ -0,0 +1,286 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+
+import openai
+
+from backend.models.usage import percentile
+
+T = TypeVar("T")
+
+# Priorities: lower runs first
+INTERACTIVE = 0  # a user is waiting on this (e.g. the technical brief)
+NORMAL = 1
+BACKGROUND = 2  # speculative or batch work
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BACKGROUND: "background"}
+
+# Concurrency limits for LLM requests across the whole process
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+LLM_INITIAL_IN_FLIGHT = int(os.getenv("LLM_INITIAL_IN_FLIGHT", "8"))
+# 0 disables the tokens-per-minute limit
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# The in-flight cap only grows while requests finish faster than this
+LLM_LATENCY_TARGET_SECONDS = float(os.getenv("LLM_LATENCY_TARGET_SECONDS", "60"))
+# A request waiting this long moves up one priority level
+LLM_PRIORITY_AGING_SECONDS = float(os.getenv("LLM_PRIORITY_AGING_SECONDS", "30"))
+# At most one decrease per window, so a burst of 429s only halves the cap once
+_DECREASE_COOLDOWN_SECONDS = 5.0
+_TOKEN_WINDOW_SECONDS = 60.0
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=NORMAL)
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Run the LLM requests made in this block (and in threads or tasks it
+    starts with a copied context) at `level`."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def _is_rate_limit(error: BaseException) -> bool:
+    if isinstance(error, openai.RateLimitError):
+        return True
+    return getattr(error, "status_code", None) == 429
+
+
+class _Waiter:
+    __slots__ = ("priority", "sequence", "tokens", "enqueued", "future")
+
+    def __init__(self, priority: int, sequence: int, tokens: int) -> None:
+        self.priority = priority
+        self.sequence = sequence
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.future: Future = Future()
+
+    def rank(self, now: float) -> tuple[float, int]:
+        aged = self.priority - (now - self.enqueued) / LLM_PRIORITY_AGING_SECONDS
+        return (aged, self.sequence)
+
+
+class Ticket:
+    """Permission to run one request; return it with `LLMScheduler.release`."""
+
+    __slots__ = ("priority", "tokens", "started")
+
+    def __init__(self, priority: int, tokens: int) -> None:
+        self.priority = priority
+        self.tokens = tokens
+        self.started = time.monotonic()
+
+
+class LLMScheduler:
+    """Process-wide admission control for LLM requests.
+
+    Requests from every session, thread and event loop queue here. They are
+    admitted by priority (with aging, so background work is not starved)
+    while the in-flight count is under an adaptive cap and, optionally, the
+    tokens of the last minute are under a budget. The cap follows AIMD: it
+    grows by about one per round of fast successful requests and halves on a
+    rate limit.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        initial_in_flight: int = LLM_INITIAL_IN_FLIGHT,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+    ) -> None:
+        self.max_in_flight = max(1, max_in_flight)
+        self.cap = float(min(max(1, initial_in_flight), self.max_in_flight))
+        self.tokens_per_minute = tokens_per_minute
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._token_window: deque[tuple[float, int]] = deque()
+        self._reserved_tokens = 0
+        self._last_decrease = float("-inf")
+        self._timer: threading.Timer | None = None
+        # Metrics
+        self._wait_times: dict[int, deque[float]] = {level: deque(maxlen=500) for level in PRIORITY_NAMES}
+        self.completed = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.latency_ewma: float | None = None
+
+    # Token budget
+
+    def _window_tokens(self, now: float) -> int:
+        while self._token_window and now - self._token_window[0][0] > _TOKEN_WINDOW_SECONDS:
+            self._token_window.popleft()
+        return sum(tokens for _, tokens in self._token_window) + self._reserved_tokens
+
+    def _fits_budget(self, tokens: int, now: float) -> bool:
+        if not self.tokens_per_minute:
+            return True
+        used = self._window_tokens(now)
+        # An idle window always admits one request, however large
+        return used == 0 or used + tokens <= self.tokens_per_minute
+
+    def _budget_frees_in(self, now: float) -> float:
+        if not self._token_window:
+            return 1.0
+        return max(0.05, _TOKEN_WINDOW_SECONDS - (now - self._token_window[0][0]))
+
+    # Admission
+
+    def _dispatch(self) -> None:
+        """Admit waiters while there is room. Caller holds the lock."""
+        while self._waiters and self.in_flight < int(self.cap):
+            now = time.monotonic()
+            waiter = min(self._waiters, key=lambda w: w.rank(now))
+            if not self._fits_budget(waiter.tokens, now):
+                self._schedule_retry(self._budget_frees_in(now))
+                return
+            self._waiters.remove(waiter)
+            if not waiter.future.set_running_or_notify_cancel():
+                continue
+            self.in_flight += 1
+            self._reserved_tokens += waiter.tokens
+            self._wait_times[waiter.priority].append(now - waiter.enqueued)
+            waiter.future.set_result(Ticket(waiter.priority, waiter.tokens))
+
+    def _schedule_retry(self, delay: float) -> None:
+        if self._timer is not None and self._timer.is_alive():
+            return
+
+        def retry() -> None:
+            with self._lock:
+                self._timer = None
+                self._dispatch()
+
+        self._timer = threading.Timer(delay, retry)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _enqueue(self, tokens: int, level: int | None) -> Future:
+        level = current_priority() if level is None else level
+        # Levels outside the known ones run as the nearest known level
+        level = min(max(level, INTERACTIVE), BACKGROUND)
+        waiter = _Waiter(level, next(self._sequence), tokens)
+        with self._lock:
+            self._waiters.append(waiter)
+            self._dispatch()
+        return waiter.future
+
+    def acquire(self, tokens: int = 0, level: int | None = None) -> Ticket:
+        """Block until a request of about `tokens` tokens may start."""
+        return self._enqueue(tokens, level).result()
+
+    async def acquire_async(self, tokens: int = 0, level: int | None = None) -> Ticket:
+        """Wait (without blocking the loop) until a request may start."""
+        future = self._enqueue(tokens, level)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Admitted just as we were cancelled: hand the slot back
+            if future.done() and not future.cancelled():
+                self.release(future.result(), error=asyncio.CancelledError())
+            raise
+
+    def release(
+        self,
+        ticket: Ticket,
+        tokens: int | None = None,
+        error: BaseException | None = None,
+    ) -> None:
+        """Return a slot, recording the outcome to adapt the cap.
+
+        `tokens` is the request's actual usage, when known.
+        """
+        now = time.monotonic()
+        latency = now - ticket.started
+        with self._lock:
+            self.in_flight -= 1
+            self._reserved_tokens -= ticket.tokens
+            self._token_window.append((now, ticket.tokens if tokens is None else tokens))
+
+            if error is None:
+                self.completed += 1
+                self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+                if latency <= LLM_LATENCY_TARGET_SECONDS:
+                    self.cap = min(self.max_in_flight, self.cap + 1 / self.cap)
+            elif not isinstance(error, asyncio.CancelledError):
+                self.failed += 1
+                if _is_rate_limit(error):
+                    self.rate_limited += 1
+                    if now - self._last_decrease >= _DECREASE_COOLDOWN_SECONDS:
+                        self.cap = max(1.0, self.cap / 2)
+                        self._last_decrease = now
+            self._dispatch()
+
+    # Running requests
+
+    @staticmethod
+    def _usage_tokens(result: Any) -> int | None:
+        usage = getattr(result, "usage", None)
+        return getattr(usage, "total_tokens", None) if usage is not None else None
+
+    def run(self, request: Callable[[], T], tokens: int = 0, level: int | None = None) -> T:
+        ticket = self.acquire(tokens, level)
+        try:
+            result = request()
+        except BaseException as e:
+            self.release(ticket, error=e)
+            raise
+        self.release(ticket, tokens=self._usage_tokens(result))
+        return result
+
+    async def run_async(
+        self, request: Callable[[], Awaitable[T]], tokens: int = 0, level: int | None = None
+    ) -> T:
+        ticket = await self.acquire_async(tokens, level)
+        try:
+            result = await request()
+        except BaseException as e:
+            self.release(ticket, error=e)
+            raise
+        self.release(ticket, tokens=self._usage_tokens(result))
+        return result
+
+    # Metrics
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for waiter in self._waiters:
+                depth[PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))] += 1
+            waits = {level: sorted(times) for level, times in self._wait_times.items()}
+            stats = {
+                "cap": round(self.cap, 2),
+                "in_flight": self.in_flight,
+                "queue_depth": sum(depth.values()),
+                "queue_depth_by_priority": depth,
+                "tokens_last_minute": self._window_tokens(now),
+                "completed": self.completed,
+                "failed": self.failed,
+                "rate_limited": self.rate_limited,
+                "latency_ewma_seconds": self.latency_ewma,
+            }
+
+        stats["wait_seconds"] = {
+            PRIORITY_NAMES[level]: {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+            for level, values in waits.items()
+        }
+        return stats
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,85 @@
+import time
+from typing import Any
+from openai import ChatCompletion
+
+# finish_reason values accepted by `ChatCompletion`; providers behind OpenRouter
+# occasionally send others
+_FINISH_REASONS = {"stop", "length", "tool_calls", "content_filter", "function_call"}
+
+
+class CompletionAssembler:
+    """Rebuild a `ChatCompletion` from streamed chunks.
+
+    Text deltas are concatenated, tool-call deltas are merged by their index
+    (the id and name usually arrive once, the arguments in pieces), and the
+    usage sent in the final chunk (`stream_options={"include_usage": True}`)
+    is kept.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.id: str | None = None
+        self.created: int | None = None
+        self.content: list[str] = []
+        self.tool_calls: dict[int, dict[str, Any]] = {}
+        self.finish_reason: str | None = None
+        self.usage: Any | None = None
+
+    def add(self, chunk: Any) -> str:
+        """Merge one chunk. Returns its text delta (possibly empty)."""
+        self.id = self.id or chunk.id
+        self.created = self.created or chunk.created
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return ""
+
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        delta = choice.delta
+        if delta is None:
+            return ""
+
+        for tool_call in delta.tool_calls or []:
+            index = tool_call.index if tool_call.index is not None else len(self.tool_calls)
+            entry = self.tool_calls.setdefault(index, {"id": None, "name": "", "arguments": ""})
+            if tool_call.id:
+                entry["id"] = tool_call.id
+            if tool_call.function is not None:
+                if tool_call.function.name:
+                    entry["name"] += tool_call.function.name
+                if tool_call.function.arguments:
+                    entry["arguments"] += tool_call.function.arguments
+
+        if delta.content:
+            self.content.append(delta.content)
+            return delta.content
+        return ""
+
+    def completion(self) -> ChatCompletion:
+        message: dict[str, Any] = {"role": "assistant", "content": "".join(self.content) or None}
+        if self.tool_calls:
+            message["tool_calls"] = [
+                {
+                    "id": entry["id"] or f"call_{index}",
+                    "type": "function",
+                    "function": {"name": entry["name"], "arguments": entry["arguments"] or "{}"},
+                }
+                for index, entry in sorted(self.tool_calls.items())
+            ]
+
+        finish_reason = self.finish_reason
+        if finish_reason not in _FINISH_REASONS:
+            finish_reason = "tool_calls" if self.tool_calls else "stop"
+
+        return ChatCompletion.model_validate(
+            {
+                "id": self.id or "stream",
+                "object": "chat.completion",
+                "created": self.created or int(time.time()),
+                "model": self.model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": self.usage.model_dump() if self.usage is not None else None,
+            }
+        )
@@ -0,0 +1,458 @@
+import functools
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Type
+from pydantic import BaseModel, ValidationError
+
+STRUCTURED_OUTPUT_INSTRUCTIONS = (
+    "\n\n IMPORTANT: YOU MUST RETURN VALID JSON IN THE SPECIFIED FORMAT. Adhere exactly to the "
+    "schema property names. Do not include any other text or formatting. Always make sure the "
+    "names match the schema exactly."
+)
+
+# Whether a model honours `response_format={"type": "json_schema"}` through
+# OpenRouter, by model-id prefix (the longest matching prefix wins). Models not
+# listed fall back to schema instructions in the prompt.
+JSON_SCHEMA_SUPPORT: dict[str, bool] = {
+    "openai/": True,
+    "openai/gpt-3.5": False,
+    "google/gemini": True,
+    "mistralai/": True,
+    "deepseek/": True,
+    "anthropic/": False,
+}
+
+# Extra `model=true|false` entries, e.g. STRUCTURED_OUTPUT_MODELS="anthropic/claude-sonnet-4=true"
+for _entry in filter(None, os.getenv("STRUCTURED_OUTPUT_MODELS", "").split(",")):
+    _prefix, _, _value = _entry.partition("=")
+    JSON_SCHEMA_SUPPORT[_prefix.strip()] = _value.strip().lower() in ("", "1", "true", "yes")
+
+# Follow-up requests made to fix a response that fails validation
+STRUCTURED_REPAIR_ATTEMPTS = int(os.getenv("STRUCTURED_REPAIR_ATTEMPTS", "2"))
+# Minimum time between partial snapshots of a streamed structured response
+PARTIAL_UPDATE_INTERVAL_SECONDS = float(os.getenv("PARTIAL_UPDATE_INTERVAL_SECONDS", "0.5"))
+
+
+def supports_json_schema(model: str) -> bool:
+    matches = [prefix for prefix in JSON_SCHEMA_SUPPORT if model.startswith(prefix)]
+    return JSON_SCHEMA_SUPPORT[max(matches, key=len)] if matches else False
+
+
+def format_errors(error: Exception) -> str:
+    """Describe why a response failed to parse, one problem per line."""
+    if isinstance(error, ValidationError):
+        return "\n".join(
+            f"- {'.'.join(str(part) for part in e['loc']) or '(root)'}: {e['msg']}"
+            for e in error.errors()
+        )
+    return f"- {str(error)}"
+
+
+def strict_schema(schema: Any) -> tuple[Any, bool]:
+    """Add `additionalProperties: false` to every object, as strict mode requires.
+
+    Returns the schema and whether it qualifies for strict mode (every
+    property required).
+    """
+    strict = True
+
+    def visit(obj: Any) -> Any:
+        nonlocal strict
+        if isinstance(obj, list):
+            return [visit(item) for item in obj]
+        if not isinstance(obj, dict):
+            return obj
+        result = {k: visit(v) for k, v in obj.items()}
+        if result.get("type") == "object" and "properties" in result:
+            result["additionalProperties"] = False
+            if set(result.get("required", [])) != set(result["properties"]):
+                strict = False
+        return result
+
+    return visit(schema), strict
+
+
+def inline_schema(schema: dict[str, Any]) -> dict[str, Any]:
+    """Return `schema` with every `$ref` replaced by its definition and titles removed."""
+    defs = schema.get("$defs") or schema.get("definitions") or {}
+
+    def replace_refs(obj: Any) -> Any:
+        if isinstance(obj, dict):
+            if "$ref" in obj:
+                ref_name = obj["$ref"].split("/")[-1]
+                definition = defs.get(ref_name)
+                if not definition:
+                    raise ValueError(f"Definition {ref_name} not found in $defs.")
+                return replace_refs(definition)
+            return {
+                k: replace_refs(v)
+                for k, v in obj.items()
+                # A string `title` is an annotation; a dict one is a property called "title"
+                if k not in ("$defs", "definitions") and not (k == "title" and isinstance(v, str))
+            }
+        if isinstance(obj, list):
+            return [replace_refs(item) for item in obj]
+        return obj
+
+    return replace_refs(schema)
+
+
+class JSONExtractor:
+    """Find the first complete JSON object or array in text that arrives in chunks.
+
+    Brackets inside strings (and escaped quotes) are handled, so braces in
+    prose or code snippets inside the JSON do not end it early. Text before
+    the JSON, such as a ```json fence or a preamble, is skipped, and a
+    balanced span that does not parse (e.g. `{placeholder}` in a preamble)
+    is passed over.
+    """
+
+    def __init__(self) -> None:
+        self._text = ""
+        self._position = 0
+        self._start: int | None = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.result: str | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    @property
+    def partial(self) -> str:
+        """The JSON text received so far (complete once `done`)."""
+        if self.result is not None:
+            return self.result
+        return "" if self._start is None else self._text[self._start :]
+
+    def _reset(self, position: int) -> None:
+        self._position = position
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> str | None:
+        """Consume the next chunk. Returns the JSON text once it is complete."""
+        if self.result is not None:
+            return self.result
+        self._text += chunk
+        text = self._text
+
+        while self._position < len(text):
+            if self._start is None:
+                starts = [
+                    i for i in (text.find("{", self._position), text.find("[", self._position)) if i != -1
+                ]
+                if not starts:
+                    self._position = len(text)
+                    return None
+                self._start = self._position = min(starts)
+
+            char = text[self._position]
+            self._position += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = text[self._start : self._position]
+                    try:
+                        json.loads(candidate)
+                    except json.JSONDecodeError:
+                        self._reset(self._start + 1)
+                        continue
+                    self.result = candidate
+                    return candidate
+        return None
+
+
+def extract_json(text: str) -> str | None:
+    """Return the first complete JSON object or array in `text` that parses."""
+    return JSONExtractor().feed(text)
+
+
+_MISSING = object()
+_SCALAR = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+
+
+class _PartialParser:
+    """Parse the JSON received so far, keeping only what is complete.
+
+    Strings and numbers are kept once they are closed, list items once they
+    are complete, and unfinished containers hold their completed members.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.i = 0
+
+    def _skip(self) -> None:
+        while self.i < len(self.text) and self.text[self.i] in " \t\r\n":
+            self.i += 1
+
+    def _peek(self) -> str | None:
+        self._skip()
+        return self.text[self.i] if self.i < len(self.text) else None
+
+    def value(self) -> tuple[Any, bool]:
+        """Returns `(value, complete)`; the value is `_MISSING` if nothing usable was read."""
+        char = self._peek()
+        if char is None:
+            return _MISSING, False
+        if char == "{":
+            return self._container("}", {})
+        if char == "[":
+            return self._container("]", [])
+        if char == '"':
+            return self._string()
+        match = _SCALAR.match(self.text, self.i)
+        if match is None:
+            return _MISSING, False
+        self.i = match.end()
+        # A number is only known to be finished once a delimiter follows it
+        if self._peek() not in (",", "}", "]"):
+            return _MISSING, False
+        return json.loads(match.group()), True
+
+    def _string(self) -> tuple[Any, bool]:
+        start = self.i
+        self.i += 1
+        while self.i < len(self.text):
+            char = self.text[self.i]
+            if char == "\\":
+                self.i += 2
+                continue
+            self.i += 1
+            if char == '"':
+                return json.loads(self.text[start : self.i]), True
+        return _MISSING, False
+
+    def _container(self, close: str, result: dict | list) -> tuple[Any, bool]:
+        self.i += 1
+        while True:
+            char = self._peek()
+            if char is None:
+                return result, False
+            if char == close:
+                self.i += 1
+                return result, True
+            if char == ",":
+                self.i += 1
+                continue
+            if isinstance(result, dict):
+                key, complete = self._string() if char == '"' else (_MISSING, False)
+                if not complete or self._peek() != ":":
+                    return result, False
+                self.i += 1
+                value, complete = self.value()
+                # Unfinished lists/objects are shown with what they hold so far
+                if complete or isinstance(value, (dict, list)):
+                    result[key] = value
+            else:
+                value, complete = self.value()
+                if complete:
+                    result.append(value)
+            if not complete:
+                return result, False
+
+
+def parse_partial_json(text: str) -> Any:
+    """The completed parts of a (possibly unfinished) JSON document, or None."""
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return None
+    parser = _PartialParser(text)
+    parser.i = min(starts)
+    value, _ = parser.value()
+    return None if value is _MISSING else value
+
+
+class PartialStream:
+    """Token callback that turns a streamed structured response into snapshots.
+
+    Every `interval` seconds at most, the text received so far is parsed and,
+    if it changed, `on_snapshot` is called with a dict holding every field
+    completed so far (and empty defaults for the rest).
+    """
+
+    def __init__(
+        self,
+        codec: "StructuredCodec",
+        on_snapshot: Callable[[dict[str, Any]], None],
+        interval: float = PARTIAL_UPDATE_INTERVAL_SECONDS,
+    ) -> None:
+        self.codec = codec
+        self.on_snapshot = on_snapshot
+        self.interval = interval
+        self._chunks: list[str] = []
+        self._last_time = 0.0
+        self._last: dict[str, Any] | None = None
+
+    def __call__(self, token: str) -> None:
+        self._chunks.append(token)
+        now = time.monotonic()
+        if now - self._last_time < self.interval:
+            return
+        self._last_time = now
+        snapshot = self.snapshot()
+        if snapshot is not None and snapshot != self._last:
+            self._last = snapshot
+            self.on_snapshot(snapshot)
+
+    def snapshot(self) -> dict[str, Any] | None:
+        data = parse_partial_json("".join(self._chunks))
+        if not isinstance(data, dict):
+            return None
+        return {**self.codec.empty(), **data}
+
+
+class ItemStream:
+    """Token callback that hands out the items of a streamed list field one by one.
+
+    Each item of `field` is validated as `item_model` and passed to `on_item`
+    as soon as its closing bracket arrives, so work on the first items can
+    start while the rest are still being generated. Items that do not
+    validate are skipped; the final parse of the response reports them.
+    """
+
+    def __init__(
+        self,
+        field: str,
+        item_model: Type[BaseModel],
+        on_item: Callable[[BaseModel], None],
+    ) -> None:
+        self.field = field
+        self.item_model = item_model
+        self.on_item = on_item
+        self._chunks: list[str] = []
+        self._seen = 0
+
+    def __call__(self, token: str) -> None:
+        self._chunks.append(token)
+        # An item can only be completed by a closing bracket
+        if "}" not in token and "]" not in token:
+            return
+        data = parse_partial_json("".join(self._chunks))
+        items = data.get(self.field) if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            return
+        for raw in items[self._seen :]:
+            self._seen += 1
+            try:
+                item = self.item_model.model_validate(raw)
+            except ValueError:
+                continue
+            self.on_item(item)
+
+
+class StructuredCodec:
+    """Everything needed to ask for and parse one response model, built once."""
+
+    def __init__(self, model: Type[BaseModel]) -> None:
+        self.model = model
+        self.schema = inline_schema(model.model_json_schema())
+        self.schema_json = json.dumps(self.schema)
+        self.instructions = STRUCTURED_OUTPUT_INSTRUCTIONS + self.schema_json
+        schema, strict = strict_schema(self.schema)
+        self.response_format = {
+            "type": "json_schema",
+            "json_schema": {"name": model.__name__, "strict": strict, "schema": schema},
+        }
+
+    def system_prompt(self, system_prompt: str | None = None) -> str:
+        """`system_prompt` with the output instructions and schema appended."""
+        return (system_prompt or "") + self.instructions
+
+    def with_instructions(self, messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """A copy of `messages` whose system message asks for this schema.
+
+        The caller's list (often an agent's history) is left untouched.
+        """
+        if messages and messages[0].get("role") == "system":
+            first = {**messages[0], "content": self.system_prompt(messages[0].get("content"))}
+            return [first, *messages[1:]]
+        return [{"role": "system", "content": self.instructions.lstrip()}, *messages]
+
+    def request(
+        self, model: str, messages: list[dict[str, Any]], system_prompt: str | None = None
+    ) -> dict[str, Any]:
+        """Completion kwargs asking `model` for this schema.
+
+        Models with native support get `response_format`; the others get the
+        schema as instructions in the system prompt.
+        """
+        native = supports_json_schema(model)
+        if system_prompt is not None:
+            messages = [{"role": "system", "content": system_prompt}, *messages]
+        if not native:
+            messages = self.with_instructions(messages)
+        kwargs: dict[str, Any] = {"model": model, "messages": messages}
+        if native:
+            kwargs["response_format"] = self.response_format
+        return kwargs
+
+    def repair_request(self, model: str, content: str, error: Exception) -> dict[str, Any]:
+        """Completion kwargs asking `model` to fix `content` given only its errors.
+
+        The original (often long) prompt is not re-sent.
+        """
+        messages = [
+            {
+                "role": "user",
+                "content": (
+                    "This JSON failed validation against the schema:\n\n"
+                    f"{content}\n\nErrors:\n{format_errors(error)}\n\n"
+                    "Return the corrected JSON only, keeping all valid content unchanged."
+                ),
+            }
+        ]
+        return self.request(model, messages, system_prompt="You fix JSON so it matches a schema.")
+
+    def empty(self) -> dict[str, Any]:
+        """Placeholder values for every top-level field, for partial snapshots."""
+        defaults = {"string": "", "array": [], "object": {}}
+        return {
+            name: defaults.get(prop.get("type"))
+            for name, prop in self.schema.get("properties", {}).items()
+        }
+
+    def partial_stream(self, on_snapshot: Callable[[dict[str, Any]], None]) -> PartialStream:
+        return PartialStream(self, on_snapshot)
+
+    def item_stream(
+        self, field: str, item_model: Type[BaseModel], on_item: Callable[[BaseModel], None]
+    ) -> ItemStream:
+        return ItemStream(field, item_model, on_item)
+
+    def extractor(self) -> JSONExtractor:
+        return JSONExtractor()
+
+    def parse(self, content: str) -> BaseModel:
+        """Validate `content`, falling back to the first JSON value embedded in it."""
+        try:
+            return self.model.model_validate_json(content)
+        except ValueError:
+            json_content = extract_json(content)
+            if json_content is None:
+                raise ValueError("No JSON object or array found in response")
+            return self.model.model_validate_json(json_content)
+
+
+@functools.cache
+def get_codec(model: Type[BaseModel]) -> StructuredCodec:
+    """The compiled codec for `model`, memoized per model class."""
+    return StructuredCodec(model)
@@ -1,6 +1,8 @@
 from backend.models.tools.tool import Tool
 from backend.models.tools.web_search import web_search_tool
 from backend.models.tools.file_traversal import ls_tool, cd_tool, read_file_tool, pwd_tool
+from backend.models.tools.code_search import search_code_tool
+from backend.models.tools.batch_read import read_files_tool
 from typing import Dict, Optional
 
 
@@ -44,5 +46,7 @@ tool_registry.register(ls_tool)
 tool_registry.register(cd_tool)
 tool_registry.register(read_file_tool)
 tool_registry.register(pwd_tool)
+tool_registry.register(search_code_tool)
+tool_registry.register(read_files_tool)
 
 __all__ = ["Tool", "tool_registry"]
\ No newline at end of file
@@ -0,0 +1,159 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from backend.models.tools import Tool
+from backend.models.tools.runtime import run_sync, send_message
+from backend.models.tools.file_traversal import Workspace, get_workspace, resolve_file
+from backend.models.tools.file_window import read_window
+import chainlit as cl
+
+# Default total budget for one read_files call (roughly 4 bytes per token)
+READ_FILES_MAX_BYTES = int(os.getenv("READ_FILES_MAX_BYTES", "60000"))
+# No file gets less than this; when the budget cannot give every requested
+# file that much, the files past it are not read
+READ_FILES_MIN_BYTES_PER_FILE = 2000
+
+
+class FileRequest(BaseModel):
+    path: str
+    start_line: Optional[int] = Field(None, description="First line to read (1-based)")
+    end_line: Optional[int] = Field(None, description="Last line to read (inclusive)")
+
+
+def _resolve_request(workspace: Workspace, path: str):
+    """Resolve a requested path, tolerating the repo-name prefix and leading slashes
+    the orchestrator sometimes copies from the tree."""
+    candidates = [path]
+    stripped = path.lstrip("/")
+    if stripped != path:
+        candidates.append(stripped)
+    if "/" in stripped:
+        candidates.append(stripped.split("/", 1)[1])
+
+    first = None
+    for candidate in candidates:
+        resolved = resolve_file(workspace, candidate)
+        if resolved[2] is None:
+            return resolved
+        first = first or resolved
+    return first
+
+
+def _allocate(sizes: list[int], budget: int) -> list[int]:
+    """Split `budget` across files so small files are read whole and the rest is
+    shared evenly among the larger ones.
+
+    The total never exceeds `budget`. Files past the first
+    `budget // READ_FILES_MIN_BYTES_PER_FILE` (in request order) get 0.
+    """
+    allocation = [0] * len(sizes)
+    kept = min(len(sizes), max(1, budget // READ_FILES_MIN_BYTES_PER_FILE))
+    remaining = budget
+    order = sorted(range(kept), key=lambda i: sizes[i])
+    for position, i in enumerate(order):
+        share = remaining // (kept - position)
+        allocation[i] = min(sizes[i], share) if sizes[i] else share
+        remaining -= allocation[i]
+    return allocation
+
+
+def read_file_batch(
+    workspace: Workspace,
+    files: List[FileRequest | dict],
+    max_bytes: int = READ_FILES_MAX_BYTES,
+) -> list[tuple[str, str]]:
+    """Read several files (or line ranges) concurrently within one total byte budget.
+
+    Returns:
+        list[tuple[str, str]]: `(path, content)` pairs in request order
+    """
+    requests = [FileRequest.model_validate(f) if isinstance(f, dict) else f for f in files]
+    resolved = [_resolve_request(workspace, request.path) for request in requests]
+    sizes = []
+    for full_path, info, error in resolved:
+        if error:
+            sizes.append(0)
+        elif info is not None:
+            sizes.append(info.size)
+        else:
+            sizes.append(os.path.getsize(full_path))
+    allocation = _allocate(sizes, max_bytes)
+
+    def read_one(i: int) -> str:
+        full_path, info, error = resolved[i]
+        if error:
+            return error
+        if not allocation[i]:
+            return "Not read: too many files for one call's budget. Request it in another call."
+        request = requests[i]
+        try:
+            return read_window(
+                full_path,
+                start_line=request.start_line,
+                end_line=request.end_line,
+                max_bytes=allocation[i],
+                binary=info.binary if info is not None else None,
+            )
+        except Exception as e:
+            return f"Error reading file: {str(e)}"
+
+    if not requests:
+        return []
+    with ThreadPoolExecutor(max_workers=min(8, len(requests))) as executor:
+        contents = list(executor.map(read_one, range(len(requests))))
+    return [(request.path, content) for request, content in zip(requests, contents)]
+
+
+def format_file_batch(results: list[tuple[str, str]]) -> str:
+    """Combine batch results into one clearly delimited block."""
+    sections = []
+    for path, content in results:
+        sections.append(f"===== BEGIN {path} =====\n{content.rstrip()}\n===== END {path} =====")
+    return "\n\n".join(sections)
+
+
+async def read_files_async(
+    files: List[FileRequest | dict], max_bytes: Optional[int] = None
+) -> str:
+    """Read several files at once and return them as one combined result."""
+    workspace = get_workspace()
+    # The agent may ask for less than the default budget, never for more
+    max_bytes = max(1, min(max_bytes or READ_FILES_MAX_BYTES, READ_FILES_MAX_BYTES))
+    print(f"Reading {len(files)} files")
+    try:
+        results = await asyncio.to_thread(read_file_batch, workspace, files, max_bytes)
+    except Exception as e:
+        return f"Error reading files: {str(e)}"
+
+    elements = [
+        cl.CustomElement(name="ReadFile", props={"file_path": path, "response": content})
+        for path, content in results
+    ]
+    await send_message(cl.Message(content="", elements=elements))
+
+    return format_file_batch(results)
+
+
+def read_files(files: List[FileRequest | dict], max_bytes: Optional[int] = None) -> str:
+    return run_sync(read_files_async(files, max_bytes))
+
+
+class ReadFilesArgs(BaseModel):
+    files: List[FileRequest] = Field(description="Files to read, each with an optional line range")
+    max_bytes: Optional[int] = Field(
+        None,
+        description=f"Total bytes to return across all files (default and maximum {READ_FILES_MAX_BYTES}, about 4 bytes per token)",
+    )
+
+
+read_files_tool = Tool(
+    name="read_files",
+    description=(
+        "Read several files (optionally line ranges) in one call. Returns each file "
+        "between ===== BEGIN path ===== and ===== END path ===== markers, sharing one size budget"
+    ),
+    function=read_files_async,
+    argument_schema=ReadFilesArgs,
+)
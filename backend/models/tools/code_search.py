@@ -0,0 +1,206 @@
+import asyncio
+import os
+import re
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+from backend.models.tools import Tool
+from backend.models.tools.runtime import run_sync, send_message
+from backend.models.tools.file_traversal import get_workspace
+from backend.repo_cache import local_commit
+from backend.repo_index import RepoIndex, get_loaded_index, load_index
+from backend.repo_tree import is_skipped_path
+import chainlit as cl
+
+# Files larger than this are almost always generated and are not searched
+SEARCH_MAX_FILE_BYTES = int(os.getenv("SEARCH_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "30"))
+# Keeps one noisy file from using up every result slot
+SEARCH_MAX_MATCHES_PER_FILE = 5
+SEARCH_MAX_LINE_CHARS = 200
+
+# Definition keywords across the languages we index; `{name}` is the escaped symbol
+SYMBOL_PATTERNS = [
+    r"\b(?:def|class|function\*?|func|fn|fun|struct|enum|trait|interface|type|module|record|object|impl|protocol|extension)[ \t]+(?:\([^)\n]*\)[ \t]*)?{name}\b",
+    r"\b(?:const|let|var|val)[ \t]+{name}[ \t]*[:=]",
+    r"^[ \t]*(?:(?:public|private|protected|static|async|export|override)[ \t]+)*(?!return\b|await\b|yield\b|new\b|else\b)[\w<>\[\],]+[ \t]+{name}[ \t]*\([^;\n]*$",
+]
+
+
+def _compile(query: str, mode: str, case_sensitive: bool) -> re.Pattern:
+    flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+    if mode == "regex":
+        pattern = query
+    elif mode == "symbol":
+        name = r"\w*".join(re.escape(part) for part in query.split("*"))
+        pattern = "|".join(f"(?:{p.format(name=name)})" for p in SYMBOL_PATTERNS)
+    else:
+        pattern = re.escape(query)
+    return re.compile(pattern.encode("utf-8"), flags)
+
+
+def _snippet(line: bytes) -> str:
+    text = line.decode("utf-8", errors="replace").rstrip()
+    if len(text) > SEARCH_MAX_LINE_CHARS:
+        text = text[:SEARCH_MAX_LINE_CHARS] + "..."
+    return text
+
+
+def search_files(
+    root: str,
+    index: RepoIndex,
+    query: str,
+    mode: str = "literal",
+    scope: str = "",
+    display_base: str | None = None,
+    case_sensitive: bool = False,
+    context_lines: int = 1,
+    max_results: int = SEARCH_MAX_RESULTS,
+) -> tuple[list[str], int]:
+    """Search the indexed text files of `root` (optionally under `scope`).
+
+    Returns:
+        tuple[list[str], int]: Result blocks in `path:line: snippet` form, and
+        the total number of matches found (which may exceed the blocks shown)
+    """
+    regex = _compile(query, mode, case_sensitive)
+    display_base = display_base or root
+    scope = RepoIndex.normalize(scope)
+
+    blocks: list[str] = []
+    total = 0
+    for info in index:
+        if scope and not (info.path == scope or info.path.startswith(scope + "/")):
+            continue
+        if info.binary or info.size > SEARCH_MAX_FILE_BYTES or is_skipped_path(info.path):
+            continue
+        full_path = os.path.join(root, info.path)
+        try:
+            with open(full_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+
+        matches = list(regex.finditer(data))
+        if not matches:
+            continue
+        total += len(matches)
+        if len(blocks) >= max_results:
+            continue
+
+        display_path = os.path.relpath(full_path, display_base)
+        lines = data.split(b"\n")
+        line_number, position = 1, 0
+        seen_lines: set[int] = set()
+        for match in matches[:SEARCH_MAX_MATCHES_PER_FILE]:
+            line_number += data.count(b"\n", position, match.start())
+            position = match.start()
+            if line_number in seen_lines:
+                continue
+            seen_lines.add(line_number)
+
+            block = []
+            first = max(1, line_number - context_lines)
+            last = min(len(lines), line_number + context_lines)
+            for number in range(first, last + 1):
+                separator = ":" if number == line_number else "-"
+                block.append(f"{display_path}{separator}{number}{separator} {_snippet(lines[number - 1])}")
+            blocks.append("\n".join(block))
+            if len(blocks) >= max_results:
+                break
+
+    return blocks, total
+
+
+async def search_code_async(
+    query: str,
+    mode: str = "literal",
+    path: str = ".",
+    case_sensitive: bool = False,
+    context_lines: int = 1,
+    max_results: int = SEARCH_MAX_RESULTS,
+) -> str:
+    """Search the repository's source files for a literal, regex or symbol definition."""
+    workspace = get_workspace()
+    mode = mode or "literal"
+    path = path or "."
+    context_lines = 1 if context_lines is None else context_lines
+    max_results = max_results or SEARCH_MAX_RESULTS
+    full_path = os.path.normpath(os.path.join(workspace.current_path, path))
+    print(f"Searching code for {query!r} ({mode}) in {full_path}")
+    try:
+        # An empty index is still an index: only build one when none is loaded
+        index = workspace.index if workspace.index is not None else get_loaded_index(workspace.root)
+        if index is None:
+            commit = workspace.commit or await asyncio.to_thread(local_commit, workspace.root)
+            index = await asyncio.to_thread(load_index, workspace.root, commit)
+        scope = workspace.relative(full_path)
+        if scope is None:
+            return f"Error: '{full_path}' is outside the repository."
+
+        blocks, total = await asyncio.to_thread(
+            search_files,
+            workspace.root,
+            index,
+            query,
+            mode=mode,
+            scope=scope,
+            display_base=workspace.current_path,
+            case_sensitive=bool(case_sensitive),
+            context_lines=max(0, min(context_lines, 5)),
+            max_results=max(1, min(max_results, 100)),
+        )
+    except re.error as e:
+        return f"Error: Invalid regex {query!r}: {str(e)}"
+    except Exception as e:
+        return f"Error searching code: {str(e)}"
+
+    if not blocks:
+        result = f"No matches for {query!r}."
+    else:
+        result = "\n--\n".join(blocks)
+        if total > len(blocks):
+            result += f"\n\n[{total} matches in total; showing {len(blocks)}. Narrow the query or path to see more.]"
+
+    search_code_element = cl.CustomElement(
+        name="SearchCode",
+        props={"args": {"query": query, "mode": mode, "path": path}, "response": result},
+    )
+
+    await send_message(cl.Message(content="", elements=[search_code_element]))
+    return result
+
+
+def search_code(
+    query: str,
+    mode: str = "literal",
+    path: str = ".",
+    case_sensitive: bool = False,
+    context_lines: int = 1,
+    max_results: int = SEARCH_MAX_RESULTS,
+) -> str:
+    return run_sync(
+        search_code_async(query, mode, path, case_sensitive, context_lines, max_results)
+    )
+
+
+class SearchCodeArgs(BaseModel):
+    query: str = Field(description="Text, regex or symbol name to search for")
+    mode: Literal["literal", "regex", "symbol"] = Field(
+        "literal",
+        description="literal text, a regex, or 'symbol' to find where a function/class/type is defined (use * as a wildcard)",
+    )
+    path: Optional[str] = Field(".", description="Directory or file to search in, relative to the current directory")
+    case_sensitive: Optional[bool] = False
+    context_lines: Optional[int] = Field(1, description="Lines of context around each match (max 5)")
+    max_results: Optional[int] = Field(SEARCH_MAX_RESULTS, description="Maximum number of matches to return")
+
+
+search_code_tool = Tool(
+    name="search_code",
+    description=(
+        "Search the repository's source files and return matches as `path:line: snippet`. "
+        "Use this instead of listing and reading files to find where something is used or defined"
+    ),
+    function=search_code_async,
+    argument_schema=SearchCodeArgs,
+)
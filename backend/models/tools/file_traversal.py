@@ -1,35 +1,108 @@
 import os
 import asyncio
+from contextvars import ContextVar
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from backend.models.tools import Tool
+from backend.models.tools.runtime import run_sync, send_message
+from backend.models.tools.file_window import read_window
+from backend.repo_index import RepoIndex, get_loaded_index
 import chainlit as cl
-current_path = "."
 
-def set_current_path(path: str):   
-    global current_path
-    current_path = path
 
-async def list_directory_async(path: str = current_path) -> str:
+class Workspace:
+    """Working-directory state for a single agent.
+
+    Each agent runs in its own context with its own `Workspace`, so `cd` in one
+    agent never moves another agent that is exploring the same repository.
+    """
+
+    def __init__(self, root: str, index: RepoIndex | None = None, commit: str | None = None):
+        self.root = root
+        self.current_path = root
+        # Answer ls/cd/read_file lookups from the clone's index when one is loaded
+        self.index = index if index is not None else get_loaded_index(root)
+        # Commit checked out at `root`, when known
+        self.commit = commit if commit is not None or self.index is None else self.index.commit
+
+    def relative(self, full_path: str) -> str | None:
+        """`full_path` relative to the workspace root, or None if it lies outside."""
+        rel_path = os.path.relpath(full_path, self.root)
+        if rel_path == ".." or rel_path.startswith(".." + os.sep):
+            return None
+        return RepoIndex.normalize(rel_path)
+
+    def indexed(self, full_path: str) -> str | None:
+        """Repo-relative path when the index can answer for `full_path`."""
+        if self.index is None:
+            return None
+        return self.relative(full_path)
+
+
+def resolve_file(workspace: Workspace, path: str):
+    """Resolve `path` against the workspace's current directory.
+
+    Returns:
+        tuple: `(full_path, info, error)` where `info` is the index entry (if
+        any) and `error` is a message when the path is not a readable file
+    """
+    full_path = os.path.normpath(os.path.join(workspace.current_path, path))
+    # Tracked files are known to exist; anything else is checked on disk
+    rel_path = workspace.indexed(full_path)
+    info = workspace.index.get(rel_path) if rel_path is not None else None
+    if info is None:
+        if not os.path.exists(full_path):
+            print(f"File does not exist: {full_path}")
+            return full_path, None, f"Error: File '{full_path}' does not exist."
+
+        if os.path.isdir(full_path):
+            print(f"File is a directory: {full_path}")
+            return full_path, None, f"Error: '{full_path}' is a directory, not a file."
+    return full_path, info, None
+
+
+_workspace: ContextVar[Workspace | None] = ContextVar("workspace", default=None)
+
+
+def get_workspace() -> Workspace:
+    workspace = _workspace.get()
+    if workspace is None:
+        workspace = Workspace(".")
+        _workspace.set(workspace)
+    return workspace
+
+
+def set_current_path(path: str, index: RepoIndex | None = None, commit: str | None = None):
+    """Start a fresh workspace rooted at `path` for the current context."""
+    _workspace.set(Workspace(path, index, commit))
+
+
+async def list_directory_async(path: str = ".") -> str:
     """List files and directories in the specified path."""
-    global current_path
-    full_path = os.path.normpath(os.path.join(current_path, path))
+    workspace = get_workspace()
+    full_path = os.path.normpath(os.path.join(workspace.current_path, path))
     print(f"Listing directory: {full_path}")
     try:
-        items = os.listdir(full_path)
-        files = []
-        directories = []
-        
-        for item in items:
-            item_path = os.path.join(full_path, item)
-            if os.path.isdir(item_path):
-                directories.append(f"{item}/")
-            else:
-                files.append(item)
-        
-        # Sort and format the output
-        directories.sort()
-        files.sort()
+        rel_path = workspace.indexed(full_path)
+        listing = workspace.index.list_dir(rel_path) if rel_path is not None else None
+        if listing is not None:
+            directories = [f"{item}/" for item in listing[0]]
+            files = listing[1]
+        else:
+            items = os.listdir(full_path)
+            files = []
+            directories = []
+
+            for item in items:
+                item_path = os.path.join(full_path, item)
+                if os.path.isdir(item_path):
+                    directories.append(f"{item}/")
+                else:
+                    files.append(item)
+
+            # Sort and format the output
+            directories.sort()
+            files.sort()
         
         result = "Directories:\n"
         result += "\n".join(directories) if directories else "None"
@@ -41,69 +114,87 @@ async def list_directory_async(path: str = current_path) -> str:
             props={"file_path": path, "response": result},
         )
 
-        await cl.Message(content="", elements=[list_directory_element]).send()
+        await send_message(cl.Message(content="", elements=[list_directory_element]))
         return result
     except Exception as e:
         return f"Error listing directory: {str(e)}"
 
-def list_directory(path: str = current_path) -> str:
-    return asyncio.run(list_directory_async(path))
+def list_directory(path: str = ".") -> str:
+    return run_sync(list_directory_async(path))
 
 
 def change_directory(path: str) -> str:
     """Change the current working directory."""
-    global current_path
+    workspace = get_workspace()
     try:
-        new_path = os.path.normpath(os.path.join(current_path, path))
+        new_path = os.path.normpath(os.path.join(workspace.current_path, path))
         print(f"Changing directory to: {new_path}")
-        
+
+        rel_path = workspace.indexed(new_path)
+        if rel_path is not None and workspace.index.is_dir(rel_path):
+            workspace.current_path = new_path
+            return f"Changed directory to: {new_path}"
+
         if not os.path.exists(new_path):
             return f"Error: Path '{new_path}' does not exist."
             
         if not os.path.isdir(new_path):
             return f"Error: '{new_path}' is not a directory."
             
-        current_path = new_path
-        return f"Changed directory to: {current_path}"
+        workspace.current_path = new_path
+        return f"Changed directory to: {new_path}"
     except Exception as e:
         return f"Error changing directory: {str(e)}"
 
-async def read_file_async(path: str) -> str:
-    """Read the contents of a file."""
-    global current_path
-    full_path = os.path.normpath(os.path.join(current_path, path))
-    print(f"Reading file: {full_path}")
+async def read_file_async(
+    path: str,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+) -> str:
+    """Read a file, or a line/byte window of it, within the read size budget."""
+    workspace = get_workspace()
     try:
-        if not os.path.exists(full_path):
-            print(f"File does not exist: {full_path}")
-            return f"Error: File '{full_path}' does not exist."
-        
-        if os.path.isdir(full_path):
-            print(f"File is a directory: {full_path}")
-            return f"Error: '{full_path}' is a directory, not a file."
-        
-        with open(full_path, 'r') as file:
-            content = file.read()
+        full_path, info, error = resolve_file(workspace, path)
+        print(f"Reading file: {full_path}")
+        if error:
+            return error
+
+        content = await asyncio.to_thread(
+            read_window,
+            full_path,
+            start_line=start_line,
+            end_line=end_line,
+            offset=offset,
+            length=length,
+            binary=info.binary if info is not None else None,
+        )
 
         read_file_element = cl.CustomElement(
             name="ReadFile",
             props={"file_path": path, "response": content},
         )
 
-        await cl.Message(content="", elements=[read_file_element]).send()
+        await send_message(cl.Message(content="", elements=[read_file_element]))
         
         return f"{content}"
     except Exception as e:
         return f"Error reading file: {str(e)}"
     
-def read_file(path: str) -> str:
-    return asyncio.run(read_file_async(path))
+def read_file(
+    path: str,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+) -> str:
+    return run_sync(read_file_async(path, start_line, end_line, offset, length))
 
 def get_current_directory() -> str:
     """Get the current working directory."""
-    global current_path
     try:
-        return f"Current directory: {current_path}"
+        return f"Current directory: {get_workspace().current_path}"
     except Exception as e:
         return f"Error getting current directory: {str(e)}"
 
@@ -116,6 +207,10 @@ class ChangeDirectoryArgs(BaseModel):
 
 class ReadFileArgs(BaseModel):
     path: str
+    start_line: Optional[int] = Field(None, description="First line to read (1-based)")
+    end_line: Optional[int] = Field(None, description="Last line to read (inclusive)")
+    offset: Optional[int] = Field(None, description="First byte to read, for files without useful line breaks")
+    length: Optional[int] = Field(None, description="Number of bytes to read from offset")
 
 class GetCurrentDirectoryArgs(BaseModel):
     pass
@@ -125,7 +220,7 @@ class GetCurrentDirectoryArgs(BaseModel):
 ls_tool = Tool(
     name="ls",
     description="List files and directories in the specified path",
-    function=list_directory,
+    function=list_directory_async,
     argument_schema=ListDirectoryArgs,
 )
 
@@ -138,8 +233,11 @@ cd_tool = Tool(
 
 read_file_tool = Tool(
     name="read_file",
-    description="Read the contents of a file",
-    function=read_file,
+    description=(
+        "Read the contents of a file. Large files are returned as a head/tail view; "
+        "use start_line/end_line (or offset/length in bytes) to page through them"
+    ),
+    function=read_file_async,
     argument_schema=ReadFileArgs,
 )
 
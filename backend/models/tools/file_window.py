@@ -0,0 +1,168 @@
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+# Default amount of a file returned to the agent by a single read
+READ_FILE_MAX_BYTES = int(os.getenv("READ_FILE_MAX_BYTES", "24000"))
+# Files at least this large are memory-mapped instead of read into memory
+MMAP_THRESHOLD_BYTES = int(os.getenv("READ_FILE_MMAP_THRESHOLD_BYTES", str(1024 * 1024)))
+BINARY_SNIFF_BYTES = 8192
+
+
+@contextmanager
+def open_buffer(full_path: str) -> Iterator[bytes | mmap.mmap]:
+    """Yield the file's bytes, memory-mapped for large files."""
+    with open(full_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield buffer
+        else:
+            yield f.read()
+
+
+def looks_binary(buffer: bytes | mmap.mmap) -> bool:
+    return b"\0" in buffer[:BINARY_SNIFF_BYTES]
+
+
+def decode(data: bytes) -> tuple[str, bool]:
+    """Decode as UTF-8, replacing invalid bytes. Returns `(text, was_valid_utf8)`."""
+    try:
+        return data.decode("utf-8"), True
+    except UnicodeDecodeError:
+        return data.decode("utf-8", errors="replace"), False
+
+
+def _char_start(buffer: bytes | mmap.mmap, offset: int) -> int:
+    """`offset`, moved back to the first byte of the UTF-8 character it falls in.
+
+    A character is at most 4 bytes, so anything further back is not UTF-8
+    and `offset` is kept.
+    """
+    for back in range(4):
+        position = offset - back
+        if position <= 0 or position >= len(buffer) or buffer[position] & 0xC0 != 0x80:
+            return max(position, 0)
+    return offset
+
+
+def count_lines(buffer: bytes | mmap.mmap, start: int = 0, end: int | None = None) -> int:
+    """Count newlines in `buffer[start:end]` in chunks (mmap has no `count`)."""
+    end = len(buffer) if end is None else end
+    total = 0
+    chunk = 4 * 1024 * 1024
+    for position in range(start, end, chunk):
+        total += buffer[position : min(position + chunk, end)].count(b"\n")
+    return total
+
+
+def _line_offset(buffer: bytes | mmap.mmap, line: int, start: int = 0, start_line: int = 1) -> int:
+    """Byte offset at which 1-based `line` starts (len(buffer) if past the end)."""
+    offset = start
+    for _ in range(line - start_line):
+        newline = buffer.find(b"\n", offset)
+        if newline == -1:
+            return len(buffer)
+        offset = newline + 1
+    return offset
+
+
+def _cut_at_line(data: bytes, limit: int) -> bytes:
+    """Trim `data` to at most `limit` bytes, ending on a line boundary when possible."""
+    if len(data) <= limit:
+        return data
+    newline = data.rfind(b"\n", 0, limit)
+    return data[: newline + 1] if newline > 0 else data[:limit]
+
+
+def read_window(
+    full_path: str,
+    start_line: int | None = None,
+    end_line: int | None = None,
+    offset: int | None = None,
+    length: int | None = None,
+    max_bytes: int = READ_FILE_MAX_BYTES,
+    binary: bool | None = None,
+) -> str:
+    """Read part of a file for an agent, within a size budget.
+
+    Without a range, small files are returned whole and large ones as a
+    head/tail view with a notice. `start_line`/`end_line` (1-based,
+    inclusive) or `offset`/`length` (bytes) select a window; the notices tell
+    the agent how to page further.
+
+    Args:
+        full_path (str): File to read
+        start_line (int, optional): First line to return
+        end_line (int, optional): Last line to return
+        offset (int, optional): First byte to return
+        length (int, optional): Number of bytes to return
+        max_bytes (int): Maximum number of bytes returned
+        binary (bool, optional): Known binary flag (e.g. from the repository index)
+
+    Returns:
+        str: The selected text, with notices for truncation and encoding problems
+    """
+    with open_buffer(full_path) as buffer:
+        size = len(buffer)
+        if binary if binary is not None else looks_binary(buffer):
+            return f"[Binary file, {size} bytes, not shown]"
+
+        notices = []
+        if offset is not None or length is not None:
+            # Both edges fall between characters, so one split across two windows
+            # is returned whole by the second
+            start = _char_start(buffer, min(max(0, offset or 0), size))
+            end = min(start + min(length or max_bytes, max_bytes), size)
+            if _char_start(buffer, end) > start:
+                end = _char_start(buffer, end)
+            else:
+                # Shorter than the character it starts on: return that character whole
+                while end < min(size, start + 4) and buffer[end] & 0xC0 == 0x80:
+                    end += 1
+            data = bytes(buffer[start:end])
+            notices.append(f"[Bytes {start}-{end} of {size}]")
+            if end < size:
+                notices.append(f"[More content follows; continue with offset={end}]")
+        elif start_line is not None or end_line is not None:
+            first = max(1, start_line or 1)
+            if end_line is not None and end_line < first:
+                return f"Error: start_line must be <= end_line (got start_line={first}, end_line={end_line})."
+            start = _line_offset(buffer, first)
+            stop = size if end_line is None else _line_offset(buffer, end_line + 1, start, first)
+            data = _cut_at_line(bytes(buffer[start : min(stop, start + max_bytes + 1)]), max_bytes)
+            last = first + max(data.count(b"\n") - (1 if data.endswith(b"\n") else 0), 0)
+            total = count_lines(buffer) + (0 if size == 0 or buffer[size - 1 : size] == b"\n" else 1)
+            if not data:
+                return f"[start_line={first} is past the end of the file ({total} lines)]"
+            notices.append(f"[Lines {first}-{last} of {total}]")
+            if start + len(data) < stop:
+                notices.append(f"[Window truncated at {max_bytes} bytes; continue with start_line={last + 1}]")
+        elif size <= max_bytes:
+            data = bytes(buffer)
+        else:
+            head = _cut_at_line(bytes(buffer[: max_bytes * 2 // 3 + 1]), max_bytes * 2 // 3)
+            tail_start = size - max_bytes // 3
+            newline = buffer.find(b"\n", tail_start)
+            tail_start = newline + 1 if 0 <= newline < size - 1 else tail_start
+            tail = bytes(buffer[tail_start:])
+            head_lines = head.count(b"\n")
+            omitted_lines = count_lines(buffer, len(head), tail_start)
+            text_head, head_ok = decode(head)
+            text_tail, tail_ok = decode(tail)
+            notice = (
+                f"\n[... {omitted_lines} lines ({tail_start - len(head)} bytes) omitted: file is {size} bytes. "
+                f"Call read_file with start_line={head_lines + 1} and end_line to read the middle ...]\n"
+            )
+            text = text_head + notice + text_tail
+            if not (head_ok and tail_ok):
+                text = "[File is not valid UTF-8; undecodable bytes were replaced]\n" + text
+            return text
+
+    text, valid = decode(data)
+    if not valid:
+        notices.insert(0, "[File is not valid UTF-8; undecodable bytes were replaced]")
+    if notices:
+        return "\n".join(notices) + "\n" + text
+    return text
@@ -0,0 +1,176 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, TypeVar
+
+import chainlit as cl
+from chainlit.context import ChainlitContextException, get_context
+
+T = TypeVar("T")
+
+# Bounded pool shared by every synchronous tool call made from async code
+tool_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TOOL_WORKERS", "8")), thread_name_prefix="tool"
+)
+
+_background_loop: asyncio.AbstractEventLoop | None = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """The long-lived loop that async tools run on when called from sync code."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="tool-loop", daemon=True
+            ).start()
+            _background_loop = loop
+        return _background_loop
+
+
+def session_loop() -> asyncio.AbstractEventLoop | None:
+    """The event loop of the current Chainlit session, if there is one."""
+    try:
+        return get_context().loop
+    except ChainlitContextException:
+        return None
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine to completion from synchronous code.
+
+    The coroutine runs on the shared background loop with the caller's
+    context (agent workspace, Chainlit session), instead of on a new event
+    loop per call. Must not be called from a running event loop.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("run_sync() called from a running event loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result()
+
+
+async def run_in_executor(function: Callable[..., T], **kwargs: Any) -> T:
+    """Run a sync function on `tool_executor`, carrying the caller's context."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        tool_executor, functools.partial(context.run, function, **kwargs)
+    )
+
+
+async def send_message(message: cl.Message) -> None:
+    """Send a message on the Chainlit session's loop, wherever the caller runs.
+
+    UI updates are a side effect of tools, so failures are logged rather than
+    failing the tool call.
+    """
+    loop = session_loop()
+    try:
+        if loop is None or loop is asyncio.get_running_loop():
+            await message.send()
+        else:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(message.send(), loop))
+    except Exception as e:
+        print(f"Failed to send message to the UI: {str(e)}")
+
+
+def _dispatch(
+    coro: Coroutine[Any, Any, Any], loop: asyncio.AbstractEventLoop | None
+) -> asyncio.Future | Future | None:
+    """Schedule `coro` on `loop` without waiting for it; calls keep their order.
+
+    Returns its task (or, from another thread, its future) for `_wait_dispatched`.
+    """
+    if loop is None:
+        coro.close()
+        return None
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        return loop.create_task(coro)
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
+async def _wait_dispatched(dispatched: list[asyncio.Future | Future]) -> None:
+    """Wait, on the loop they were dispatched to, until `dispatched` calls are done.
+
+    Their errors are ignored: like `send_message`, UI updates never fail the caller.
+    """
+    await asyncio.gather(
+        *(f if isinstance(f, asyncio.Future) else asyncio.wrap_future(f) for f in dispatched),
+        return_exceptions=True,
+    )
+
+
+class MessageStream:
+    """Token callback that streams into a Chainlit message from any thread or loop.
+
+    Tokens are dispatched to the session's loop without waiting, in order.
+    Call `finish()` (on the session's loop) once the stream is done.
+    """
+
+    def __init__(self, message: cl.Message):
+        self.message = message
+        self.loop = session_loop()
+        self._lock = threading.Lock()
+        self._dispatched: list[asyncio.Future | Future] = []
+
+    def __call__(self, token: str) -> None:
+        with self._lock:
+            dispatched = _dispatch(self.message.stream_token(token), self.loop)
+            if dispatched is not None:
+                self._dispatched.append(dispatched)
+
+    async def finish(self) -> None:
+        # Every token already dispatched lands before the final send
+        with self._lock:
+            dispatched, self._dispatched = self._dispatched, []
+        await _wait_dispatched(dispatched)
+        await self.message.send()
+
+
+class LiveElement:
+    """A custom element whose props can be updated from any thread as results stream in.
+
+    The first `update()` sends the element in a new message; later ones
+    update it in place. `finish()` sets the final props.
+    """
+
+    def __init__(self, element: cl.CustomElement, content: str = ""):
+        self.element = element
+        self.message = cl.Message(content=content, elements=[element])
+        self.loop = session_loop()
+        self._lock = threading.Lock()
+        self._sent = False
+        self._dispatched: list[asyncio.Future | Future] = []
+
+    def update(self, **props: Any) -> None:
+        with self._lock:
+            self.element.props.update(props)
+            coro = self.element.update() if self._sent else self.message.send()
+            self._sent = True
+            dispatched = _dispatch(coro, self.loop)
+            if dispatched is not None:
+                self._dispatched.append(dispatched)
+
+    async def finish(self, **props: Any) -> None:
+        with self._lock:
+            self.element.props.update(props)
+            sent, self._sent = self._sent, True
+            dispatched, self._dispatched = self._dispatched, []
+        # The first send (and earlier updates) must land before the final update
+        await _wait_dispatched(dispatched)
+        if sent:
+            await self.element.update()
+        else:
+            await self.message.send()
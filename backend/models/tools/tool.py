@@ -1,5 +1,7 @@
-from typing import Callable, Any
+import inspect
+from typing import Awaitable, Callable, Any
 from pydantic import BaseModel
+from backend.models.tools.runtime import run_in_executor, run_sync
 
 
 class Tool:
@@ -7,19 +9,32 @@ class Tool:
         self,
         name: str,
         description: str,
-        function: Callable[..., str],
+        function: Callable[..., str] | Callable[..., Awaitable[str]],
         argument_schema: BaseModel,
     ):
         self.name = name
         self.description = description
         self.function = function
         self.argument_schema = argument_schema
+        self.is_async = inspect.iscoroutinefunction(function)
 
     def __call__(self, **kwargs) -> str:
+        """Call the tool from synchronous code."""
         if not self.argument_schema.model_validate(kwargs):
             return f"Invalid arguments: {kwargs}"
+        if self.is_async:
+            return run_sync(self.function(**kwargs))
         return self.function(**kwargs)
 
+    async def acall(self, **kwargs) -> str:
+        """Call the tool from async code: async tools are awaited on the current
+        loop, sync tools run on the shared tool executor."""
+        if not self.argument_schema.model_validate(kwargs):
+            return f"Invalid arguments: {kwargs}"
+        if self.is_async:
+            return await self.function(**kwargs)
+        return await run_in_executor(self.function, **kwargs)
+
     def __str__(self) -> str:
         return f"{self.name}: {self.description}\nArguments: {self.argument_schema}"
 
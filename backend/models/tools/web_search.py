@@ -1,8 +1,19 @@
 import asyncio
+import json
 import os
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit
 from exa_py import Exa
 from pydantic import BaseModel
 from backend.models.tools import Tool
+from backend.models.tools.runtime import run_sync, send_message
+from backend.models.cache import PersistentCache
+from backend.models.usage import percentile
 from dotenv import load_dotenv
 import chainlit as cl
 
@@ -10,29 +21,181 @@ load_dotenv()
 
 exa = Exa(api_key=os.environ.get("EXA_API_KEY"))
 
+# Results of identical (normalized) queries are reused for this long
+WEB_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", str(24 * 3600)))
 
-async def search_web_async(query: str) -> str:
-    print(f"Searching web for {query}")
-    search_results = "\n".join(
+
+def _search_cache_from_env() -> PersistentCache | None:
+    if os.getenv("WEB_SEARCH_CACHE", "0").lower() not in ("1", "true", "yes"):
+        return None
+    return PersistentCache(
+        path=os.path.join(os.getenv("LLM_CACHE_DIR", ".cache"), "web_search.sqlite"),
+        max_bytes=int(os.getenv("WEB_SEARCH_CACHE_MAX_MB", "64")) * 1024 * 1024,
+        ttl_seconds=WEB_SEARCH_CACHE_TTL_SECONDS,
+        name="web_search",
+    )
+
+
+# Optional on-disk cache of search results, enabled with WEB_SEARCH_CACHE=1
+search_cache: PersistentCache | None = _search_cache_from_env()
+
+# The Exa client is synchronous, so searches run here instead of on the event loop
+search_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("WEB_SEARCH_WORKERS", "4")), thread_name_prefix="web-search"
+)
+
+_STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "and", "to", "is", "are", "what", "how", "with", "by"
+}
+_TRACKING_PARAMS = re.compile(r"^(utm_.*|ref|ref_src|fbclid|gclid|mc_cid|mc_eid)$")
+
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+class SearchStats:
+    """Counters of the web search layer, and latencies of its upstream requests."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._latencies: deque[float] = deque(maxlen=window)
+
+    def record(self, field: str, latency: float | None = None) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            if latency is not None:
+                self._latencies.append(latency)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            lookups = self.hits + self.misses + self.coalesced
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "latency_ms_p50": percentile(latencies, 0.5) * 1000,
+            "latency_ms_p95": percentile(latencies, 0.95) * 1000,
+            "cache": search_cache.stats() if search_cache is not None else None,
+        }
+
+
+search_stats = SearchStats()
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so near-identical searches share a cache entry.
+
+    Case, punctuation, filler words and word order are ignored.
+    """
+    text = unicodedata.normalize("NFKC", query).lower()
+    words = re.findall(r"[\w$%+#.-]+", text)
+    words = {word.strip(".-") for word in words} - _STOPWORDS
+    return " ".join(sorted(word for word in words if word))
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    query = urlencode(
+        sorted((k, v) for k, v in parse_qsl(parts.query) if not _TRACKING_PARAMS.match(k))
+    )
+    return f"{host}{parts.path.rstrip('/')}" + (f"?{query}" if query else "")
+
+
+def dedupe_results(results: list[dict]) -> list[dict]:
+    """Drop results pointing at the same page, keeping the first occurrence."""
+    seen = set()
+    unique = []
+    for result in results:
+        key = normalize_url(result["url"])
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(result)
+    return unique
+
+
+def _run_search(query: str, key: str) -> list[dict]:
+    start = time.perf_counter()
+    try:
+        response = exa.search_and_contents(query=query, type="auto", highlights=True)
+    except Exception:
+        search_stats.record("errors")
+        raise
+    results = dedupe_results(
         [
-            f"{result.title}\n{result.url}\n{result.highlights}"
-            for result in exa.search_and_contents(
-                query=query, type="auto", highlights=True
-            ).results
+            {"title": result.title, "url": result.url, "highlights": result.highlights}
+            for result in response.results
         ]
     )
+    search_stats.record("misses", time.perf_counter() - start)
+    if search_cache is not None:
+        search_cache.set(key, json.dumps(results))
+    return results
+
+
+def search_future(query: str) -> Future:
+    """Start (or join) a search for `query` and return a future of its results.
+
+    Cached queries resolve immediately, and concurrent identical queries share
+    one in-flight request.
+    """
+    key = normalize_query(query) or query.strip().lower()
+    # Read outside the lock, so a slow disk never holds up other lookups
+    cached = search_cache.get(key) if search_cache is not None else None
+    if cached is not None:
+        search_stats.record("hits")
+        future = Future()
+        future.set_result(json.loads(cached))
+        return future
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            search_stats.record("coalesced")
+            return future
+
+        future = search_executor.submit(_run_search, query, key)
+        _inflight[key] = future
+
+    def forget(done: Future) -> None:
+        with _inflight_lock:
+            if _inflight.get(key) is done:
+                del _inflight[key]
+
+    future.add_done_callback(forget)
+    return future
+
+
+def format_results(results: list[dict]) -> str:
+    return "\n".join(
+        [f"{result['title']}\n{result['url']}\n{result['highlights']}" for result in results]
+    )
+
+
+async def search_web_async(query: str) -> str:
+    print(f"Searching web for {query}")
+    search_results = format_results(await asyncio.wrap_future(search_future(query)))
 
     search_results_element = cl.CustomElement(
         name="WebSearch",
         props={"args": {"query": query}, "response": search_results},
     )
 
-    await cl.Message(content="", elements=[search_results_element]).send()
+    await send_message(cl.Message(content="", elements=[search_results_element]))
 
     return search_results
 
 def search_web(query: str) -> str:
-    return asyncio.run(search_web_async(query)) 
+    return run_sync(search_web_async(query))
 
 
 class WebSearchArgs(BaseModel):
@@ -42,7 +205,7 @@ class WebSearchArgs(BaseModel):
 web_search_tool = Tool(
     name="web_search",
     description="Search the web for information",
-    function=search_web,
+    function=search_web_async,
     argument_schema=WebSearchArgs,
 )
 
@@ -50,3 +213,4 @@ if __name__ == "__main__":
     print(
         search_web("All soccer matches between 1990 and 1994 with brazilian referees")
     )
+    print(search_stats.snapshot())
@@ -0,0 +1,185 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, TypeVar
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+import dotenv
+
+dotenv.load_dotenv()
+
+T = TypeVar("T")
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "16"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "10"))
+# Long generations (e.g. the technical brief) can take minutes without streaming
+LLM_READ_TIMEOUT_SECONDS = float(os.getenv("LLM_READ_TIMEOUT_SECONDS", "300"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 520, 522, 524, 529}
+
+_limits = httpx.Limits(
+    max_connections=LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+)
+_timeout = httpx.Timeout(LLM_READ_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+
+class ProviderError(Exception):
+    """An error reported in the body of a 200 response, which OpenRouter uses
+    for failures of the upstream provider."""
+
+    def __init__(self, error: Any):
+        self.error = error
+        code = error.get("code") if isinstance(error, dict) else getattr(error, "code", None)
+        try:
+            self.status_code = int(code) if code is not None else None
+        except (TypeError, ValueError):
+            self.status_code = None
+        super().__init__(f"Provider returned an error: {error}")
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether retrying the request could succeed (rate limits, timeouts,
+    overloaded or failing upstreams), as opposed to a fatal error such as bad
+    credentials or an invalid request."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, ProviderError):
+        return error.status_code is None or error.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+
+
+def retry_after(error: BaseException) -> float | None:
+    """Seconds the server asked us to wait (`Retry-After`), if it said."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, error: BaseException | None = None) -> float:
+    """Full-jitter exponential backoff, or the server's `Retry-After` if given."""
+    requested = retry_after(error) if error is not None else None
+    if requested is not None:
+        return min(requested, LLM_BACKOFF_MAX_SECONDS)
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2**attempt))
+
+
+def _describe(error: BaseException) -> str:
+    status = getattr(error, "status_code", None)
+    return f"{type(error).__name__}" + (f" ({status})" if status else "")
+
+
+def with_retries(
+    request: Callable[[], T],
+    can_retry: Callable[[], bool] = lambda: True,
+    max_retries: int = LLM_MAX_RETRIES,
+) -> T:
+    """Call `request`, retrying retryable errors with backoff.
+
+    `can_retry` is checked before each retry (e.g. a stream that already
+    produced output must not be replayed). Fatal errors, and retryable ones
+    once the retries are used up, are raised unchanged.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return request()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e) or not can_retry():
+                raise
+            delay = backoff_delay(attempt, e)
+            print(
+                f"LLM request failed with {_describe(e)}, "
+                f"retrying in {delay:.1f}s ({attempt + 1}/{max_retries})"
+            )
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+async def with_retries_async(
+    request: Callable[[], Awaitable[T]],
+    can_retry: Callable[[], bool] = lambda: True,
+    max_retries: int = LLM_MAX_RETRIES,
+) -> T:
+    """Async counterpart of `with_retries`."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await request()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e) or not can_retry():
+                raise
+            delay = backoff_delay(attempt, e)
+            print(
+                f"LLM request failed with {_describe(e)}, "
+                f"retrying in {delay:.1f}s ({attempt + 1}/{max_retries})"
+            )
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+# Retries are ours (with Retry-After and logging), so the SDK's are disabled
+client = OpenAI(
+    base_url=OPENROUTER_BASE_URL,
+    api_key=os.getenv("OPENROUTER_API_KEY"),
+    max_retries=0,
+    timeout=_timeout,
+    http_client=httpx.Client(limits=_limits, timeout=_timeout),
+)
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_clients_lock = threading.Lock()
+
+
+def get_async_client() -> AsyncOpenAI:
+    """The pooled async client for the running event loop.
+
+    Async connections belong to the loop that opened them, so each loop
+    (the Chainlit loop, the shared tool loop) gets its own pool.
+    """
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        async_client = _async_clients.get(loop)
+        if async_client is None:
+            async_client = AsyncOpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=os.getenv("OPENROUTER_API_KEY"),
+                max_retries=0,
+                timeout=_timeout,
+                http_client=httpx.AsyncClient(limits=_limits, timeout=_timeout),
+            )
+            _async_clients[loop] = async_client
+        return async_client
@@ -0,0 +1,76 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+_USAGE_FIELDS = ("requests", "cache_hits", "prompt_tokens", "completion_tokens", "total_tokens")
+
+# Totals of the innermost `UsageTracker.scope()` of the current context
+_scope: ContextVar[dict[str, int] | None] = ContextVar("usage_scope", default=None)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """The value at fraction `p` of the sorted `values`, or 0.0 when there are none."""
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+class UsageTracker:
+    """Process-wide token usage per model, fed by every completion we make."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_model: dict[str, dict[str, int]] = {}
+
+    def _entry(self, model: str) -> dict[str, int]:
+        return self._by_model.setdefault(model, dict.fromkeys(_USAGE_FIELDS, 0))
+
+    @contextmanager
+    def scope(self) -> Iterator[dict[str, int]]:
+        """Also total the usage of requests made inside this block into the
+        yielded dict, including requests from threads and tasks started in it
+        (they run with a copy of the context), but not those of other sessions."""
+        totals = dict.fromkeys(_USAGE_FIELDS, 0)
+        token = _scope.set(totals)
+        try:
+            yield totals
+        finally:
+            _scope.reset(token)
+
+    def record(self, model: str, usage: Any | None) -> None:
+        """Add one request's `usage` (an OpenAI `CompletionUsage` or None)."""
+        scope = _scope.get()
+        with self._lock:
+            for entry in (self._entry(model), scope):
+                if entry is None:
+                    continue
+                entry["requests"] += 1
+                if usage is None:
+                    continue
+                entry["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                entry["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+                entry["total_tokens"] += getattr(usage, "total_tokens", 0) or 0
+
+    def record_cache_hit(self, model: str) -> None:
+        scope = _scope.get()
+        with self._lock:
+            self._entry(model)["cache_hits"] += 1
+            if scope is not None:
+                scope["cache_hits"] += 1
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        """Usage per model, plus a `total` entry."""
+        with self._lock:
+            result = {model: dict(entry) for model, entry in self._by_model.items()}
+        total: dict[str, int] = {}
+        for entry in result.values():
+            for field, value in entry.items():
+                total[field] = total.get(field, 0) + value
+        result["total"] = total
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._by_model.clear()
+
+
+usage_tracker = UsageTracker()
@@ -1,15 +1,11 @@
-from directory_tree import DisplayTree
+from backend.repo_index import get_loaded_index
+from backend.repo_tree import build_tree
 from typing import List, Union
 
 def create_orchestrator_plan(repo_path: str):
     """Create a tree representation of the repository structure."""
     try:
-        tree = DisplayTree(
-            dirPath=repo_path,
-            stringRep=True,
-            showHidden=False,
-            ignoreList = ".git"
-        )
+        tree = build_tree(repo_path, index=get_loaded_index(repo_path))
         return tree  
     except Exception as e:
         print(f"Error generating tree structure: {str(e)}")
@@ -0,0 +1,200 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Protocol, Tuple
+
+from backend.models.cache import stable_hash
+
+
+class CheckpointStore(Protocol):
+    def load(self, stage: str, key: str) -> Any | None: ...
+
+    def save(self, stage: str, key: str, path: Tuple[str, ...], value: Any) -> None: ...
+
+
+class Checkpoint:
+    """How a stage's result is persisted so a rerun can skip the stage.
+
+    Args:
+        path (tuple[str, ...]): Where the result goes in the store's document
+        config (Any): Everything besides the inputs that affects the result
+            (model, prompt, settings); changing it invalidates the checkpoint
+        dump (Callable): Turns the result into JSON-compatible data
+        load (Callable): Turns that data back into the result
+    """
+
+    def __init__(
+        self,
+        path: Tuple[str, ...],
+        config: Any = None,
+        dump: Callable[[Any], Any] = lambda result: result,
+        load: Callable[[Any], Any] = lambda data: data,
+    ):
+        self.path = path
+        self.config = config
+        self.dump = dump
+        self.load = load
+
+
+class Stage:
+    """A single step of a `Pipeline`.
+
+    `func` is an async callable that receives the results of its dependencies
+    as keyword arguments named after the dependency stages.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        deps: List[str] | None = None,
+        checkpoint: Checkpoint | None = None,
+    ):
+        self.name = name
+        self.func = func
+        self.deps = deps or []
+        self.checkpoint = checkpoint
+
+    def __str__(self) -> str:
+        return f"{self.name} <- {', '.join(self.deps) or '(inputs)'}"
+
+
+class Pipeline:
+    """A small dependency graph of async stages.
+
+    Every stage is started as soon as all of its dependencies have finished,
+    so independent branches of the graph run concurrently.
+
+    With a `store`, stages that have a `Checkpoint` are saved when they
+    finish and skipped on a later run whose inputs and config are unchanged.
+    A checkpoint's key covers the keys of the stage's dependencies, so any
+    change upstream invalidates everything downstream of it.
+
+    `on_stage`, if given, is called with ("started" | "finished" | "skipped",
+    stage name) as stages progress.
+    """
+
+    def __init__(
+        self,
+        on_stage: Callable[[str, str], None] | None = None,
+        store: CheckpointStore | None = None,
+    ) -> None:
+        self._stages: Dict[str, Stage] = {}
+        self.on_stage = on_stage
+        self.store = store
+
+    def add(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        deps: List[str] | None = None,
+        checkpoint: Checkpoint | None = None,
+    ) -> "Pipeline":
+        """Add a stage to the pipeline.
+
+        Args:
+            name (str): Unique name of the stage, also the keyword its result is passed as
+            func (Callable): Async function run with the results of `deps`
+            deps (list[str], optional): Stages (or pipeline inputs) this stage needs
+            checkpoint (Checkpoint, optional): How to persist the result in the pipeline's store
+        """
+        if name in self._stages:
+            raise ValueError(f"Stage '{name}' is already defined")
+        self._stages[name] = Stage(name, func, deps, checkpoint)
+        return self
+
+    def stage(self, name: str, deps: List[str] | None = None, checkpoint: Checkpoint | None = None):
+        """Decorator form of `add`."""
+
+        def decorator(func: Callable[..., Awaitable[Any]]):
+            self.add(name, func, deps, checkpoint)
+            return func
+
+        return decorator
+
+    def _check(self, inputs: Dict[str, Any]) -> None:
+        visiting: set[str] = set()
+        done: set[str] = set(inputs)
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name not in self._stages:
+                raise ValueError(f"Unknown stage or input '{name}'")
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage '{name}'")
+            visiting.add(name)
+            for dep in self._stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self._stages:
+            visit(name)
+
+    async def run(self, **inputs: Any) -> Dict[str, Any]:
+        """Run every stage and return a dict of all inputs and stage results.
+
+        If any stage fails, the remaining stages are cancelled and the error is raised.
+        """
+        self._check(inputs)
+
+        futures: Dict[str, asyncio.Future] = {}
+        # Identity of each value for checkpoint keys: a hash of the inputs, and
+        # of the stage name, config and dependency keys for checkpointed stages
+        keys: Dict[str, str] = {}
+        loop = asyncio.get_running_loop()
+        for name, value in inputs.items():
+            future = loop.create_future()
+            future.set_result(value)
+            futures[name] = future
+            keys[name] = stable_hash(value)
+
+        def notify(status: str, stage: Stage) -> None:
+            print(f"Pipeline stage {status}: {stage.name}")
+            if self.on_stage:
+                self.on_stage(status, stage.name)
+
+        async def run_stage(stage: Stage) -> Any:
+            kwargs = {dep: await get(dep) for dep in stage.deps}
+            checkpoint = stage.checkpoint if self.store is not None else None
+            if checkpoint is None:
+                notify("started", stage)
+                result = await stage.func(**kwargs)
+                keys[stage.name] = stable_hash(result)
+                notify("finished", stage)
+                return result
+
+            key = stable_hash(
+                {"stage": stage.name, "config": checkpoint.config, "deps": {dep: keys[dep] for dep in stage.deps}}
+            )
+            keys[stage.name] = key
+            saved = await asyncio.to_thread(self.store.load, stage.name, key)
+            if saved is not None:
+                try:
+                    result = checkpoint.load(saved)
+                except Exception as e:
+                    print(f"Discarding unreadable checkpoint of {stage.name}: {str(e)}")
+                else:
+                    notify("skipped", stage)
+                    return result
+
+            notify("started", stage)
+            result = await stage.func(**kwargs)
+            await asyncio.to_thread(self.store.save, stage.name, key, checkpoint.path, checkpoint.dump(result))
+            notify("finished", stage)
+            return result
+
+        def get(name: str) -> asyncio.Future:
+            if name not in futures:
+                futures[name] = asyncio.ensure_future(run_stage(self._stages[name]))
+            return futures[name]
+
+        tasks = [get(name) for name in self._stages]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,300 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import AsyncExitStack, ExitStack, contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from backend.repo_index import forget_index
+
+DATA_DIR = Path(os.getenv("PITCHIT_DATA_DIR", ".data"))
+WORKSPACES_DIR = DATA_DIR / "workspaces"
+LOCKS_DIR = DATA_DIR / ".locks"
+
+# Disk quota for all cached checkouts; least recently used ones are evicted beyond it
+WORKSPACE_QUOTA_BYTES = int(os.getenv("WORKSPACE_QUOTA_MB", "2048")) * 1024 * 1024
+# Workspaces used more recently than this are never evicted (they may still be in use)
+WORKSPACE_MIN_AGE_SECONDS = int(os.getenv("WORKSPACE_MIN_AGE_SECONDS", "3600"))
+# Shallow, blob-filtered clones unless explicitly disabled
+SHALLOW_CLONE = os.getenv("SHALLOW_CLONE", "1").lower() in ("1", "true", "yes")
+
+_thread_locks: dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+def normalize_repo_url(repo_url: str) -> str:
+    """Normalize the different spellings of a repository URL.
+
+    `git@github.com:Owner/Repo.git`, `https://github.com/Owner/Repo/` and
+    `https://github.com/owner/repo/tree/main` all map to
+    `https://github.com/owner/repo`.
+    """
+    url = repo_url.strip()
+    ssh_match = re.match(r"^git@([^:]+):(.+)$", url)
+    if ssh_match:
+        url = f"https://{ssh_match.group(1)}/{ssh_match.group(2)}"
+    url = re.sub(r"^http://", "https://", url)
+    url = url.rstrip("/")
+    if url.endswith(".git"):
+        url = url[: -len(".git")]
+
+    github_match = re.match(r"^https://(www\.)?github\.com/([^/]+)/([^/]+)", url, re.IGNORECASE)
+    if github_match:
+        url = f"https://github.com/{github_match.group(2)}/{github_match.group(3)}".lower()
+    return url
+
+
+def repo_key(repo_url: str) -> str:
+    """Filesystem-safe cache key for a repository URL."""
+    normalized = normalize_repo_url(repo_url)
+    slug = re.sub(r"[^a-zA-Z0-9_.-]+", "_", "_".join(normalized.split("/")[-2:]))
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:12]
+    return f"{slug}_{digest}"
+
+
+@contextmanager
+def workspace_lock(key: str, blocking: bool = True, shared: bool = False) -> Iterator[bool]:
+    """Lock on one workspace, across threads and processes.
+
+    Exclusive by default, for changing the checkout. `shared` locks are held
+    by readers of the checkout and only exclude exclusive ones. Yields False
+    (without locking) when `blocking` is False and the lock is taken.
+    """
+    thread_lock = None
+    if not shared:
+        with _thread_locks_guard:
+            thread_lock = _thread_locks.setdefault(key, threading.Lock())
+        if not thread_lock.acquire(blocking=blocking):
+            yield False
+            return
+    try:
+        os.makedirs(LOCKS_DIR, exist_ok=True)
+        # Each holder opens its own file, so flock also orders threads of this process
+        with open(LOCKS_DIR / f"{key}.lock", "w") as lock_file:
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        if thread_lock is not None:
+            thread_lock.release()
+
+
+def _git(args: list[str], cwd: str | Path | None = None) -> str:
+    result = subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    )
+    return result.stdout.strip()
+
+
+def resolve_remote_commit(repo_url: str) -> str | None:
+    """Commit the remote's HEAD points to, or None if it cannot be resolved."""
+    try:
+        output = _git(["ls-remote", repo_url, "HEAD"])
+    except subprocess.CalledProcessError as e:
+        print(f"Failed to resolve remote HEAD for {repo_url}: {e.stderr}")
+        return None
+    return output.split()[0] if output else None
+
+
+def local_commit(repo_path: str | Path) -> str | None:
+    try:
+        return _git(["rev-parse", "HEAD"], cwd=repo_path)
+    except subprocess.CalledProcessError:
+        return None
+
+
+def _clone(repo_url: str, target: Path, shallow: bool) -> None:
+    args = ["clone", "--no-tags", "--single-branch"]
+    if shallow:
+        args += ["--depth", "1", "--filter=blob:none"]
+    # Clone next to the target and rename, so a half-finished clone is never visible
+    tmp_dir = target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        _git([*args, repo_url, str(tmp_dir)])
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(tmp_dir, target)
+    finally:
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _refresh(repo_path: Path, shallow: bool) -> None:
+    fetch_args = ["fetch", "--no-tags", "origin", "HEAD"]
+    if shallow:
+        fetch_args[1:1] = ["--depth", "1", "--filter=blob:none"]
+    _git(fetch_args, cwd=repo_path)
+    _git(["reset", "--hard", "FETCH_HEAD"], cwd=repo_path)
+    _git(["clean", "-fdx"], cwd=repo_path)
+
+
+def _directory_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _metadata_path(key: str) -> Path:
+    return WORKSPACES_DIR / f"{key}.json"
+
+
+def _read_metadata(key: str) -> dict:
+    try:
+        with open(_metadata_path(key), "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _write_metadata(key: str, metadata: dict) -> None:
+    tmp_path = _metadata_path(key).with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f)
+    os.replace(tmp_path, _metadata_path(key))
+
+
+def _update(repo_url: str, repo_path: Path, remote_commit: str | None, shallow: bool) -> str:
+    """Bring the workspace to the remote's HEAD. Call with the workspace locked exclusively."""
+    if not (repo_path / ".git").exists():
+        _clone(repo_url, repo_path, shallow)
+        return "cloned"
+    if remote_commit is not None and remote_commit == local_commit(repo_path):
+        # Another checkout got there first
+        return "hit"
+    try:
+        _refresh(repo_path, shallow)
+        return "refreshed"
+    except subprocess.CalledProcessError as e:
+        print(f"Failed to refresh {repo_path}, re-cloning: {e.stderr}")
+        _clone(repo_url, repo_path, shallow)
+        return "cloned"
+
+
+def checkout_repo(repo_url: str, shallow: bool = SHALLOW_CLONE, leases: ExitStack | AsyncExitStack | None = None) -> dict:
+    """Return an up-to-date cached checkout of `repo_url`, cloning only when needed.
+
+    An existing workspace is reused as-is when it is already at the remote's
+    HEAD commit, and refreshed with a fetch otherwise. A refresh waits until
+    no one holds the workspace.
+
+    With `leases`, a shared lock on the workspace is entered into it, so no
+    other checkout moves the workspace to another commit until `leases` is
+    closed. Pitches hold it for their whole run.
+
+    Returns:
+        dict: `repo_path`, `commit`, `normalized_url` and `cache_status`
+        (`hit`, `refreshed` or `cloned`)
+    """
+    key = repo_key(repo_url)
+    repo_path = WORKSPACES_DIR / key
+    os.makedirs(WORKSPACES_DIR, exist_ok=True)
+
+    remote_commit = resolve_remote_commit(repo_url)
+    cache_status = None
+    lease = ExitStack()
+    try:
+        while True:
+            lease.enter_context(workspace_lock(key, shared=True))
+            commit = local_commit(repo_path) if (repo_path / ".git").exists() else None
+            if commit is not None and commit == remote_commit:
+                break
+            # Readers of the current commit finish before the workspace moves
+            lease.close()
+            with workspace_lock(key):
+                cache_status = _update(repo_url, repo_path, remote_commit, shallow)
+                remote_commit = local_commit(repo_path)
+            # Checked again under the shared lock, in case another checkout moved it since
+
+        cache_status = cache_status or "hit"
+        metadata = _read_metadata(key)
+        if cache_status != "hit" or "size_bytes" not in metadata:
+            metadata["size_bytes"] = _directory_size(repo_path)
+        metadata.update(
+            {
+                "url": normalize_repo_url(repo_url),
+                "commit": commit,
+                "last_used": time.time(),
+            }
+        )
+        _write_metadata(key, metadata)
+    except BaseException:
+        lease.close()
+        raise
+    if leases is not None:
+        leases.enter_context(lease)
+    else:
+        lease.close()
+
+    print(f"Repository {repo_url} at {commit} ({cache_status}) in {repo_path}")
+    evict_workspaces(keep={key})
+
+    return {
+        "repo_path": str(repo_path),
+        "commit": commit,
+        "normalized_url": normalize_repo_url(repo_url),
+        "cache_status": cache_status,
+    }
+
+
+def evict_workspaces(
+    quota_bytes: int = WORKSPACE_QUOTA_BYTES, keep: set[str] | None = None
+) -> list[str]:
+    """Delete least recently used workspaces until the total fits in `quota_bytes`.
+
+    Workspaces in `keep`, used within `WORKSPACE_MIN_AGE_SECONDS`, or locked by
+    another session (including one holding a lease on it) are skipped.
+
+    Returns:
+        list[str]: Keys of the evicted workspaces
+    """
+    keep = keep or set()
+    if not WORKSPACES_DIR.exists():
+        return []
+
+    workspaces = []
+    for metadata_file in WORKSPACES_DIR.glob("*.json"):
+        key = metadata_file.stem
+        metadata = _read_metadata(key)
+        workspaces.append((metadata.get("last_used", 0), key, metadata.get("size_bytes", 0)))
+
+    total = sum(size for _, _, size in workspaces)
+    evicted = []
+    now = time.time()
+    for last_used, key, size in sorted(workspaces):
+        if total <= quota_bytes:
+            break
+        if key in keep or now - last_used < WORKSPACE_MIN_AGE_SECONDS:
+            continue
+        with workspace_lock(key, blocking=False) as locked:
+            if not locked:
+                continue
+            shutil.rmtree(WORKSPACES_DIR / key, ignore_errors=True)
+            forget_index(str(WORKSPACES_DIR / key))
+            (WORKSPACES_DIR / f"{key}.index.sqlite").unlink(missing_ok=True)
+            _metadata_path(key).unlink(missing_ok=True)
+        total -= size
+        evicted.append(key)
+        print(f"Evicted workspace {key} ({size / 1024 / 1024:.1f} MB)")
+
+    return evicted
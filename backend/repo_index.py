@@ -0,0 +1,353 @@
+import hashlib
+import os
+import sqlite3
+import subprocess
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, NamedTuple
+
+from backend.repo_tree import SKIPPED_DIRS, format_size, is_skipped_path
+
+# Bytes inspected to decide whether a file is binary
+BINARY_SNIFF_BYTES = 8192
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "8"))
+
+LANGUAGES_BY_EXTENSION = {
+    ".py": "Python", ".pyi": "Python", ".ipynb": "Jupyter Notebook",
+    ".js": "JavaScript", ".jsx": "JavaScript", ".mjs": "JavaScript", ".cjs": "JavaScript",
+    ".ts": "TypeScript", ".tsx": "TypeScript",
+    ".java": "Java", ".kt": "Kotlin", ".kts": "Kotlin", ".scala": "Scala",
+    ".go": "Go", ".rs": "Rust", ".rb": "Ruby", ".php": "PHP", ".swift": "Swift",
+    ".c": "C", ".h": "C", ".cc": "C++", ".cpp": "C++", ".cxx": "C++", ".hpp": "C++",
+    ".cs": "C#", ".m": "Objective-C", ".mm": "Objective-C", ".dart": "Dart",
+    ".lua": "Lua", ".r": "R", ".jl": "Julia", ".ex": "Elixir", ".exs": "Elixir",
+    ".erl": "Erlang", ".hs": "Haskell", ".clj": "Clojure", ".elm": "Elm",
+    ".sh": "Shell", ".bash": "Shell", ".zsh": "Shell", ".ps1": "PowerShell",
+    ".sql": "SQL", ".html": "HTML", ".htm": "HTML", ".css": "CSS", ".scss": "SCSS",
+    ".sass": "SCSS", ".less": "Less", ".vue": "Vue", ".svelte": "Svelte",
+    ".md": "Markdown", ".mdx": "Markdown", ".rst": "reStructuredText", ".txt": "Text",
+    ".json": "JSON", ".yaml": "YAML", ".yml": "YAML", ".toml": "TOML", ".xml": "XML",
+    ".ini": "INI", ".cfg": "INI", ".proto": "Protocol Buffers", ".graphql": "GraphQL",
+    ".tf": "HCL", ".sol": "Solidity", ".zig": "Zig", ".nim": "Nim",
+}
+
+LANGUAGES_BY_NAME = {
+    "Dockerfile": "Dockerfile", "Makefile": "Makefile", "CMakeLists.txt": "CMake",
+    "Gemfile": "Ruby", "Rakefile": "Ruby", "Jenkinsfile": "Groovy",
+}
+
+# Languages that describe docs/config rather than code, left out of the headline stats
+NON_CODE_LANGUAGES = {"Markdown", "reStructuredText", "Text", "JSON", "YAML", "TOML", "XML", "INI"}
+
+
+def detect_language(path: str) -> str:
+    name = os.path.basename(path)
+    if name in LANGUAGES_BY_NAME:
+        return LANGUAGES_BY_NAME[name]
+    return LANGUAGES_BY_EXTENSION.get(os.path.splitext(name)[1].lower(), "Other")
+
+
+class FileInfo(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    language: str
+    lines: int
+    binary: bool
+    content_hash: str
+
+
+def _inspect_file(full_path: str, compute_hash: bool) -> tuple[int, bool, str]:
+    """Count lines, sniff for binary content and optionally hash a file."""
+    lines = 0
+    binary = False
+    digest = hashlib.sha1() if compute_hash else None
+    with open(full_path, "rb") as f:
+        first = True
+        while chunk := f.read(1024 * 1024):
+            if first:
+                binary = b"\0" in chunk[:BINARY_SNIFF_BYTES]
+                first = False
+            lines += chunk.count(b"\n")
+            if digest is not None:
+                digest.update(chunk)
+    return (0 if binary else lines), binary, (digest.hexdigest() if digest else "")
+
+
+def index_path(repo_path: str) -> str:
+    """Where the index of `repo_path` is stored (next to the workspace)."""
+    return f"{os.path.normpath(os.path.abspath(repo_path))}.index.sqlite"
+
+
+def _tracked_files(repo_path: str) -> list[tuple[str, str]] | None:
+    """`(path, blob_hash)` for every tracked regular file, or None outside git."""
+    try:
+        output = subprocess.run(
+            ["git", "ls-files", "-s", "-z"],
+            cwd=repo_path,
+            check=True,
+            capture_output=True,
+        ).stdout.decode("utf-8", errors="surrogateescape")
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+    files = []
+    for record in output.split("\0"):
+        if not record:
+            continue
+        meta, path = record.split("\t", 1)
+        mode, blob_hash, _ = meta.split(" ")
+        # Skip symlinks (120000) and submodules (160000)
+        if mode.startswith("100"):
+            files.append((path, blob_hash))
+    return files
+
+
+def _walked_files(repo_path: str) -> list[tuple[str, str]]:
+    files = []
+    for root, dirs, names in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if d not in SKIPPED_DIRS]
+        for name in names:
+            full = os.path.join(root, name)
+            if os.path.isfile(full) and not os.path.islink(full):
+                files.append((os.path.relpath(full, repo_path).replace(os.sep, "/"), ""))
+    return files
+
+
+class RepoIndex:
+    """Metadata for every tracked file of a checkout, built once per commit.
+
+    Columns are kept in flat arrays (one slot per file) so large repositories
+    stay compact in memory; directory listings are precomputed.
+    """
+
+    def __init__(self, repo_path: str, commit: str | None, rows: list[FileInfo]):
+        self.repo_path = repo_path
+        self.commit = commit
+        rows = sorted(rows, key=lambda row: row.path)
+
+        self.paths: list[str] = [row.path for row in rows]
+        self.sizes = array("q", (row.size for row in rows))
+        self.mtimes = array("d", (row.mtime for row in rows))
+        self.languages: list[str] = sorted({row.language for row in rows})
+        language_ids = {language: i for i, language in enumerate(self.languages)}
+        self.language_ids = array("H", (language_ids[row.language] for row in rows))
+        self.line_counts = array("Q", (row.lines for row in rows))
+        self.binary = array("b", (row.binary for row in rows))
+        self.hashes: list[str] = [row.content_hash for row in rows]
+
+        self._rows = {path: i for i, path in enumerate(self.paths)}
+        self._dirs: dict[str, tuple[set[str], list[str]]] = {"": (set(), [])}
+        for path in self.paths:
+            parent = ""
+            parts = path.split("/")
+            for part in parts[:-1]:
+                current = f"{parent}/{part}" if parent else part
+                self._dirs.setdefault(current, (set(), []))
+                self._dirs[parent][0].add(part)
+                parent = current
+            self._dirs[parent][1].append(parts[-1])
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _row(self, i: int) -> FileInfo:
+        return FileInfo(
+            path=self.paths[i],
+            size=self.sizes[i],
+            mtime=self.mtimes[i],
+            language=self.languages[self.language_ids[i]],
+            lines=self.line_counts[i],
+            binary=bool(self.binary[i]),
+            content_hash=self.hashes[i],
+        )
+
+    def __iter__(self) -> Iterator[FileInfo]:
+        for i in range(len(self.paths)):
+            yield self._row(i)
+
+    @staticmethod
+    def normalize(rel_path: str) -> str:
+        rel_path = os.path.normpath(rel_path).replace(os.sep, "/")
+        return "" if rel_path == "." else rel_path.strip("/")
+
+    def get(self, rel_path: str) -> FileInfo | None:
+        i = self._rows.get(self.normalize(rel_path))
+        return None if i is None else self._row(i)
+
+    def is_dir(self, rel_path: str) -> bool:
+        return self.normalize(rel_path) in self._dirs
+
+    def is_file(self, rel_path: str) -> bool:
+        return self.normalize(rel_path) in self._rows
+
+    def list_dir(self, rel_path: str) -> tuple[list[str], list[str]] | None:
+        """Sorted `(directories, files)` directly under `rel_path`, or None if unknown."""
+        entry = self._dirs.get(self.normalize(rel_path))
+        if entry is None:
+            return None
+        return sorted(entry[0]), sorted(entry[1])
+
+    def iter_sizes(self) -> Iterator[tuple[str, int]]:
+        return zip(self.paths, self.sizes)
+
+    def language_stats(self) -> list[tuple[str, int, int, int]]:
+        """`(language, files, lines, bytes)` per language, largest by lines first."""
+        totals: dict[int, list[int]] = {}
+        for i in range(len(self.paths)):
+            if self.binary[i] or is_skipped_path(self.paths[i]):
+                continue
+            total = totals.setdefault(self.language_ids[i], [0, 0, 0])
+            total[0] += 1
+            total[1] += self.line_counts[i]
+            total[2] += self.sizes[i]
+        stats = [
+            (self.languages[language_id], files, lines, size)
+            for language_id, (files, lines, size) in totals.items()
+        ]
+        return sorted(stats, key=lambda stat: (stat[2], stat[1]), reverse=True)
+
+    def summary(self, max_languages: int = 8) -> str:
+        """Short human/LLM-readable overview of the repository."""
+        stats = self.language_stats()
+        code = [stat for stat in stats if stat[0] not in NON_CODE_LANGUAGES and stat[0] != "Other"]
+        code_lines = sum(stat[2] for stat in code) or 1
+        lines = [
+            f"{len(self.paths)} tracked files, {format_size(sum(self.sizes))}, "
+            f"{sum(stat[2] for stat in stats)} lines of text"
+        ]
+        for language, files, line_count, size in (code or stats)[:max_languages]:
+            share = f", {100 * line_count / code_lines:.0f}% of code" if code else ""
+            lines.append(f"- {language}: {files} files, {line_count} lines{share}")
+        return "\n".join(lines)
+
+    def save(self) -> None:
+        path = index_path(self.repo_path)
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                "language TEXT, lines INTEGER, binary INTEGER, content_hash TEXT)"
+            )
+            conn.execute("INSERT INTO meta VALUES ('commit', ?)", (self.commit or "",))
+            conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", list(self))
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(repo_path: str) -> "RepoIndex | None":
+        path = index_path(repo_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            conn = sqlite3.connect(path)
+            try:
+                commit_row = conn.execute("SELECT value FROM meta WHERE key = 'commit'").fetchone()
+                rows = [
+                    FileInfo(p, size, mtime, language, lines, bool(binary), content_hash)
+                    for p, size, mtime, language, lines, binary, content_hash in conn.execute(
+                        "SELECT path, size, mtime, language, lines, binary, content_hash FROM files"
+                    )
+                ]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Ignoring unreadable index {path}: {str(e)}")
+            return None
+        return RepoIndex(repo_path, (commit_row[0] if commit_row else "") or None, rows)
+
+    @staticmethod
+    def build(repo_path: str, commit: str | None, previous: "RepoIndex | None" = None) -> "RepoIndex":
+        """Index every tracked file, reusing rows of `previous` whose content is unchanged."""
+        tracked = _tracked_files(repo_path)
+        from_git = tracked is not None
+        files = tracked if from_git else _walked_files(repo_path)
+
+        reusable: dict[tuple[str, str], FileInfo] = {}
+        if previous is not None and from_git:
+            reusable = {(row.path, row.content_hash): row for row in previous if row.content_hash}
+
+        def index_file(item: tuple[str, str]) -> FileInfo | None:
+            path, blob_hash = item
+            full_path = os.path.join(repo_path, path)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                return None
+            reused = reusable.get((path, blob_hash))
+            if reused is not None and reused.size == stat.st_size:
+                return reused._replace(mtime=stat.st_mtime)
+            try:
+                lines, binary, digest = _inspect_file(full_path, compute_hash=not from_git)
+            except OSError:
+                return None
+            return FileInfo(
+                path=path,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                language=detect_language(path),
+                lines=lines,
+                binary=binary,
+                content_hash=blob_hash or digest,
+            )
+
+        with ThreadPoolExecutor(max_workers=INDEX_WORKERS) as executor:
+            rows = [row for row in executor.map(index_file, files) if row is not None]
+
+        return RepoIndex(repo_path, commit, rows)
+
+
+_loaded: dict[str, RepoIndex] = {}
+# One lock per repository, so indexing one repository never holds up another
+_build_locks: dict[str, threading.Lock] = {}
+_loaded_lock = threading.Lock()
+
+
+def load_index(repo_path: str, commit: str | None = None) -> RepoIndex:
+    """Return the index of `repo_path` at `commit`, building or refreshing it if needed.
+
+    A saved index for the same commit is reloaded from disk without touching
+    the files; otherwise only files whose content changed are re-read.
+    """
+    key = os.path.realpath(repo_path)
+    with _loaded_lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+
+    with build_lock:
+        index = _loaded.get(key)
+        if index is not None and commit is not None and index.commit == commit:
+            return index
+
+        stored = RepoIndex.load(repo_path)
+        if stored is not None and commit is not None and stored.commit == commit:
+            index = stored
+        else:
+            index = RepoIndex.build(repo_path, commit, previous=stored or index)
+            try:
+                index.save()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Failed to save index for {repo_path}: {str(e)}")
+            print(f"Indexed {len(index)} files in {repo_path}")
+
+        _loaded[key] = index
+        return index
+
+
+def get_loaded_index(repo_path: str) -> RepoIndex | None:
+    """The index already loaded for `repo_path`, without building one."""
+    return _loaded.get(os.path.realpath(repo_path))
+
+
+def forget_index(repo_path: str) -> None:
+    """Drop the loaded index of `repo_path`, e.g. once its checkout is deleted."""
+    key = os.path.realpath(repo_path)
+    with _loaded_lock:
+        _loaded.pop(key, None)
+        _build_locks.pop(key, None)
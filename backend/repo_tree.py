@@ -0,0 +1,345 @@
+import os
+import re
+from typing import Iterable, List
+
+# Directories that hold vendored, generated or tooling files rather than project source
+SKIPPED_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "bower_components", "vendor", "third_party",
+    "__pycache__", ".venv", "venv", ".tox", ".nox", ".mypy_cache", ".pytest_cache",
+    ".ruff_cache", "dist", "build", "target", ".next", ".nuxt", ".gradle", "coverage",
+    "Pods", "DerivedData", ".idea", ".vscode", ".cache", ".data",
+}
+
+# Extensions of binary or generated files that say nothing useful about the code
+SKIPPED_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".icns", ".webp", ".tiff", ".psd",
+    ".mp3", ".mp4", ".wav", ".ogg", ".mov", ".avi", ".webm", ".flac",
+    ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".zip", ".tar", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".jar", ".war",
+    ".pyc", ".pyo", ".so", ".dll", ".dylib", ".exe", ".o", ".a", ".lib", ".class",
+    ".wasm", ".bin", ".dat", ".db", ".sqlite", ".pkl", ".npy", ".npz", ".pt", ".onnx",
+    ".pdf", ".map",
+}
+
+SKIPPED_SUFFIXES = (".min.js", ".min.css", ".bundle.js")
+
+# Lockfiles: shown in the tree, but too large and too mechanical to read
+GENERATED_FILES = {
+    "uv.lock", "poetry.lock", "pdm.lock", "Pipfile.lock", "package-lock.json",
+    "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb", "Cargo.lock",
+    "go.sum", "composer.lock", "Gemfile.lock", "mix.lock", "flake.lock",
+}
+
+DEFAULT_MAX_DEPTH = int(os.getenv("TREE_MAX_DEPTH", "6"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("TREE_MAX_ENTRIES", "40"))
+DEFAULT_TOKEN_BUDGET = int(os.getenv("TREE_TOKEN_BUDGET", "4000"))
+
+
+def format_size(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def is_skipped_file(name: str) -> bool:
+    lower = name.lower()
+    return os.path.splitext(lower)[1] in SKIPPED_EXTENSIONS or lower.endswith(SKIPPED_SUFFIXES)
+
+
+def is_generated_file(rel_path: str) -> bool:
+    """Whether a repository-relative path is a lockfile or similar generated file."""
+    return rel_path.rsplit("/", 1)[-1] in GENERATED_FILES
+
+
+def is_skipped_path(rel_path: str, include_hidden: bool = False) -> bool:
+    """Whether a repository-relative file path falls under the skip lists."""
+    parts = rel_path.split("/")
+    for part in parts[:-1]:
+        if part in SKIPPED_DIRS or (part.startswith(".") and not include_hidden):
+            return True
+    name = parts[-1]
+    return is_skipped_file(name) or (name.startswith(".") and not include_hidden)
+
+
+def _translate_pattern(pattern: str) -> str:
+    """Translate the glob part of a .gitignore pattern to a regex."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "*":
+            if pattern[i : i + 3] == "**/":
+                regex += "(?:.*/)?"
+                i += 3
+                continue
+            if pattern[i : i + 2] == "**":
+                regex += ".*"
+                i += 2
+                continue
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex += f"[{body}]"
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+
+class IgnoreRules:
+    """Matcher for .gitignore files.
+
+    Rules are evaluated in order and the last matching rule wins, so `!`
+    negations work as in git. Each rule only applies below the directory of
+    the .gitignore it came from.
+    """
+
+    def __init__(self) -> None:
+        self._rules: List[tuple[str, re.Pattern, bool, bool]] = []
+
+    def add_patterns(self, lines: Iterable[str], base: str = "") -> None:
+        """Add .gitignore lines whose paths are relative to `base`."""
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            line = line.lstrip("/")
+            prefix = "" if anchored else "(?:.*/)?"
+            regex = re.compile(f"^{prefix}{_translate_pattern(line)}$")
+            self._rules.append((base, regex, negate, dir_only))
+
+    def add_file(self, path: str, base: str = "") -> None:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                self.add_patterns(f.readlines(), base)
+        except OSError:
+            pass
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        ignored = False
+        for base, regex, negate, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel_path.startswith(base + "/"):
+                    continue
+                candidate = rel_path[len(base) + 1 :]
+            else:
+                candidate = rel_path
+            if regex.match(candidate):
+                ignored = not negate
+        return ignored
+
+
+class TreeNode:
+    """A file or directory in the rendered repository tree."""
+
+    def __init__(self, name: str, is_dir: bool, size: int = 0):
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.children: List["TreeNode"] = []
+        # Recursive totals; for directories that were not fully scanned these are
+        # still accurate and are what collapsed summaries report
+        self.file_count = 0 if is_dir else 1
+        self.total_size = size
+
+    def add(self, child: "TreeNode") -> None:
+        self.children.append(child)
+        self.file_count += child.file_count
+        self.total_size += child.total_size
+
+    def summary(self) -> str:
+        return f"{self.file_count} files, {format_size(self.total_size)}"
+
+
+def scan_tree(repo_path: str, include_hidden: bool = False) -> TreeNode:
+    """Scan `repo_path` with `os.scandir`, honouring .gitignore and skip lists."""
+    rules = IgnoreRules()
+    rules.add_file(os.path.join(repo_path, ".gitignore"))
+
+    def scan(path: str, rel_path: str, name: str) -> TreeNode:
+        node = TreeNode(name, is_dir=True)
+        if rel_path:
+            rules.add_file(os.path.join(path, ".gitignore"), rel_path)
+        try:
+            entries = list(os.scandir(path))
+        except OSError as e:
+            print(f"Error scanning {path}: {str(e)}")
+            return node
+
+        for entry in entries:
+            if entry.name.startswith(".") and not include_hidden:
+                continue
+            child_rel = f"{rel_path}/{entry.name}" if rel_path else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if entry.name in SKIPPED_DIRS or rules.is_ignored(child_rel, True):
+                    continue
+                node.add(scan(entry.path, child_rel, entry.name))
+            else:
+                if is_skipped_file(entry.name) or rules.is_ignored(child_rel, False):
+                    continue
+                try:
+                    size = entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    size = 0
+                node.add(TreeNode(entry.name, is_dir=False, size=size))
+
+        node.children.sort(key=lambda child: (not child.is_dir, child.name.lower()))
+        return node
+
+    return scan(repo_path, "", os.path.basename(os.path.abspath(repo_path)))
+
+
+def tree_from_files(name: str, files: Iterable[tuple[str, int]]) -> TreeNode:
+    """Build a tree from `(relative_path, size)` pairs, e.g. from a repository index.
+
+    Paths are expected to be pre-filtered (tracked files already honour .gitignore);
+    the vendored/generated/binary skip lists are still applied.
+    """
+    root = TreeNode(name, is_dir=True)
+    # Build the directory skeleton first, then accumulate totals bottom-up
+    directories: dict[str, TreeNode] = {"": root}
+    parents: dict[str, str] = {}
+    leaves: list[tuple[str, TreeNode]] = []
+    for path, size in files:
+        if is_skipped_path(path):
+            continue
+        parent = ""
+        parts = path.split("/")
+        for part in parts[:-1]:
+            current = f"{parent}/{part}" if parent else part
+            if current not in directories:
+                directories[current] = TreeNode(part, is_dir=True)
+                parents[current] = parent
+            parent = current
+        leaves.append((parent, TreeNode(parts[-1], is_dir=False, size=size)))
+
+    for parent, leaf in leaves:
+        directories[parent].children.append(leaf)
+    # Deepest directories first, so children are complete before they are added
+    for path in sorted(parents, key=lambda p: p.count("/"), reverse=True):
+        node = directories[path]
+        node.file_count = sum(child.file_count for child in node.children)
+        node.total_size = sum(child.total_size for child in node.children)
+        directories[parents[path]].children.append(node)
+
+    for node in directories.values():
+        node.children.sort(key=lambda child: (not child.is_dir, child.name.lower()))
+    root.file_count = sum(child.file_count for child in root.children)
+    root.total_size = sum(child.total_size for child in root.children)
+    return root
+
+
+def render_tree(root: TreeNode, max_depth: int, max_entries: int) -> str:
+    """Render `root` as an indented tree.
+
+    Directories deeper than `max_depth` and entries beyond `max_entries` per
+    directory are collapsed into "N files, X MB" summaries.
+    """
+    lines = [f"{root.name}/ ({root.summary()})"]
+
+    def render(node: TreeNode, prefix: str, depth: int) -> None:
+        children = node.children
+        hidden: List[TreeNode] = []
+        if len(children) > max_entries:
+            children, hidden = children[:max_entries], children[max_entries:]
+
+        for index, child in enumerate(children):
+            last = index == len(children) - 1 and not hidden
+            connector = "└── " if last else "├── "
+            if not child.is_dir:
+                lines.append(f"{prefix}{connector}{child.name}")
+                continue
+            if depth >= max_depth or not child.children:
+                lines.append(f"{prefix}{connector}{child.name}/ ({child.summary()})")
+                continue
+            lines.append(f"{prefix}{connector}{child.name}/")
+            render(child, prefix + ("    " if last else "│   "), depth + 1)
+
+        if hidden:
+            hidden_files = sum(child.file_count for child in hidden)
+            hidden_size = sum(child.total_size for child in hidden)
+            lines.append(
+                f"{prefix}└── ... {len(hidden)} more entries ({hidden_files} files, {format_size(hidden_size)})"
+            )
+
+    render(root, "", 1)
+    return "\n".join(lines)
+
+
+def fit_tree(
+    root: TreeNode,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> str:
+    """Render `root`, shrinking depth and then entry counts until it fits `token_budget`."""
+    depth, entries = max_depth, max_entries
+    tree = render_tree(root, depth, entries)
+    while estimate_tokens(tree) > token_budget and (depth > 1 or entries > 5):
+        if depth > 1:
+            depth -= 1
+        else:
+            entries = max(5, entries // 2)
+        tree = render_tree(root, depth, entries)
+    return tree
+
+
+def build_tree(
+    repo_path: str,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    index=None,
+) -> str:
+    """Build a compact, token-budgeted tree of the repository at `repo_path`.
+
+    Args:
+        repo_path (str): Root of the repository
+        max_depth (int): Deepest directory level rendered before collapsing
+        max_entries (int): Maximum entries rendered per directory
+        token_budget (int): Approximate token budget for the rendered tree
+        index (RepoIndex, optional): Build from this index instead of scanning the disk
+
+    Returns:
+        str: The rendered tree
+    """
+    if index is not None:
+        name = os.path.basename(os.path.abspath(repo_path))
+        root = tree_from_files(name, index.iter_sizes())
+    else:
+        root = scan_tree(repo_path)
+    return fit_tree(root, max_depth, max_entries, token_budget)
@@ -1,6 +1,9 @@
 from backend.models import Agent, tool_registry, llm_call
+from backend.models.llms import TokenCallback
+from backend.models.structured import get_codec
+from backend.models.tools.runtime import run_sync
 from pydantic import BaseModel
-from typing import List
+from typing import Callable, List
 
 market_research_system_prompt = """
 You are an expert market research agent with access to a web search tool. Your task is to gather and summarize key market information for a given product.
@@ -45,7 +48,13 @@ class MarketResearch(BaseModel):
     market_growth: str
     competitors: List[Competitor]
 
-def market_research(description: str) -> MarketResearch:
+def market_research(
+    description: str,
+    on_token: TokenCallback | None = None,
+    on_snapshot: Callable[[dict], None] | None = None,
+) -> MarketResearch:
+    """Research the product's market. `on_token` receives the research agent's
+    notes as they stream, `on_snapshot` the partially parsed MarketResearch."""
     search_agent: Agent = Agent(
         name="Market Research",
         system_prompt=market_research_system_prompt,
@@ -53,12 +62,14 @@ def market_research(description: str) -> MarketResearch:
         tools=[tool_registry.get_tool("web_search")]
     )
 
-    unstructured_response = search_agent.call_with_tools(f"Here is the description of the product: <product_description>{description}</product_description> Please begin your research now.")
+    # Async tool loop so the several web searches of a single turn run concurrently
+    unstructured_response = run_sync(search_agent.call_with_tools_async(f"Here is the description of the product: <product_description>{description}</product_description> Please begin your research now.", on_token=on_token))
 
     final_response = llm_call(
         prompt=f"Parse the following data into a MarketResearch object: {unstructured_response}",
         system_prompt="You are a market research agent that can parse detailed data into a MarketResearch object.",
-        response_format=MarketResearch
+        response_format=MarketResearch,
+        on_token=get_codec(MarketResearch).partial_stream(on_snapshot) if on_snapshot else None,
     )
 
     return final_response
@@ -1,37 +1,59 @@
-import asyncio
+import contextvars
 import json
 import os
 import subprocess
-from typing import List
-import uuid
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import AsyncExitStack, ExitStack
+from typing import Callable, Dict, List, NamedTuple
 from pathlib import Path
 from pydantic import BaseModel
-from directory_tree import DisplayTree
 
+from backend.incremental import resolve_branch_path
 from backend.models.agents import Agent
 from backend.models.agents import AgentConfig
-from backend.models.llms import llm_call
+from backend.models.cache import stable_hash
+from backend.models.llms import llm_call, num_tokens_from_messages, text_model
+from backend.models.structured import get_codec
 from backend.models.tools import tool_registry
-from backend.models.tools.file_traversal import set_current_path
+from backend.models.tools.batch_read import format_file_batch, read_file_batch
+from backend.models.tools.file_traversal import get_workspace, set_current_path
+from backend.models.tools.runtime import run_sync, send_message
+from backend.models.usage import percentile
+from backend.repo_cache import checkout_repo
+from backend.repo_index import RepoIndex, get_loaded_index, load_index
+from backend.repo_tree import build_tree, is_generated_file, is_skipped_path
+from backend.traces import (
+    TRACE_TOKEN_BUDGET,
+    BranchTrace,
+    FileTrace,
+    cache_takeaway,
+    cached_takeaway,
+    compact_traces,
+    dedupe_traces,
+    relative_path,
+)
 import chainlit as cl
 
-def clone_github_repo(repo_url, repo_name):
-    unique_id = str(uuid.uuid4())
-    
-    data_dir = Path(".data")
-    repo_dir = data_dir / f"{repo_name}_{unique_id}"
-    
-    os.makedirs(data_dir, exist_ok=True)
-    
+# Maximum number of branches explored at the same time by `create_sub_agents`.
+SUB_AGENT_CONCURRENCY = int(os.getenv("SUB_AGENT_CONCURRENCY", "3"))
+# Put each branch's files into the sub-agent's first prompt so it rarely needs a tool turn
+PRELOAD_BRANCH_FILES = os.getenv("PRELOAD_BRANCH_FILES", "1").lower() in ("1", "true", "yes")
+PRELOAD_MAX_BYTES = int(os.getenv("PRELOAD_MAX_BYTES", "48000"))
+# Repositories within both limits are briefed from their files in one call,
+# skipping the orchestrator and the sub-agents
+FAST_PATH = os.getenv("FAST_PATH", "1").lower() in ("1", "true", "yes")
+FAST_PATH_MAX_FILES = int(os.getenv("FAST_PATH_MAX_FILES", "30"))
+FAST_PATH_MAX_TOKENS = int(os.getenv("FAST_PATH_MAX_TOKENS", "40000"))
+
+SINGLE_CALL = "single_call"
+MULTI_AGENT = "multi_agent"
+
+def clone_github_repo(repo_url, repo_name, leases: ExitStack | AsyncExitStack | None = None):
     try:
-        subprocess.run(
-            ["git", "clone", repo_url, str(repo_dir)],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        print(f"Successfully cloned {repo_url} to {repo_dir}")
-        repo_path = str(repo_dir)
+        checkout = checkout_repo(repo_url, leases=leases)
+        repo_path = checkout["repo_path"]
     except subprocess.CalledProcessError as e:
         print(f"Failed to clone repository: {e.stderr}")
         raise RuntimeError(f"Failed to clone repository: {e.stderr}")
@@ -47,24 +69,95 @@ def clone_github_repo(repo_url, repo_name):
             print(f"Error reading README.md: {str(e)}")
             readme_content = None
 
-    tree = DisplayTree(
-        dirPath=repo_path,
-        stringRep=True,
-        showHidden=False,
-        ignoreList = ".git"
-    )
+    # Built once per commit and reused by the tree, the orchestrator prompt and the agent tools
+    index = load_index(repo_path, checkout["commit"])
+    tree = build_tree(repo_path, index=index)
 
     repo_data = {
         "repo_path": repo_path,
         "repo_name": repo_name,
         "repo_url": repo_url,
+        "commit": checkout["commit"],
         "readme_content": readme_content,
-        "tree": tree
+        "tree": tree,
+        "stats": index.summary(),
     }
 
     return repo_data
 
 
+class PitchStrategy(NamedTuple):
+    name: str
+    reason: str
+    files: int
+    estimated_tokens: int
+    # The repository's files, packed for the single call
+    packed_files: str | None = None
+
+
+def choose_strategy(repo_path: str, commit: str | None = None) -> PitchStrategy:
+    """Pick how to explore the repository, from the file index and a token count.
+
+    Small repositories are packed into a single technical brief call
+    (`SINGLE_CALL`); the rest go through the orchestrator and sub-agents
+    (`MULTI_AGENT`).
+    """
+    index = load_index(repo_path, commit)
+    files = [
+        info for info in index
+        if not info.binary and not is_skipped_path(info.path) and not is_generated_file(info.path)
+    ]
+    paths = [info.path for info in files]
+    # About 4 bytes per token, until the files are actually read
+    estimate = sum(info.size for info in files) // 4
+
+    if not FAST_PATH:
+        return PitchStrategy(MULTI_AGENT, "the fast path is disabled", len(paths), estimate)
+    if len(paths) > FAST_PATH_MAX_FILES:
+        return PitchStrategy(MULTI_AGENT, f"{len(paths)} files is over {FAST_PATH_MAX_FILES}", len(paths), estimate)
+    if estimate > FAST_PATH_MAX_TOKENS:
+        return PitchStrategy(MULTI_AGENT, f"about {estimate} tokens is over {FAST_PATH_MAX_TOKENS}", len(paths), estimate)
+
+    set_current_path(repo_path, index)
+    contents = read_file_batch(get_workspace(), [{"path": path} for path in paths], FAST_PATH_MAX_TOKENS * 4)
+    packed_files = format_file_batch(contents)
+    tokens = num_tokens_from_messages([{"role": "user", "content": packed_files}])
+    if tokens > FAST_PATH_MAX_TOKENS:
+        return PitchStrategy(MULTI_AGENT, f"{tokens} tokens is over {FAST_PATH_MAX_TOKENS}", len(paths), tokens)
+    return PitchStrategy(SINGLE_CALL, f"{len(paths)} files, {tokens} tokens", len(paths), tokens, packed_files)
+
+
+class StrategyStats:
+    """Duration and LLM usage of finished pitches, per strategy."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self.window = window
+        self._pitches: dict[str, deque[tuple[float, int]]] = {}
+
+    def record(self, strategy: str, seconds: float, tokens: int) -> None:
+        with self._lock:
+            self._pitches.setdefault(strategy, deque(maxlen=self.window)).append((seconds, tokens))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pitches = {strategy: list(entries) for strategy, entries in self._pitches.items()}
+
+        result = {}
+        for strategy, entries in pitches.items():
+            seconds = sorted(entry[0] for entry in entries)
+            result[strategy] = {
+                "pitches": len(entries),
+                "seconds_p50": percentile(seconds, 0.5),
+                "seconds_p95": percentile(seconds, 0.95),
+                "tokens_mean": sum(entry[1] for entry in entries) / len(entries),
+            }
+        return result
+
+
+strategy_stats = StrategyStats()
+
+
 class Branch(BaseModel):
     name: str
     description: str
@@ -73,10 +166,27 @@ class Branch(BaseModel):
 class BranchList(BaseModel):
     branches: List[Branch]
 
+class SubAgentReport(Branch):
+    """What a sub-agent found while exploring its branch, one takeaway per file."""
+    trace: List[FileTrace]
+
+
+def create_orchestrator_branches(
+    tree: str,
+    stats: str | None = None,
+    on_branch: Callable[[Branch], None] | None = None,
+) -> BranchList:
+    """Split the repository into branches for the sub-agents.
+
+    The plan is streamed; `on_branch` is called with each branch as soon as
+    it is complete, before the rest of the plan has been generated.
+    """
+    prompt = f"Break this tree structure into branches that can be explored by sub-agents: {tree}"
+    if stats:
+        prompt += f"\n\nRepository statistics:\n{stats}"
 
-def create_orchestrator_branches(tree: str):
     response = llm_call(
-        prompt=f"Break this tree structure into branches that can be explored by sub-agents: {tree}",
+        prompt=prompt,
         system_prompt="""
         You are a helpful assistant that creates branches for the 
         given tree structure. The maximum number of branches is 3. 
@@ -88,49 +198,194 @@ def create_orchestrator_branches(tree: str):
         of exploring the branch. The files should be a list of files that will
         be explored.
         """,
-        response_format=BranchList
+        response_format=BranchList,
+        on_token=get_codec(BranchList).item_stream("branches", Branch, on_branch) if on_branch else None,
     )
     return response
 
-def create_sub_agents(response: BranchList, repo_path: str) -> str:
-    set_current_path(repo_path)
-    instructions = response.branches
+class BranchExplorer:
+    """Explores branches with sub-agents on a bounded pool, each as soon as it
+    is submitted.
 
+    Branches named in `reuse` are not explored again; their earlier report is
+    returned instead (e.g. when none of their files changed). Takeaways are
+    cached by file content, so a branch whose files all have one is not
+    explored either.
+    """
+
+    # No schema here: the structured fallback call adds it, and only once
     system_prompt = """
     You are a helpful assistant that explores a branch of a codebase. 
     You will be given a branch of a codebase and a list of files that will be explored.
     You will need to use the tools provided to explore the branch by going into each file, 
     reading it, and then understanding the code semantically.
+    Use search_code to find where things are defined or used instead of walking
+    directories with ls and cd.
     The results should include the file that was explored, the takeaway from the exploration,
     and the path to the file. 
-    """ 
+    Reply with only a JSON object of the form
+    {"trace": [{"file_explored": "...", "takeaway": "...", "file_path": "..."}]}
+    """
 
-    config = AgentConfig(
-        name="agent", system_prompt=system_prompt, description="", 
-        tools=["ls", "cd", "read_file", "pwd"]
-    )
+    def __init__(
+        self,
+        repo_path: str,
+        max_concurrency: int = SUB_AGENT_CONCURRENCY,
+        preload_files: bool = PRELOAD_BRANCH_FILES,
+        reuse: Dict[str, SubAgentReport] | None = None,
+    ):
+        self.repo_path = repo_path
+        self.preload_files = preload_files
+        self.reuse = reuse or {}
+        # Takeaways depend on the file and on how it was explored
+        self.takeaway_context = stable_hash([text_model, self.system_prompt])
+        self.index = get_loaded_index(repo_path)
+        self._known = set(self.index.paths) if self.index is not None else set()
+        self.config = AgentConfig(
+            name="agent", system_prompt=self.system_prompt, description="", 
+            tools=["ls", "cd", "read_file", "read_files", "pwd", "search_code"]
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="sub-agent")
+        self._submitted: Dict[str, tuple[Branch, Future]] = {}
+        self._lock = threading.Lock()
 
-    full_response = ""
-    
-    async def process_instruction(instruction):
+    def __enter__(self) -> "BranchExplorer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(self, branch: Branch) -> Future:
+        """Start exploring `branch`, unless the same branch was already submitted."""
+        with self._lock:
+            submitted = self._submitted.get(branch.name)
+            if submitted is not None and submitted[0] == branch:
+                return submitted[1]
+            # Each agent runs in its own copy of the caller's context
+            future = self._executor.submit(contextvars.copy_context().run, self._explore_branch, branch)
+            self._submitted[branch.name] = (branch, future)
+            return future
+
+    def reports(self, branches: BranchList) -> List[SubAgentReport]:
+        """The reports of `branches`, exploring those not submitted yet.
+
+        Reports come in branch order, not completion order, so the result is
+        deterministic. Submitted branches missing from `branches` are ignored.
+        """
+        futures = [self.submit(branch) for branch in branches.branches]
+        return [future.result() for future in futures]
+
+    def close(self, cancel: bool = False) -> None:
+        """Shut the pool down once the running branches finish; with `cancel`,
+        branches not started yet are dropped. Closing again does nothing."""
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def _process_instruction(self, instruction: Branch) -> List[FileTrace]:
         print(f"New Agent Processing instruction: {instruction.name}")
-        print(f"starting at path: {repo_path}")
-        set_current_path(repo_path)
-        agent = Agent.from_config(config)
+        print(f"starting at path: {self.repo_path}")
+        agent = Agent.from_config(self.config)
         
         content = f"Explore branch: {instruction.name}\n\nDescription: {instruction.description}\n\nFiles to explore:\n" + \
                   "\n".join([f"- {file}" for file in instruction.files])
+
+        if self.preload_files and instruction.files:
+            files = read_file_batch(
+                get_workspace(), [{"path": file} for file in instruction.files], PRELOAD_MAX_BYTES
+            )
+            content += (
+                "\n\nThe contents of these files are included below. Only use the tools "
+                "if you need more context than this.\n\n" + format_file_batch(files)
+            )
         
-        await cl.Message(content=f"### Exploring {instruction.name}\n\n {instruction.description}\n\nFiles to explore:\n" + \
-                  "\n".join([f"- {file}" for file in instruction.files]), author="AI").send()
+        run_sync(send_message(cl.Message(content=f"### Exploring {instruction.name}\n\n {instruction.description}\n\nFiles to explore:\n" + \
+                  "\n".join([f"- {file}" for file in instruction.files]), author="AI")))
         
-        return agent.call_with_tools(content)
-    
-    for instruction in instructions:
-        result = asyncio.run(process_instruction(instruction))
-        full_response += result
+        response = agent.call_with_tools(content)
+        try:
+            return get_codec(BranchTrace).parse(response).trace
+        except ValueError:
+            # The final reply was prose; ask for it again in the trace format
+            return agent.call_structured_output(
+                "List the takeaway of each file you explored in the required JSON format.", BranchTrace
+            ).trace
+
+    def _resolve(self, file: str) -> str:
+        """The repo-relative path of a branch or trace file, without the
+        repo-name prefix the orchestrator copies from the tree."""
+        path = relative_path(file, self.repo_path)
+        return resolve_branch_path(path, self._known, set()) or path
+
+    def _content_hash(self, path: str) -> str | None:
+        info = self.index.get(path) if self.index is not None else None
+        return info.content_hash if info is not None else None
+
+    def _cached_trace(self, instruction: Branch) -> List[FileTrace] | None:
+        trace = []
+        for file in instruction.files:
+            path = self._resolve(file)
+            takeaway = cached_takeaway(self._content_hash(path) or "", self.takeaway_context)
+            if takeaway is None:
+                return None
+            trace.append(takeaway.model_copy(update={"file_path": path}))
+        return trace or None
+
+    def _explore_branch(self, instruction: Branch) -> SubAgentReport:
+        if instruction.name in self.reuse:
+            run_sync(send_message(cl.Message(content=f"### Reusing {instruction.name}\n\nNone of its files changed since the last pitch.", author="AI")))
+            return self.reuse[instruction.name]
+
+        trace = self._cached_trace(instruction)
+        if trace is not None:
+            run_sync(send_message(cl.Message(content=f"### Reusing {instruction.name}\n\nAll of its files were explored before.", author="AI")))
+            return SubAgentReport(**instruction.model_dump(), trace=trace)
+
+        # Runs inside its own copied context, so this workspace is private to the agent
+        set_current_path(self.repo_path)
+        trace = []
+        for file_trace in self._process_instruction(instruction):
+            path = self._resolve(file_trace.file_path)
+            file_trace = file_trace.model_copy(update={"file_path": path})
+            cache_takeaway(self._content_hash(path) or "", self.takeaway_context, file_trace)
+            trace.append(file_trace)
+        return SubAgentReport(**instruction.model_dump(), trace=trace)
+
+
+def create_sub_agents(
+    response: BranchList,
+    repo_path: str,
+    max_concurrency: int = SUB_AGENT_CONCURRENCY,
+    preload_files: bool = PRELOAD_BRANCH_FILES,
+    reuse: Dict[str, SubAgentReport] | None = None,
+) -> List[SubAgentReport]:
+    """Explore every branch with its own agent, in parallel (see `BranchExplorer`)."""
+    if not response.branches:
+        return []
+    workers = min(max_concurrency, len(response.branches))
+    with BranchExplorer(repo_path, workers, preload_files, reuse) as explorer:
+        return explorer.reports(response)
+
+
+def format_reports(reports: List[SubAgentReport], budget: int = TRACE_TOKEN_BUDGET) -> str:
+    """The sub-agents' takeaways as the input of the technical brief.
+
+    A file explored by several branches is listed once, and the takeaways
+    are shortened to fit in `budget` tokens, so the brief prompt stays the
+    same size however verbose the sub-agents were.
+    """
+    traces = compact_traces(
+        dedupe_traces(trace for report in reports for trace in report.trace), budget, text_model
+    )
+    remaining = {trace.file_path: trace for trace in traces}
 
-    return full_response # this should be put into json file
+    sections = []
+    for report in reports:
+        lines = [f"## {report.name}", report.description]
+        for trace in report.trace:
+            compacted = remaining.pop(RepoIndex.normalize(trace.file_path), None)
+            if compacted is not None:
+                lines.append(f"- {compacted.file_path}: {compacted.takeaway}")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
 
 class TechnicalBrief(BaseModel):
     product_idea: str
@@ -140,7 +395,13 @@ class TechnicalBrief(BaseModel):
     technologies_used: List[str]
     x_factors: List[str]
 
-def create_technical_brief(repo_name: str, full_response: str) -> str:
+def create_technical_brief(
+    repo_name: str,
+    full_response: str,
+    on_snapshot: Callable[[dict], None] | None = None,
+) -> TechnicalBrief:
+    """Write the technical brief. `on_snapshot` receives the partially
+    generated brief (as a dict) while it streams in."""
     system_prompt = f"""
     Based on the following information about the repository '{repo_name}', create a comprehensive technical brief:
     
@@ -159,7 +420,8 @@ def create_technical_brief(repo_name: str, full_response: str) -> str:
 
     brief = llm_call(
         prompt=system_prompt,
-        response_format=TechnicalBrief
+        response_format=TechnicalBrief,
+        on_token=get_codec(TechnicalBrief).partial_stream(on_snapshot) if on_snapshot else None,
     )
 
     return brief
\ No newline at end of file
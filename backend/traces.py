@@ -0,0 +1,104 @@
+import os
+from typing import Iterable, List
+
+from pydantic import BaseModel
+
+from backend.models.cache import PersistentCache, stable_hash
+from backend.models.context import get_encoding
+from backend.repo_index import RepoIndex
+
+# Most tokens of sub-agent takeaways put into the technical brief prompt
+TRACE_TOKEN_BUDGET = int(os.getenv("TRACE_TOKEN_BUDGET", "6000"))
+
+
+def _takeaway_cache_from_env() -> PersistentCache | None:
+    if os.getenv("TAKEAWAY_CACHE", "0").lower() not in ("1", "true", "yes"):
+        return None
+    return PersistentCache(
+        path=os.path.join(os.getenv("LLM_CACHE_DIR", ".cache"), "takeaways.sqlite"),
+        max_bytes=int(os.getenv("TAKEAWAY_CACHE_MAX_MB", "64")) * 1024 * 1024,
+        ttl_seconds=None,
+        name="takeaways",
+    )
+
+
+# Optional on-disk cache of each file's takeaway, enabled with TAKEAWAY_CACHE=1
+takeaway_cache: PersistentCache | None = _takeaway_cache_from_env()
+
+
+class FileTrace(BaseModel):
+    file_explored: str
+    takeaway: str
+    file_path: str
+
+
+class BranchTrace(BaseModel):
+    trace: List[FileTrace]
+
+
+def relative_path(path: str, repo_path: str) -> str:
+    """`path` relative to the repository root, however the agent spelled it."""
+    root = os.path.realpath(repo_path)
+    if os.path.isabs(path):
+        path = os.path.relpath(os.path.realpath(path), root)
+    return RepoIndex.normalize(path)
+
+
+def dedupe_traces(traces: Iterable[FileTrace]) -> List[FileTrace]:
+    """One entry per file, in first-seen order; distinct takeaways are joined."""
+    merged: dict[str, FileTrace] = {}
+    for trace in traces:
+        key = RepoIndex.normalize(trace.file_path)
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = trace.model_copy(update={"file_path": key})
+        elif trace.takeaway.strip() and trace.takeaway.strip() not in existing.takeaway:
+            existing.takeaway = f"{existing.takeaway.rstrip()} {trace.takeaway.strip()}"
+    return list(merged.values())
+
+
+def compact_traces(traces: List[FileTrace], budget: int = TRACE_TOKEN_BUDGET, model: str = "") -> List[FileTrace]:
+    """Shorten takeaways until they fit in `budget` tokens.
+
+    Short takeaways are kept whole; the longest ones are cut to a common
+    length, so no single file crowds out the others.
+    """
+    encoding = get_encoding(model)
+    tokens = [encoding.encode(trace.takeaway, disallowed_special=()) for trace in traces]
+    if sum(len(t) for t in tokens) <= budget:
+        return traces
+
+    # Largest per-takeaway cap that keeps the total within budget
+    remaining, cap = budget, 0
+    lengths = sorted(len(t) for t in tokens)
+    for i, length in enumerate(lengths):
+        share = remaining // (len(lengths) - i)
+        if length > share:
+            cap = share
+            break
+        remaining -= length
+    else:
+        cap = lengths[-1]
+
+    return [
+        trace if len(t) <= cap else trace.model_copy(update={"takeaway": encoding.decode(t[:cap]).rstrip() + "..."})
+        for trace, t in zip(traces, tokens)
+    ]
+
+
+def takeaway_key(content_hash: str, context: str) -> str:
+    """Cache key of a file's takeaway: its content, and what produced the takeaway."""
+    return stable_hash({"content_hash": content_hash, "context": context})
+
+
+def cached_takeaway(content_hash: str, context: str) -> FileTrace | None:
+    if takeaway_cache is None or not content_hash:
+        return None
+    cached = takeaway_cache.get(takeaway_key(content_hash, context))
+    return FileTrace.model_validate_json(cached) if cached is not None else None
+
+
+def cache_takeaway(content_hash: str, context: str, trace: FileTrace) -> None:
+    if takeaway_cache is None or not content_hash:
+        return
+    takeaway_cache.set(takeaway_key(content_hash, context), trace.model_dump_json())
@@ -1,12 +1,25 @@
 import asyncio
+from contextlib import AsyncExitStack
 from typing import List, cast
 from dotenv import load_dotenv
 import os
 from datetime import datetime
 import random
 import string
+import time
 
 from backend import server, researcher
+from backend.checkpoints import PITCH_CHECKPOINTS, PitchDocument, code_fingerprint
+from backend.incremental import PreviousPitch, branch_touched, file_manifest, find_previous_pitch
+from backend.jobs import FAILED, Job, pitch_jobs
+from backend.pipeline import Checkpoint, Pipeline
+from backend.models.llms import text_model
+from backend.repo_cache import normalize_repo_url, resolve_remote_commit
+from backend.repo_index import load_index
+from backend.models.scheduler import INTERACTIVE, current_priority, priority
+from backend.models.structured import get_codec
+from backend.models.usage import usage_tracker
+from backend.models.tools.runtime import LiveElement, MessageStream
 
 import chainlit as cl
 
@@ -43,6 +56,30 @@ async def display_message(message):
 
 
 
+def session_owner() -> str | None:
+    """Who the current session belongs to, so a reconnecting user finds their jobs.
+
+    The app has no login, so this is the chat's thread id, which the client
+    sends again when it reconnects; the user's identifier once there is auth.
+    """
+    user = cl.user_session.get("user")
+    identifier = getattr(user, "identifier", None)
+    return identifier or cl.context.session.thread_id
+
+
+@cl.on_chat_start
+async def on_chat_start():
+    owner = session_owner()
+    if owner is None:
+        return
+    # Reattach to a pitch this user started before reconnecting
+    for job in pitch_jobs.jobs_for(owner):
+        if not job.done:
+            await cl.Message(content=f"## Reattaching to the pitch of {job.title}...").send()
+            await follow_job(job, render=True)
+            return
+
+
 @cl.on_message
 async def on_message(msg: cl.Message):
 
@@ -50,8 +87,127 @@ async def on_message(msg: cl.Message):
 
 
     if msg.content.startswith("https://github.com/") or msg.content.startswith("git@github.com:"):
-        repo_name = msg.content.split("/")[-1]
-        repo_data = await cl.make_async(server.clone_github_repo)(msg.content, repo_name)
+        repo_url = msg.content
+        repo_name = repo_url.split("/")[-1]
+
+        # Requests for the same repository at the same commit share one job
+        commit = await cl.make_async(resolve_remote_commit)(repo_url)
+        job, created = pitch_jobs.submit(
+            key=f"{normalize_repo_url(repo_url)}@{commit or 'HEAD'}",
+            title=repo_name,
+            runner=lambda job: run_pitch(job, repo_url, repo_name, commit),
+            # Someone is watching this one
+            priority=INTERACTIVE,
+            owner=session_owner(),
+        )
+        if not created:
+            await cl.Message(content=f"## {repo_name} is already being pitched, following along...").send()
+        # The session that started the job renders it live; others follow its events
+        await follow_job(job, render=not created)
+
+
+async def run_pitch(job: Job, repo_url: str, repo_name: str, commit: str | None):
+    # Without a resolved commit there is nothing safe to key checkpoints on
+    document = PitchDocument.for_commit(repo_url, commit) if commit and PITCH_CHECKPOINTS else None
+    with priority(job.priority), usage_tracker.scope() as usage:
+        # Released when the pitch ends, however it ends
+        async with AsyncExitStack() as resources:
+            pipeline = build_pitch_pipeline(repo_name, job, resources, document)
+            started = time.perf_counter()
+            results = await pipeline.run(repo_url=repo_url)
+    seconds = time.perf_counter() - started
+    strategy: server.PitchStrategy = results["strategy"]
+    server.strategy_stats.record(strategy.name, seconds, usage["total_tokens"])
+    print(
+        f"Pitched {repo_name} ({strategy.name}: {strategy.reason}) in {seconds:.1f}s, "
+        f"{usage['requests']} requests, {usage['total_tokens']} tokens"
+    )
+    return results
+
+
+async def follow_job(job: Job, render: bool):
+    """Show a job's progress in this session until it finishes.
+
+    With `render` False the job's stages already post to this session, so
+    only the queue position and failures are shown.
+    """
+    status = cl.Message(content=f"Pitch of {job.title}: {job.status}")
+    await status.send()
+
+    async for event in job.events():
+        if event.type == "queued" and event.data["ahead"] >= pitch_jobs.workers:
+            status.content = f"Pitch of {job.title}: waiting for a free worker ({event.data['ahead']} pitches ahead)"
+            await status.update()
+        elif event.type == "stage":
+            status.content = f"Pitch of {job.title}: {event.data['name']} {event.data['status']}"
+            await status.update()
+        elif event.type == FAILED:
+            await cl.Message(content=f"## Pitch failed\n\n{event.data['error']}").send()
+        elif not render:
+            continue
+        elif event.type == "repo":
+            await cl.Message(
+                content=f"## Cloned Repository {job.title}\n\n",
+                elements=[cl.CustomElement(name="RepoView", props=event.data["repo_data"])],
+            ).send()
+        elif event.type == "branches":
+            for branch in event.data["branches"]:
+                files = "\n".join(f"- {file}" for file in branch["files"])
+                await cl.Message(
+                    content=f"### Exploring {branch['name']}\n\n {branch['description']}\n\nFiles to explore:\n{files}",
+                    author="AI",
+                ).send()
+        elif event.type == "deck":
+            await cl.Message(
+                content="# Final Deck\n\n",
+                elements=[cl.CustomElement(name="SlideDeckViewer", props=event.data)],
+            ).send()
+
+    status.content = f"Pitch of {job.title}: {job.status}"
+    await status.update()
+
+
+def build_pitch_pipeline(
+    repo_name: str, job: Job, resources: AsyncExitStack, document: PitchDocument | None = None
+) -> Pipeline:
+    """Wire the pitch stages into a dependency graph.
+
+    Market research only needs the README, so it runs alongside the
+    orchestrator, sub-agent and technical brief stages once the clone is done.
+    Small repositories skip the orchestrator and the sub-agents: the brief is
+    written from their files directly.
+    Progress is published on `job` for the other sessions following it.
+    What the stages hold for the rest of the run (the workspace lease, the
+    sub-agent pool) goes into `resources`, which the caller closes once the
+    run is over.
+    With a `document`, stage results are checkpointed in it and stages whose
+    inputs and config are unchanged since a previous run are skipped. A
+    re-pitch after new commits reuses the previous pitch's branches and only
+    re-explores those whose files changed.
+    """
+    pipeline = Pipeline(
+        on_stage=lambda status, name: job.publish("stage", status=status, name=name),
+        store=document,
+    )
+
+    # The deck fills in while the brief and the market research stream in
+    deck_preview = LiveElement(
+        cl.CustomElement(
+            name="SlideDeckViewer",
+            props={
+                "market_research_data": get_codec(researcher.MarketResearch).empty(),
+                "technical_brief_data": get_codec(server.TechnicalBrief).empty(),
+            },
+        ),
+        content="# Final Deck\n\n",
+    )
+    # Work a stage started for a later one (the sub-agents started by the orchestrator stage)
+    running: dict = {}
+
+    @pipeline.stage("repo_data", deps=["repo_url"])
+    async def clone(repo_url: str):
+        # The lease keeps other pitches from moving the workspace while this one reads it
+        repo_data = await cl.make_async(server.clone_github_repo)(repo_url, repo_name, leases=resources)
 
         repo_view_element = cl.CustomElement(
             name="RepoView",
@@ -59,17 +215,150 @@ async def on_message(msg: cl.Message):
         )
 
         await cl.Message(content=f"## Cloned Repository {repo_name}\n\n", elements=[repo_view_element]).send()
-
-        orchestrator_branches = await cl.make_async(server.create_orchestrator_branches)(repo_data["tree"])
-
-        # await cl.Message(content=f"## Created Orchestrator Branches\n\n", elements=[]).send()
-
-        full_response = await cl.make_async(server.create_sub_agents)(orchestrator_branches, repo_data["repo_path"])
-
-        # await cl.Message(content=f"## Sub agents explored: {full_response}\n\n", elements=[]).send()
-
-        with cl.Step("Creating Technical Brief"):
-            technical_brief = await cl.make_async(server.create_technical_brief)(repo_name, full_response)
+        job.publish("repo", repo_data=repo_data)
+        if document is not None:
+            index = await asyncio.to_thread(load_index, repo_data["repo_path"], repo_data["commit"])
+            await asyncio.to_thread(
+                document.set,
+                ("github_repo",),
+                {
+                    "name": repo_name,
+                    "url": repo_url,
+                    "created_by": normalize_repo_url(repo_url).split("/")[-2],
+                    "readme": repo_data["readme_content"],
+                    "tree": repo_data["tree"],
+                    "commit": repo_data["commit"],
+                    # Diffed against by the next re-pitch
+                    "files": file_manifest(index),
+                },
+            )
+        return repo_data
+
+    @pipeline.stage("previous_pitch", deps=["repo_data"])
+    async def previous(repo_data: dict):
+        if document is None:
+            return None
+        index = await asyncio.to_thread(load_index, repo_data["repo_path"], repo_data["commit"])
+        previous_pitch = await asyncio.to_thread(find_previous_pitch, document, file_manifest(index))
+        if previous_pitch is not None:
+            await cl.Message(
+                content=f"## Re-pitching incrementally\n\n{len(previous_pitch.changed)} files changed since {previous_pitch.commit[:7]}"
+            ).send()
+        return previous_pitch
+
+    @pipeline.stage("strategy", deps=["repo_data"])
+    async def strategy(repo_data: dict):
+        strategy = await cl.make_async(server.choose_strategy)(repo_data["repo_path"], repo_data["commit"])
+        print(f"{repo_name}: {strategy.name} ({strategy.reason})")
+        if strategy.name == server.SINGLE_CALL:
+            await cl.Message(
+                content=f"## Small repository\n\nWriting the brief from its {strategy.files} files directly"
+            ).send()
+        return strategy
+
+    @pipeline.stage(
+        "orchestrator_branches",
+        deps=["repo_data", "previous_pitch", "strategy"],
+        checkpoint=Checkpoint(
+            path=("orchestrator_plan", "branches"),
+            config={"model": text_model, "code": code_fingerprint(server.create_orchestrator_branches)},
+            dump=lambda branches: [branch.model_dump() for branch in branches.branches],
+            load=lambda data: server.BranchList(branches=data),
+        ),
+    )
+    async def orchestrate(repo_data: dict, previous_pitch: PreviousPitch | None, strategy: server.PitchStrategy):
+        if strategy.name == server.SINGLE_CALL:
+            return server.BranchList(branches=[])
+        if previous_pitch is not None:
+            # The previous reports without their traces are the previous branches
+            branches = server.BranchList(
+                branches=[
+                    server.Branch(**{field: report[field] for field in server.Branch.model_fields})
+                    for report in previous_pitch.sub_agents
+                ]
+            )
+            if previous_pitch.uncovered:
+                # New files outside every earlier branch still need exploring
+                branches.branches.append(
+                    server.Branch(
+                        name=f"Changes since {previous_pitch.commit[:7]}",
+                        description="Files added or modified since the last pitch that none of its branches covers",
+                        files=previous_pitch.uncovered,
+                    )
+                )
+        else:
+            # Sub-agents start on each branch as soon as the orchestrator has written it
+            explorer = server.BranchExplorer(repo_data["repo_path"])
+            # Shut down with the run if the explore stage never gets to it (a failed or cancelled run)
+            resources.push_async_callback(asyncio.to_thread, explorer.close, True)
+            branches = await cl.make_async(server.create_orchestrator_branches)(
+                repo_data["tree"], repo_data["stats"], on_branch=explorer.submit
+            )
+            running["explorer"] = explorer
+        job.publish("branches", branches=[branch.model_dump() for branch in branches.branches])
+        return branches
+
+    @pipeline.stage(
+        "sub_agent_reports",
+        deps=["orchestrator_branches", "repo_data", "previous_pitch", "strategy"],
+        checkpoint=Checkpoint(
+            path=("orchestrator_plan", "sub_agents"),
+            config={
+                "model": text_model,
+                "code": code_fingerprint(server.BranchExplorer),
+                "preload": [server.PRELOAD_BRANCH_FILES, server.PRELOAD_MAX_BYTES],
+            },
+            dump=lambda reports: [report.model_dump() for report in reports],
+            load=lambda data: [server.SubAgentReport.model_validate(report) for report in data],
+        ),
+    )
+    async def explore(
+        orchestrator_branches: server.BranchList,
+        repo_data: dict,
+        previous_pitch: PreviousPitch | None,
+        strategy: server.PitchStrategy,
+    ):
+        if strategy.name == server.SINGLE_CALL:
+            return []
+        reuse = {}
+        if previous_pitch is not None:
+            changed, known = set(previous_pitch.changed), set(previous_pitch.known)
+            reuse = {
+                report["name"]: server.SubAgentReport.model_validate(report)
+                for report in previous_pitch.sub_agents
+                if not branch_touched(report["files"], changed, known)
+            }
+        # Picks up the sub-agents already started while the plan streamed in
+        explorer = running.pop("explorer", None) or server.BranchExplorer(repo_data["repo_path"], reuse=reuse)
+        with explorer:
+            return await cl.make_async(explorer.reports)(orchestrator_branches)
+
+    @pipeline.stage(
+        "technical_brief",
+        deps=["sub_agent_reports", "strategy"],
+        checkpoint=Checkpoint(
+            path=("technical_brief",),
+            config={
+                "model": text_model,
+                "code": code_fingerprint(server.create_technical_brief, server.TechnicalBrief, server.format_reports),
+                "trace_budget": server.TRACE_TOKEN_BUDGET,
+            },
+            dump=lambda brief: brief.model_dump(),
+            load=server.TechnicalBrief.model_validate,
+        ),
+    )
+    async def brief(sub_agent_reports: list[server.SubAgentReport], strategy: server.PitchStrategy):
+        if strategy.packed_files is not None:
+            findings = strategy.packed_files
+        else:
+            findings = server.format_reports(sub_agent_reports)
+        # Everything else waits on the brief, so it goes one priority level up
+        with cl.Step("Creating Technical Brief"), priority(max(INTERACTIVE, current_priority() - 1)):
+            technical_brief = await cl.make_async(server.create_technical_brief)(
+                repo_name,
+                findings,
+                on_snapshot=lambda brief: deck_preview.update(technical_brief_data=brief),
+            )
 
         technical_brief_element = cl.CustomElement(
             name="TechnicalBriefViewer",
@@ -77,10 +366,29 @@ async def on_message(msg: cl.Message):
         )
 
         # await cl.Message(content=f"## Technical Brief\n\n", elements=[technical_brief_element]).send()
-
+        return technical_brief
+
+    @pipeline.stage(
+        "market_research",
+        deps=["repo_data"],
+        checkpoint=Checkpoint(
+            path=("market_research",),
+            config={"model": text_model, "code": code_fingerprint(researcher.market_research, researcher.MarketResearch)},
+            dump=lambda research: research.model_dump(),
+            load=researcher.MarketResearch.model_validate,
+        ),
+    )
+    async def research(repo_data: dict):
         await cl.Message(content="## Conducting Market Research...", elements=[]).send()
 
-        market_research = await cl.make_async(researcher.market_research)(repo_data["readme_content"])
+        # Stream the research agent's notes while it searches
+        notes = MessageStream(cl.Message(content="", author="Market Research"))
+        market_research = await cl.make_async(researcher.market_research)(
+            repo_data["readme_content"],
+            on_token=notes,
+            on_snapshot=lambda data: deck_preview.update(market_research_data=data),
+        )
+        await notes.finish()
 
         # market_research_element = cl.CustomElement(
         #     name="MarketResearchViewer",
@@ -88,19 +396,16 @@ async def on_message(msg: cl.Message):
         # )
 
         # await cl.Message(content=f"### Market Research\n\n", elements=[market_research_element]).send()
-
-
-        slides = cl.CustomElement(
-            name="SlideDeckViewer",
-            props={"market_research_data": market_research.model_dump(), "technical_brief_data": technical_brief.model_dump()},
-        )
-
-        await cl.Message(content=f"# Final Deck\n\n", elements=[slides]).send()
-
-        
-
-
-
-
-
-
+        return market_research
+
+    @pipeline.stage("deck", deps=["technical_brief", "market_research"])
+    async def deck(technical_brief, market_research):
+        deck_data = {
+            "market_research_data": market_research.model_dump(),
+            "technical_brief_data": technical_brief.model_dump(),
+        }
+        await deck_preview.finish(**deck_data)
+        job.publish("deck", **deck_data)
+        return deck_data
+
+    return pipeline
@@ -0,0 +1,78 @@
+import { Search } from "lucide-react"
+import { 
+  Accordion,
+  AccordionContent,
+  AccordionItem,
+  AccordionTrigger
+} from "@/components/ui/accordion"
+import { Badge } from "@/components/ui/badge"
+
+export default function SearchCode() {
+  // Default values if props are missing
+  const query = props.args?.query || ""
+  const mode = props.args?.mode || "literal"
+  const results = props.response || ""
+
+  // Result blocks are separated by "--" lines; match lines look like "path:line: snippet"
+  const parseResults = () => {
+    if (!results || results.startsWith("No matches")) return [];
+
+    return results
+      .split("\n--\n")
+      .map(block => block.split("\n").filter(line => line.trim() !== "" && !line.startsWith("[")))
+      .filter(lines => lines.length > 0);
+  };
+
+  const isMatchLine = (line) => /^[^\s]+:\d+: /.test(line);
+
+  const blocks = parseResults();
+
+  return (
+    <div className="w-full max-w-2xl">
+      <Accordion 
+        type="single" 
+        collapsible 
+        className="w-full border border-border rounded-md overflow-hidden"
+      >
+        <AccordionItem value="search-code" className="border-0">
+          <AccordionTrigger 
+            className="px-4 py-3 text-left bg-muted/30 hover:bg-muted/50 transition-colors no-underline"
+          >
+            <div className="flex items-center gap-2">
+              <Search className="h-5 w-5 text-primary" />
+              <span className="font-medium">Searched code for <span className="text-primary font-mono">{query}</span></span>
+            </div>
+            <Badge variant="outline" className="ml-auto">
+              {mode}
+            </Badge>
+          </AccordionTrigger>
+
+          <AccordionContent className="p-0 bg-background">
+            {blocks.length > 0 ? (
+              <div className="divide-y px-2">
+                {blocks.map((lines, index) => (
+                  <pre key={index} className="text-xs p-3 overflow-x-auto">
+                    {lines.map((line, lineIndex) => (
+                      <div key={lineIndex} className={isMatchLine(line) ? "text-foreground" : "text-muted-foreground"}>
+                        {line}
+                      </div>
+                    ))}
+                  </pre>
+                ))}
+              </div>
+            ) : (
+              <div className="flex flex-col items-center justify-center h-full py-10">
+                <Search className="h-12 w-12 text-muted-foreground mb-2 opacity-20" />
+                <p className="text-muted-foreground">No matches found</p>
+              </div>
+            )}
+
+            <div className="px-4 py-2 text-xs text-muted-foreground border-t">
+              {`${blocks.length} results`}
+            </div>
+          </AccordionContent>
+        </AccordionItem>
+      </Accordion>
+    </div>
+  )
+}
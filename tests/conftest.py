@@ -0,0 +1,6 @@
+import os
+
+# Importing backend.models builds the OpenRouter and Exa clients, which only
+# need a key to be set; the tests never make a request
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+os.environ.setdefault("EXA_API_KEY", "test")
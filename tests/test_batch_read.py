@@ -0,0 +1,63 @@
+import asyncio
+import types
+
+import pytest
+
+from backend.models.tools import batch_read
+from backend.models.tools.batch_read import READ_FILES_MIN_BYTES_PER_FILE, _allocate
+from backend.models.tools.file_traversal import set_current_path
+
+
+def test_everything_fits():
+    assert _allocate([100, 2500, 40], 10_000) == [100, 2500, 40]
+
+
+def test_small_files_are_whole_and_large_ones_share_the_rest():
+    sizes = [10_000, 100, 10_000]
+    allocation = _allocate(sizes, 6100)
+    assert allocation == [3000, 100, 3000]
+    assert sum(allocation) == 6100
+
+
+def test_share_grows_as_smaller_files_leave_budget_over():
+    # 1000 is under its even share (2500), so the two larger files split 9000
+    assert _allocate([1000, 20_000, 6000], 10_000) == [1000, 4500, 4500]
+
+
+def test_allocation_follows_request_order():
+    # Smallest first: 10 and 20 whole, 3000 under its half of what is left,
+    # and the largest file gets the remainder
+    assert _allocate([50_000, 10, 3000, 20], 8000) == [4970, 10, 3000, 20]
+
+
+def test_files_past_the_minimum_are_not_read():
+    # 1000 bytes only covers one file at the minimum
+    assert _allocate([5000] * 10, 1000) == [1000] + [0] * 9
+    allocation = _allocate([10] + [5000] * 9, 3 * READ_FILES_MIN_BYTES_PER_FILE)
+    assert allocation == [10, 2995, 2995] + [0] * 7
+
+
+@pytest.mark.parametrize("count", [1, 3, 29, 30, 31, 200])
+@pytest.mark.parametrize("budget", [0, 500, 6000, 60_000])
+def test_total_never_exceeds_the_budget(count, budget):
+    sizes = [(i * 7919) % 9000 for i in range(count)]
+    assert sum(_allocate(sizes, budget)) <= budget
+
+
+def test_unknown_sizes_get_a_share():
+    # Size 0 stands for unreadable or unknown files
+    assert _allocate([0, 100], 10_000) == [5000, 100]
+    assert _allocate([], 1000) == []
+
+
+def test_agent_budget_is_clamped_to_the_maximum(tmp_path, monkeypatch):
+    async def send_message(message):
+        pass
+
+    monkeypatch.setattr(batch_read, "cl", types.SimpleNamespace(Message=dict, CustomElement=dict))
+    monkeypatch.setattr(batch_read, "send_message", send_message)
+    (tmp_path / "big.txt").write_text("line of text\n" * 20_000)
+    set_current_path(str(tmp_path))
+
+    result = asyncio.run(batch_read.read_files_async([{"path": "big.txt"}], max_bytes=10**9))
+    assert len(result.encode()) < batch_read.READ_FILES_MAX_BYTES + 1000
@@ -0,0 +1,74 @@
+import types
+
+import pytest
+
+from backend import server, traces
+from backend.repo_index import forget_index, load_index
+from backend.server import Branch, BranchExplorer
+from backend.traces import FileTrace
+
+
+class MemoryCache:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    root = tmp_path / "demo"
+    (root / "src").mkdir(parents=True)
+    (root / "src" / "app.py").write_text("print('hello')\n")
+    (root / "README.md").write_text("# demo\n")
+    load_index(str(root))
+    monkeypatch.setattr(traces, "takeaway_cache", MemoryCache())
+    # No Chainlit session here: drop the progress messages
+    monkeypatch.setattr(server, "cl", types.SimpleNamespace(Message=dict))
+    monkeypatch.setattr(server, "run_sync", lambda coro: coro.close())
+    yield root
+    forget_index(str(root))
+
+
+def test_prefixed_branch_paths_hit_the_takeaway_cache(repo, monkeypatch):
+    explored = []
+
+    def process(self, instruction):
+        explored.append(instruction.name)
+        return [FileTrace(file_explored="app.py", takeaway="Prints hello.", file_path="demo/src/app.py")]
+
+    monkeypatch.setattr(BranchExplorer, "_process_instruction", process)
+    branch = Branch(name="app", description="The entry point", files=["demo/src/app.py"])
+
+    with BranchExplorer(str(repo)) as explorer:
+        first = explorer.submit(branch).result()
+    with BranchExplorer(str(repo)) as explorer:
+        second = explorer.submit(branch).result()
+
+    assert explored == ["app"]
+    assert [t.file_path for t in first.trace] == ["src/app.py"]
+    assert second.trace == first.trace
+
+
+def test_changed_files_miss_the_takeaway_cache(repo, monkeypatch):
+    explored = []
+
+    def process(self, instruction):
+        explored.append(instruction.name)
+        return [FileTrace(file_explored="app.py", takeaway="Prints.", file_path="src/app.py")]
+
+    monkeypatch.setattr(BranchExplorer, "_process_instruction", process)
+    branch = Branch(name="app", description="The entry point", files=["/demo/src/app.py"])
+
+    with BranchExplorer(str(repo)) as explorer:
+        explorer.submit(branch).result()
+    (repo / "src" / "app.py").write_text("print('goodbye')\n")
+    load_index(str(repo))
+    with BranchExplorer(str(repo)) as explorer:
+        explorer.submit(branch).result()
+
+    assert explored == ["app", "app"]
@@ -0,0 +1,45 @@
+import asyncio
+import types
+
+import pytest
+
+from backend.models.tools import code_search
+from backend.models.tools.code_search import search_code_async
+from backend.models.tools.file_traversal import set_current_path
+from backend.repo_index import RepoIndex
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    # No Chainlit session here: drop the progress messages
+    monkeypatch.setattr(code_search, "cl", types.SimpleNamespace(Message=dict, CustomElement=dict))
+
+    async def send_message(message):
+        pass
+
+    monkeypatch.setattr(code_search, "send_message", send_message)
+
+
+def test_an_empty_index_is_searched_instead_of_rebuilt(tmp_path, monkeypatch):
+    def load_index(*args):
+        raise AssertionError("the empty index was rebuilt")
+
+    monkeypatch.setattr(code_search, "load_index", load_index)
+    set_current_path(str(tmp_path), RepoIndex(str(tmp_path), "abc123", []))
+
+    assert asyncio.run(search_code_async("main")).startswith("No matches")
+
+
+def test_a_missing_index_is_built_at_the_workspace_commit(tmp_path, monkeypatch):
+    (tmp_path / "app.py").write_text("def main():\n    pass\n")
+    built = []
+
+    def load_index(root, commit=None):
+        built.append(commit)
+        return RepoIndex.build(root, commit)
+
+    monkeypatch.setattr(code_search, "load_index", load_index)
+    set_current_path(str(tmp_path), commit="abc123")
+
+    assert "app.py" in asyncio.run(search_code_async("main", mode="symbol"))
+    assert built == ["abc123"]
@@ -0,0 +1,23 @@
+from backend.models.tools.file_window import read_window
+
+
+def write_lines(tmp_path, count: int) -> str:
+    path = tmp_path / "lines.txt"
+    path.write_text("".join(f"line {i}\n" for i in range(1, count + 1)))
+    return str(path)
+
+
+def test_line_window(tmp_path):
+    result = read_window(write_lines(tmp_path, 10), start_line=3, end_line=4)
+    assert result == "[Lines 3-4 of 10]\nline 3\nline 4\n"
+
+
+def test_start_past_the_end(tmp_path):
+    result = read_window(write_lines(tmp_path, 10), start_line=20, end_line=25)
+    assert result == "[start_line=20 is past the end of the file (10 lines)]"
+
+
+def test_reversed_range_is_an_error(tmp_path):
+    result = read_window(write_lines(tmp_path, 10), start_line=5, end_line=2)
+    assert result.startswith("Error: start_line must be <= end_line")
+    assert "past the end" not in result
@@ -0,0 +1,62 @@
+from backend.repo_tree import IgnoreRules
+
+
+def rules(*lines: str, base: str = "") -> IgnoreRules:
+    ignore = IgnoreRules()
+    ignore.add_patterns(lines, base)
+    return ignore
+
+
+def test_unanchored_pattern_matches_at_any_depth():
+    ignore = rules("*.log")
+    assert ignore.is_ignored("debug.log", is_dir=False)
+    assert ignore.is_ignored("logs/today/debug.log", is_dir=False)
+    assert not ignore.is_ignored("debug.log.txt", is_dir=False)
+
+
+def test_leading_or_inner_slash_anchors_to_the_gitignore_directory():
+    ignore = rules("/todo.txt", "docs/build")
+    assert ignore.is_ignored("todo.txt", is_dir=False)
+    assert not ignore.is_ignored("src/todo.txt", is_dir=False)
+    assert ignore.is_ignored("docs/build", is_dir=True)
+    assert not ignore.is_ignored("src/docs/build", is_dir=True)
+
+
+def test_trailing_slash_only_matches_directories():
+    ignore = rules("out/")
+    assert ignore.is_ignored("out", is_dir=True)
+    assert ignore.is_ignored("src/out", is_dir=True)
+    assert not ignore.is_ignored("out", is_dir=False)
+
+
+def test_negation_reincludes_and_last_match_wins():
+    ignore = rules("*.env", "!example.env")
+    assert ignore.is_ignored("prod.env", is_dir=False)
+    assert not ignore.is_ignored("example.env", is_dir=False)
+
+    reignored = rules("*.env", "!example.env", "config/*.env")
+    assert reignored.is_ignored("config/example.env", is_dir=False)
+
+
+def test_double_star_and_character_classes():
+    ignore = rules("a/**/z.py", "file[0-9].txt", "data[!x].csv")
+    assert ignore.is_ignored("a/z.py", is_dir=False)
+    assert ignore.is_ignored("a/b/c/z.py", is_dir=False)
+    assert ignore.is_ignored("file7.txt", is_dir=False)
+    assert not ignore.is_ignored("filex.txt", is_dir=False)
+    assert ignore.is_ignored("data1.csv", is_dir=False)
+    assert not ignore.is_ignored("datax.csv", is_dir=False)
+
+
+def test_comments_blank_lines_and_escapes():
+    ignore = rules("# comment", "", "\\#notes.md", "\\!important")
+    assert not ignore.is_ignored("comment", is_dir=False)
+    assert ignore.is_ignored("#notes.md", is_dir=False)
+    assert ignore.is_ignored("!important", is_dir=False)
+
+
+def test_nested_gitignore_only_applies_below_its_directory():
+    ignore = rules("/generated", base="pkg")
+    assert ignore.is_ignored("pkg/generated", is_dir=True)
+    assert not ignore.is_ignored("generated", is_dir=True)
+    assert not ignore.is_ignored("pkg/sub/generated", is_dir=True)
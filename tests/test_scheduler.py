@@ -0,0 +1,127 @@
+import asyncio
+import types
+
+import pytest
+
+from backend.models import scheduler
+from backend.models.scheduler import BACKGROUND, INTERACTIVE, NORMAL, LLMScheduler
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A manual monotonic clock for the scheduler module."""
+    now = types.SimpleNamespace(value=0.0)
+    monkeypatch.setattr(scheduler, "time", types.SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def finish(llm: LLMScheduler, clock, seconds: float = 1.0, error: BaseException | None = None) -> None:
+    ticket = llm.acquire(level=NORMAL)
+    clock.value += seconds
+    llm.release(ticket, error=error)
+
+
+def test_fast_successes_grow_the_cap_by_about_one_per_round(clock):
+    llm = LLMScheduler(max_in_flight=16, initial_in_flight=4)
+    for _ in range(4):
+        finish(llm, clock)
+    assert 4.9 < llm.cap < 5.0
+
+
+def test_cap_never_exceeds_the_maximum(clock):
+    llm = LLMScheduler(max_in_flight=3, initial_in_flight=3)
+    for _ in range(10):
+        finish(llm, clock)
+    assert llm.cap == 3
+
+
+def test_slow_successes_do_not_grow_the_cap(clock):
+    llm = LLMScheduler(max_in_flight=16, initial_in_flight=4)
+    finish(llm, clock, seconds=scheduler.LLM_LATENCY_TARGET_SECONDS + 1)
+    assert llm.cap == 4
+    assert llm.completed == 1
+
+
+def test_rate_limit_halves_the_cap_once_per_cooldown(clock):
+    llm = LLMScheduler(max_in_flight=16, initial_in_flight=8)
+    # Right at clock zero, the first rate limit must still count
+    finish(llm, clock, seconds=0.0, error=RateLimited())
+    assert llm.cap == 4
+    # A burst of 429s inside the cooldown only halves once
+    finish(llm, clock, seconds=1.0, error=RateLimited())
+    assert llm.cap == 4
+    clock.value += scheduler._DECREASE_COOLDOWN_SECONDS
+    finish(llm, clock, seconds=0.0, error=RateLimited())
+    assert llm.cap == 2
+    assert llm.rate_limited == 3 and llm.failed == 3
+
+
+def test_cap_halves_down_to_one(clock):
+    llm = LLMScheduler(max_in_flight=16, initial_in_flight=2)
+    for _ in range(3):
+        finish(llm, clock, seconds=0.0, error=RateLimited())
+        clock.value += scheduler._DECREASE_COOLDOWN_SECONDS
+    assert llm.cap == 1
+
+
+def test_other_errors_and_cancellations_leave_the_cap(clock):
+    llm = LLMScheduler(max_in_flight=16, initial_in_flight=4)
+    finish(llm, clock, error=ValueError("bad request"))
+    finish(llm, clock, error=asyncio.CancelledError())
+    assert llm.cap == 4
+    assert llm.failed == 1 and llm.rate_limited == 0
+
+
+def test_waiters_are_admitted_by_priority_when_a_slot_frees(clock):
+    llm = LLMScheduler(max_in_flight=1, initial_in_flight=1)
+    running = llm.acquire(level=NORMAL)
+    background = llm._enqueue(0, BACKGROUND)
+    interactive = llm._enqueue(0, INTERACTIVE)
+    assert not background.done() and not interactive.done()
+
+    llm.release(running)
+    assert interactive.done() and not background.done()
+    assert llm.in_flight == 1
+
+
+def test_waiting_background_work_ages_past_newer_requests(clock):
+    llm = LLMScheduler(max_in_flight=1, initial_in_flight=1)
+    running = llm.acquire(level=NORMAL)
+    background = llm._enqueue(0, BACKGROUND)
+    clock.value += 3 * scheduler.LLM_PRIORITY_AGING_SECONDS
+    interactive = llm._enqueue(0, INTERACTIVE)
+
+    llm.release(running)
+    assert background.done() and not interactive.done()
+
+
+def test_token_budget_admits_one_request_into_an_idle_window(clock):
+    llm = LLMScheduler(max_in_flight=4, initial_in_flight=4, tokens_per_minute=1000)
+    first = llm.acquire(tokens=5000)
+    second = llm._enqueue(100, NORMAL)
+    try:
+        assert not second.done()
+        llm.release(first, tokens=5000)
+        assert not second.done()
+        clock.value += scheduler._TOKEN_WINDOW_SECONDS + 1
+        with llm._lock:
+            llm._dispatch()
+        assert second.done()
+    finally:
+        if llm._timer is not None:
+            llm._timer.cancel()
+
+
+def test_unknown_levels_run_as_the_nearest_known_one(clock):
+    llm = LLMScheduler(max_in_flight=1, initial_in_flight=1)
+    running = llm.acquire(level=-5)
+    waiting = llm._enqueue(0, 7)
+
+    llm.release(running)
+    assert waiting.done()
+    llm.release(waiting.result())
+    assert llm.stats()["completed"] == 2
@@ -0,0 +1,40 @@
+import types
+
+import pytest
+
+from backend import server
+from backend.repo_index import forget_index
+from backend.server import MULTI_AGENT, SINGLE_CALL, choose_strategy
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    root = tmp_path / "demo"
+    root.mkdir()
+    # Count tokens without tiktoken's encoding download
+    monkeypatch.setattr(server, "num_tokens_from_messages", lambda messages: len(messages[0]["content"]) // 4)
+    yield root
+    forget_index(str(root))
+
+
+def test_lockfiles_are_neither_sized_nor_packed(repo):
+    (repo / "main.py").write_text("print('hello')\n")
+    (repo / "pyproject.toml").write_text("[project]\nname = 'demo'\n")
+    lock = "x" * (server.FAST_PATH_MAX_TOKENS * 8)
+    for name in ("uv.lock", "package-lock.json", "yarn.lock"):
+        (repo / name).write_text(lock)
+    (repo / "web").mkdir()
+    (repo / "web" / "go.sum").write_text(lock)
+
+    strategy = choose_strategy(str(repo))
+
+    assert strategy.name == SINGLE_CALL
+    assert strategy.files == 2
+    assert "main.py" in strategy.packed_files
+    assert "uv.lock" not in strategy.packed_files and "go.sum" not in strategy.packed_files
+
+
+def test_large_source_files_still_take_the_multi_agent_path(repo):
+    (repo / "main.py").write_text("x = 1\n" * server.FAST_PATH_MAX_TOKENS)
+
+    assert choose_strategy(str(repo)).name == MULTI_AGENT
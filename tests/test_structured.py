@@ -0,0 +1,111 @@
+import json
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from backend.models.structured import JSONExtractor, extract_json, inline_schema, parse_partial_json, strict_schema
+
+
+class Step(BaseModel):
+    name: str
+    description: str
+
+
+class Plan(BaseModel):
+    title: str
+    steps: List[Step]
+    note: Optional[str] = None
+
+
+def test_partial_json_keeps_completed_fields_only():
+    assert parse_partial_json('{"title": "Deck", "summary": "half a sen') == {"title": "Deck"}
+    assert parse_partial_json('{"title": "Deck", "cou') == {"title": "Deck"}
+    assert parse_partial_json('{"title": "Deck", "count":') == {"title": "Deck"}
+
+
+def test_partial_json_waits_for_a_delimiter_after_numbers():
+    # "12" may still become "123"
+    assert parse_partial_json('{"count": 12') == {}
+    assert parse_partial_json('{"count": 12,') == {"count": 12}
+    assert parse_partial_json('[1, 2, 3') == [1, 2]
+
+
+def test_partial_json_shows_unfinished_containers_with_their_complete_items():
+    text = '{"steps": [{"name": "a", "description": "x"}, {"name": "b", "descr'
+    assert parse_partial_json(text) == {"steps": [{"name": "a", "description": "x"}]}
+    assert parse_partial_json('{"outer": {"inner": [true, null') == {"outer": {"inner": [True]}}
+
+
+def test_partial_json_handles_escapes_and_leading_prose():
+    assert parse_partial_json('Sure: {"quote": "say \\"hi\\" {not json}", "x": "') == {
+        "quote": 'say "hi" {not json}'
+    }
+
+
+def test_partial_json_of_a_complete_document_matches_json_loads():
+    document = {"a": [1, 2.5, -3e2, True, False, None], "b": {"c": "d\\n"}, "e": []}
+    assert parse_partial_json(json.dumps(document)) == document
+
+
+def test_partial_json_without_json_is_none():
+    assert parse_partial_json("no json here") is None
+    assert parse_partial_json("") is None
+
+
+def test_extract_json_from_a_code_fence():
+    text = 'Here is the plan:\n```json\n{"title": "Deck", "steps": []}\n```\nLet me know!'
+    assert json.loads(extract_json(text)) == {"title": "Deck", "steps": []}
+
+
+def test_extract_json_skips_balanced_prose_that_does_not_parse():
+    text = 'Replace {placeholder} with a value. Result: {"ok": true}'
+    assert extract_json(text) == '{"ok": true}'
+
+
+def test_extract_json_ignores_brackets_inside_strings():
+    text = 'Done. {"code": "if (x) { return [1]; }", "n": 1} trailing }'
+    assert json.loads(extract_json(text)) == {"code": "if (x) { return [1]; }", "n": 1}
+
+
+def test_extract_json_returns_arrays_and_none_without_json():
+    assert extract_json('Items: [1, {"a": 2}] and more') == '[1, {"a": 2}]'
+    assert extract_json("nothing to see") is None
+    assert extract_json('{"unterminated": "value"') is None
+
+
+def test_extractor_completes_across_chunks():
+    extractor = JSONExtractor()
+    chunks = ['```json\n{"na', 'me": "a {', ' b", "items": [1,', " 2]}", "\n```"]
+    results = [extractor.feed(chunk) for chunk in chunks]
+    assert results[:3] == [None, None, None]
+    assert json.loads(results[3]) == {"name": "a { b", "items": [1, 2]}
+    assert extractor.done and extractor.feed("{}") == results[3]
+
+
+def test_extractor_partial_is_the_json_so_far():
+    extractor = JSONExtractor()
+    extractor.feed('Sure! {"title": "De')
+    assert extractor.partial == '{"title": "De'
+
+
+def test_strict_schema_closes_every_object():
+    schema, strict = strict_schema(inline_schema(Plan.model_json_schema()))
+    assert schema["additionalProperties"] is False
+    assert schema["properties"]["steps"]["items"]["additionalProperties"] is False
+    # `note` has a default, so it is not required and strict mode is off
+    assert strict is False
+
+
+def test_strict_schema_is_strict_when_every_property_is_required():
+    schema, strict = strict_schema(inline_schema(Step.model_json_schema()))
+    assert strict is True
+    assert set(schema["required"]) == {"name", "description"}
+
+
+def test_inline_schema_replaces_refs_and_drops_titles():
+    schema = inline_schema(Plan.model_json_schema())
+    assert "$defs" not in schema and "title" not in schema
+    # A property that happens to be called "title" is kept
+    assert schema["properties"]["title"] == {"type": "string"}
+    step = schema["properties"]["steps"]["items"]
+    assert "$ref" not in step and step["properties"]["name"] == {"type": "string"}
@@ -0,0 +1,57 @@
+import pytest
+
+from backend import traces as traces_module
+from backend.traces import FileTrace, compact_traces
+
+
+class WordEncoding:
+    """One token per word, so budgets can be checked exactly without tiktoken's downloads."""
+
+    def encode(self, text: str, disallowed_special=()) -> list[str]:
+        return text.split()
+
+    def decode(self, tokens: list[str]) -> str:
+        return " ".join(tokens)
+
+
+@pytest.fixture(autouse=True)
+def word_encoding(monkeypatch):
+    monkeypatch.setattr(traces_module, "get_encoding", lambda model: WordEncoding())
+
+
+def trace(name: str, words: int) -> FileTrace:
+    return FileTrace(file_explored=name, takeaway=" ".join(f"w{i}" for i in range(words)), file_path=name)
+
+
+def lengths(traces) -> list[int]:
+    return [len(t.takeaway.removesuffix("...").split()) for t in traces]
+
+
+def test_traces_within_budget_are_returned_unchanged():
+    traces = [trace("a.py", 10), trace("b.py", 20)]
+    assert compact_traces(traces, budget=30) is traces
+
+
+def test_short_takeaways_are_kept_and_long_ones_share_the_rest():
+    traces = [trace("short.py", 10), trace("long.py", 400), trace("longer.py", 800)]
+    compacted = compact_traces(traces, budget=210)
+
+    assert compacted[0] == traces[0]
+    assert lengths(compacted) == [10, 100, 100]
+    assert all(t.takeaway.endswith("...") for t in compacted[1:])
+    assert [t.file_path for t in compacted] == ["short.py", "long.py", "longer.py"]
+
+
+def test_cap_is_the_largest_that_fits_the_budget():
+    traces = [trace(f"{i}.py", n) for i, n in enumerate([5, 30, 60, 90, 120])]
+    compacted = compact_traces(traces, budget=200)
+    # 5 and 30 fit whole; the remaining 165 tokens split three ways
+    assert lengths(compacted) == [5, 30, 55, 55, 55]
+    assert sum(lengths(compacted)) <= 200
+
+
+def test_input_traces_are_not_modified():
+    traces = [trace("a.py", 300), trace("b.py", 300)]
+    before = [t.takeaway for t in traces]
+    compact_traces(traces, budget=50)
+    assert [t.takeaway for t in traces] == before